@@ -22,7 +22,7 @@ login_manager = LoginManager()
 def _set_sqlite_pragmas(dbapi_conn, connection_record):
     """On every SQLite connection: enable WAL and a generous busy timeout.
 
-    The app runs one gunicorn worker with 4 gthread threads plus background send
+    The app runs one gunicorn worker with 8 gthread threads plus background send
     threads (auto/manual reminders), all hitting one SQLite file on a Fly volume.
     The default `delete` journal makes a writer block all readers (and vice
     versa) — under that concurrency, and given the historical 'database is locked'
@@ -205,8 +205,13 @@ def _send_balance_reminders(app):
             logger.exception("Auto-reminder background send failed")
 
 
-def create_app(config_name=None):
-    """Application factory function."""
+def create_app(config_name=None, startup_jobs=True):
+    """Application factory function.
+
+    `startup_jobs=False` skips the boot-time recurring-charge and auto-reminder
+    runs — for a second process on the same DB (the RFID daemon), which must
+    not race the web process to bill or text families.
+    """
     if config_name is None:
         config_name = os.environ.get('FLASK_ENV', 'development')
 
@@ -300,15 +305,16 @@ def create_app(config_name=None):
 
         # Both run on every boot (Fly wakes/sleeps several times a day). Never let
         # a single bad row take the whole app down at startup — log and continue.
-        try:
-            _process_recurring_charges()
-        except Exception:
-            db.session.rollback()
-            logger.exception("Recurring-charge processing failed at startup")
-        try:
-            _process_auto_reminders()
-        except Exception:
-            logger.exception("Auto-reminder processing failed at startup")
+        if startup_jobs:
+            try:
+                _process_recurring_charges()
+            except Exception:
+                db.session.rollback()
+                logger.exception("Recurring-charge processing failed at startup")
+            try:
+                _process_auto_reminders()
+            except Exception:
+                logger.exception("Auto-reminder processing failed at startup")
 
     @app.before_request
     def _enforce_active_user():
@@ -0,0 +1,127 @@
+"""Nightly A/R aging snapshots.
+
+The aging report allocated every owing student's payments to their charges
+on each page load, and kept no history, so "is A/R getting better?" had no
+answer. The snapshot job (cron endpoint, or the CLI below) stores each owing
+student's buckets for the day in aging_snapshots plus the studio totals in
+aging_snapshot_totals. The report serves the latest day (with its age, and a
+recompute-now button), and the totals make the trend chart.
+
+Each snapshot records the ledger version it was computed at. Triggers on
+`transactions` bump that version on every insert, update and delete (any
+column: a re-dated charge moves buckets without moving the total), so a
+snapshot is current exactly while the version still matches.
+
+    python -m app.aging snapshot   # what the cron endpoint runs
+"""
+
+import argparse
+import logging
+from datetime import date, datetime
+
+import sqlalchemy
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import db
+from app.helpers import aging_by_student
+from app.models import AgingSnapshot, AgingSnapshotTotal, LedgerVersion
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = ('current', 'd31_60', 'd61_90', 'd90_plus', 'total')
+
+_BUMP = 'UPDATE ledger_version SET version = version + 1 WHERE id = 1;'
+LEDGER_TRIGGERS = {
+    'trg_ledger_version_insert': f'AFTER INSERT ON transactions BEGIN {_BUMP} END',
+    'trg_ledger_version_update': f'AFTER UPDATE ON transactions BEGIN {_BUMP} END',
+    'trg_ledger_version_delete': f'AFTER DELETE ON transactions BEGIN {_BUMP} END',
+}
+
+
+def install_triggers(conn):
+    """Create the ledger_version row and any missing trigger. If a trigger was
+    missing, writes may have gone uncounted, so the version is bumped once to
+    retire every existing snapshot."""
+    from app.balances import install_triggers as install
+    conn.execute(sqlalchemy.text(
+        'INSERT OR IGNORE INTO ledger_version (id, version) VALUES (1, 0)'))
+    if install(conn, LEDGER_TRIGGERS):
+        conn.execute(sqlalchemy.text(_BUMP))
+
+
+def ledger_version() -> int:
+    return db.session.query(LedgerVersion.version).filter_by(id=1).scalar() or 0
+
+
+def take_snapshot(as_of: date | None = None) -> AgingSnapshotTotal:
+    """Compute aging as of `as_of` (default today) and store it, replacing
+    any snapshot already taken that day. Commits.
+
+    Returns the day's AgingSnapshotTotal.
+    """
+    as_of = as_of or date.today()
+    # Read before computing: a write landing in between leaves the snapshot
+    # marked older than it is (recomputed next time), never newer.
+    version = ledger_version()
+    aging = aging_by_student(as_of)
+    AgingSnapshot.query.filter_by(day=as_of).delete(synchronize_session=False)
+    if aging:
+        db.session.execute(AgingSnapshot.__table__.insert(), [
+            {'day': as_of, 'student_id': sid, **buckets} for sid, buckets in aging.items()])
+    totals = {k: round(sum(b[k] for b in aging.values()), 2) for k in BUCKETS}
+    values = {**totals, 'student_count': len(aging), 'computed_at': datetime.utcnow(),
+              'ledger_version': version}
+    # Upsert: two admins pressing "recompute" at once must not collide on the PK.
+    stmt = sqlite_insert(AgingSnapshotTotal).values(day=as_of, **values)
+    db.session.execute(stmt.on_conflict_do_update(index_elements=['day'], set_=values))
+    db.session.commit()
+    logger.info("A/R aging snapshot for %s: %d student(s), $%.2f outstanding",
+                as_of, len(aging), totals['total'])
+    return db.session.get(AgingSnapshotTotal, as_of, populate_existing=True)
+
+
+def latest_snapshot() -> AgingSnapshotTotal | None:
+    return AgingSnapshotTotal.query.order_by(AgingSnapshotTotal.day.desc()).first()
+
+
+def snapshot_rows(day: date) -> dict[int, dict]:
+    """{student_id: buckets} for a snapshot day, in aging_by_student's shape"""
+    return {r.student_id: {k: float(getattr(r, k)) for k in BUCKETS}
+            for r in AgingSnapshot.query.filter_by(day=day).all()}
+
+
+def is_stale(snapshot: AgingSnapshotTotal, today: date | None = None) -> bool:
+    """True if the snapshot is from an earlier day, or any transaction has
+    been written, edited or deleted since it was taken"""
+    if snapshot.day < (today or date.today()):
+        return True
+    return snapshot.ledger_version is None or snapshot.ledger_version != ledger_version()
+
+
+def trend(since: date) -> list[AgingSnapshotTotal]:
+    """Studio totals for every snapshot day from `since`, oldest first"""
+    return (AgingSnapshotTotal.query.filter(AgingSnapshotTotal.day >= since)
+            .order_by(AgingSnapshotTotal.day).all())
+
+
+def run_snapshot():
+    """Today's snapshot (cron endpoint / CLI)"""
+    return take_snapshot()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="A/R aging snapshots")
+    parser.add_argument('command', choices=('snapshot',))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    from app import create_app
+    app = create_app(startup_jobs=False)
+    with app.app_context():
+        if args.command == 'snapshot':
+            s = run_snapshot()
+            print(f"{s.day}: {s.student_count} student(s) owe ${s.total:.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -10,20 +10,24 @@ from datetime import date, datetime, timedelta
 
 from flask import current_app, jsonify, request, send_file, url_for
 from flask_login import current_user, login_required
-from sqlalchemy import desc, func, or_
+from sqlalchemy import case, desc, func, or_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 
 from app import db, square_service
 from app.api import bp
+from app.checkins import todays_checkins
+from app.events import PENDING_PAYMENT, REGISTRATION, event_hub, format_sse, queue_event
 from app.helpers import (
+    aging_by_student,
     allocate_family_payment,
     apply_student_fields,
     attendance_to_dict,
-    build_aging,
     build_ledger,
     calc_balance,
     calc_balance_bulk,
     class_to_dict,
+    enrollment_counts,
     recurring_to_dict,
     student_to_dict,
     transaction_to_dict,
@@ -64,6 +68,7 @@ from app.models import (
     Skill,
     SquareInvoice,
     Student,
+    StudentBalance,
     StudentSkill,
     TicketOrder,
     TicketType,
@@ -74,6 +79,10 @@ from app.models import (
     WaiverSignature,
     WaiverTemplate,
 )
+from app.pagination import InvalidCursor, cached_total, cursor_for, keyset_page
+from app.search import ranked as search_matches
+
+from rfid.ipc import RFIDClient, RFIDCommandError, RFIDUnavailable, ensure_event_bridge
 
 try:
     from rfid.service import get_rfid_service
@@ -83,6 +92,65 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 
+def _rfid_service():
+    """The RFID service the API should talk to. With RFID_SOCKET set the
+    readers belong to the standalone daemon (python -m rfid.daemon), so this
+    is a client for its control socket — an in-process RFIDService under
+    gunicorn would be a fresh, idle instance. Otherwise (dev server, tests)
+    it's the in-process one run.py started. None when RFID isn't installed."""
+    socket_path = current_app.config.get('RFID_SOCKET')
+    if socket_path:
+        return RFIDClient(socket_path)
+    return get_rfid_service() if get_rfid_service else None
+
+
+def _refresh_rfid_index(student_ids):
+    """After a commit that changes what a card resolves to (card assignment,
+    student status, enrollments), re-sync the RFID service's in-memory card
+    index so the next tap doesn't check in against stale data. Best-effort: a
+    failure here must never fail the request that already committed."""
+    service = _rfid_service()
+    if not service:
+        return
+    try:
+        service.refresh_students(student_ids)
+    except RFIDUnavailable as e:
+        # The daemon reloads its indexes when it (re)starts.
+        logger.warning("RFID card index refresh skipped: %s", e)
+    except Exception:
+        logger.exception("RFID card index refresh failed")
+
+
+def _reload_rfid_schedule():
+    """After a commit that creates, edits or cancels a class, rebuild the RFID
+    service's schedule index (which class a tap belongs to). Best-effort, like
+    _refresh_rfid_index."""
+    service = _rfid_service()
+    if not service:
+        return
+    try:
+        service.reload_schedule()
+    except RFIDUnavailable as e:
+        logger.warning("RFID schedule index reload skipped: %s", e)
+    except Exception:
+        logger.exception("RFID schedule index reload failed")
+
+
+def _rfid_attendance_removed(student_id, class_id, day):
+    """After a check-in is toggled off, tell the RFID daemon so its set of
+    today's check-ins lets the student's next tap through. In-process the
+    shared set's commit hook already did it. Best-effort, like
+    _refresh_rfid_index."""
+    if not current_app.config.get('RFID_SOCKET'):
+        return
+    try:
+        _rfid_service().attendance_removed(student_id, class_id, day)
+    except RFIDUnavailable as e:
+        logger.warning("RFID check-in removal not sent: %s", e)
+    except Exception:
+        logger.exception("RFID check-in removal failed")
+
+
 # ── Authorization helpers ───────────────────────────────────────────
 # Staff = admin/teacher (User.is_staff). Parents may only touch students
 # and families they are linked to via ParentStudent. These return a
@@ -261,6 +329,40 @@ def _parse_txn_date(raw):
         return None, (jsonify({'error': 'Invalid date — use YYYY-MM-DD'}), 400)
 
 
+def _list_page(query, key, per_page):
+    """One page of a newest-first list ordered by the `key` columns (the last
+    one unique). Returns (items, pagination, None) or (None, None, (json, status)).
+
+    `?cursor=` (empty for the first page) selects keyset pages: no OFFSET and
+    no COUNT(*), a `total` only with `?total=1` (cached briefly, see
+    app/pagination.py). Otherwise `?page=N` pages as before, plus a
+    `next_cursor` to continue from."""
+    if 'cursor' in request.args:
+        try:
+            items, next_cursor = keyset_page(query, key, per_page, request.args.get('cursor'))
+        except InvalidCursor:
+            return None, None, (jsonify({'error': 'Invalid cursor'}), 400)
+        pagination = {'per_page': per_page, 'next_cursor': next_cursor,
+                      'has_next': next_cursor is not None}
+        if request.args.get('total', '').lower() in ('1', 'true'):
+            filters = tuple(sorted((k, v) for k, v in request.args.items(multi=True)
+                                   if k not in ('cursor', 'total', 'page', 'per_page')))
+            pagination['total'] = cached_total((request.endpoint, filters), query)
+        return items, pagination, None
+    page = request.args.get('page', 1, type=int)
+    result = query.order_by(*[desc(c) for c in key]).paginate(
+        page=page, per_page=per_page, error_out=False)
+    return result.items, {
+        'page': page,
+        'pages': result.pages,
+        'per_page': per_page,
+        'total': result.total,
+        'has_next': result.has_next,
+        'has_prev': result.has_prev,
+        'next_cursor': cursor_for(result.items[-1], key) if result.has_next else None,
+    }, None
+
+
 # Endpoints a parent may invoke with a mutating method. EVERY other write is
 # staff-only. This is default-deny / fail-closed: a newly added write endpoint
 # is automatically parent-forbidden until explicitly allowlisted here. The
@@ -334,16 +436,20 @@ def get_students():
     search = request.args.get('search', '').strip()
     active_only = request.args.get('active', 'true').lower() == 'true'
 
-    query = Student.query
+    query = Student.query.options(joinedload(Student.family))
     if active_only:
         query = query.filter_by(is_active=True)
-    if search:
-        query = query.filter(
-            Student.first_name.contains(search)
-            | Student.last_name.contains(search)
-            | Student.email.contains(search)
-        )
-    query = query.order_by(Student.last_name, Student.first_name)
+    ranked = _ranked_search(query, Student, 'student', search) if search else None
+    if ranked is not None:
+        query = ranked.order_by(Student.last_name, Student.first_name)
+    else:
+        if search:
+            query = query.filter(
+                Student.first_name.contains(search)
+                | Student.last_name.contains(search)
+                | Student.email.contains(search)
+            )
+        query = query.order_by(Student.last_name, Student.first_name)
     pagination = query.paginate(page=page, per_page=per_page, error_out=False)
 
     return jsonify({
@@ -419,6 +525,7 @@ def update_student(student_id):
         apply_student_fields(student, data)
         student.updated_at = datetime.utcnow()
         db.session.commit()
+        _refresh_rfid_index([student_id])
         return jsonify(student_to_dict(student))
     except Exception:
         db.session.rollback()
@@ -446,6 +553,7 @@ def delete_student(student_id):
     WaitlistEntry.query.filter_by(student_id=student_id, status='waiting').update(
         {'status': 'removed'}, synchronize_session=False)
     db.session.commit()
+    _refresh_rfid_index([student_id])
     return jsonify({'message': 'Student deactivated successfully'})
 
 
@@ -470,6 +578,7 @@ def assign_rfid(student_id):
     student.rfid_assigned_by = current_user.id
     student.updated_at = datetime.utcnow()
     db.session.commit()
+    _refresh_rfid_index([student_id])
 
     return jsonify({'message': 'RFID card assigned successfully', 'student': student_to_dict(student)})
 
@@ -486,6 +595,7 @@ def remove_rfid(student_id):
     student.rfid_assigned_by = None
     student.updated_at = datetime.utcnow()
     db.session.commit()
+    _refresh_rfid_index([student_id])
     return jsonify({'message': 'RFID card removed successfully', 'student': student_to_dict(student)})
 
 
@@ -498,11 +608,13 @@ def get_classes():
     if err:
         return err
     active_only = request.args.get('active', 'true').lower() == 'true'
-    query = DanceClass.query
+    query = DanceClass.query.options(joinedload(DanceClass.location),
+                                     joinedload(DanceClass.instructor))
     if active_only:
         query = query.filter_by(is_active=True)
-    query = query.order_by(DanceClass.day_of_week, DanceClass.start_time)
-    return jsonify({'classes': [class_to_dict(cls) for cls in query.all()]})
+    classes = query.order_by(DanceClass.day_of_week, DanceClass.start_time).all()
+    counts = enrollment_counts([cls.id for cls in classes])
+    return jsonify({'classes': [class_to_dict(cls, counts[cls.id]) for cls in classes]})
 
 
 @bp.route('/instructors', methods=['GET'])
@@ -573,6 +685,7 @@ def create_class():
         )
         db.session.add(dance_class)
         db.session.commit()
+        _reload_rfid_schedule()
         return jsonify(class_to_dict(dance_class)), 201
     except Exception:
         db.session.rollback()
@@ -632,6 +745,7 @@ def update_class(class_id):
         dc.age_group = _clean_str(data.get('age_group')) or None
     try:
         db.session.commit()
+        _reload_rfid_schedule()
         return jsonify(class_to_dict(dc))
     except Exception:
         db.session.rollback()
@@ -655,6 +769,8 @@ def deactivate_class(class_id):
     from app.models import RecurringCharge, WaitlistEntry
     dc = DanceClass.query.get_or_404(class_id)
     dc.is_active = False
+    enrolled_ids = [sid for (sid,) in db.session.query(ClassEnrollment.student_id).filter_by(
+        class_id=class_id, is_active=True)]
     stopped = RecurringCharge.query.filter_by(class_id=class_id, is_active=True).update(
         {'is_active': False}, synchronize_session=False)
     ClassEnrollment.query.filter_by(class_id=class_id, is_active=True).update(
@@ -664,6 +780,8 @@ def deactivate_class(class_id):
     AuditLog.record(current_user.id, 'class.deactivate',
                     f'Cancelled class "{dc.name}" ({stopped} recurring charge(s) stopped)')
     db.session.commit()
+    _refresh_rfid_index(enrolled_ids)
+    _reload_rfid_schedule()
     return jsonify({'message': f'{dc.name} cancelled', 'recurring_charges_stopped': stopped})
 
 
@@ -723,6 +841,7 @@ def enroll_student(class_id):
     active_count = ClassEnrollment.query.filter_by(class_id=class_id, is_active=True).count()
 
     enrolled = []
+    enrolled_ids = []
     skipped = []
     full = []
     for raw in student_ids:
@@ -748,8 +867,10 @@ def enroll_student(class_id):
             db.session.add(ClassEnrollment(student_id=student.id, class_id=class_id))
         active_count += 1
         enrolled.append(student.full_name)
+        enrolled_ids.append(student.id)
 
     db.session.commit()
+    _refresh_rfid_index(enrolled_ids)
     msg = f'{len(enrolled)} student(s) enrolled in {dance_class.name}'
     if skipped:
         msg += f' ({len(skipped)} already enrolled)'
@@ -767,18 +888,32 @@ def unenroll_student(enrollment_id):
     enrollment = ClassEnrollment.query.get_or_404(enrollment_id)
     enrollment.is_active = False
     db.session.commit()
+    _refresh_rfid_index([enrollment.student_id])
     return jsonify({'message': 'Student unenrolled successfully'})
 
 
 # ── Global search (staff topbar) ────────────────────────────────────
 
+def _ranked_search(query, model, kind, q):
+    """`query` narrowed to the `model` rows whose search_index entry matches
+    `q`, best match first (callers add their tiebreak order). None when the
+    index can't serve `q` -- no FTS5, or no words in it -- and the caller
+    falls back to LIKE."""
+    hits = search_matches(kind, q)
+    if hits is None:
+        return None
+    return query.join(hits, hits.c.id == model.id).order_by(hits.c.rank)
+
+
 @bp.route('/search', methods=['GET'])
 @login_required
 def global_search():
     """Staff topbar search across active students, families, and classes.
 
-    Names are matched case-insensitively; each result links to that entity's
-    page. Staff-only — a parent must not be able to enumerate the roster.
+    Every word of the query is a case-insensitive prefix of a name, email or
+    phone (search_index, best bm25 match first); without FTS5, names are
+    matched as substrings. Each result links to that entity's page.
+    Staff-only — a parent must not be able to enumerate the roster.
     """
     if not current_user.is_staff:
         return jsonify({'error': 'Staff access required'}), 403
@@ -786,18 +921,25 @@ def global_search():
     if len(q) < 2:
         return jsonify({'students': [], 'families': [], 'classes': []})
     like = f'%{q}%'
-    students = Student.query.filter(
-        Student.is_active.is_(True),
-        or_(
+    students = Student.query.filter(Student.is_active.is_(True))
+    families = Family.query
+    classes = DanceClass.query.filter(DanceClass.is_active.is_(True))
+    ranked = _ranked_search(students, Student, 'student', q)
+    if ranked is not None:
+        students = ranked.order_by(Student.first_name, Student.last_name)
+        families = _ranked_search(families, Family, 'family', q).order_by(Family.name)
+        classes = _ranked_search(classes, DanceClass, 'class', q).order_by(DanceClass.name)
+    else:
+        students = students.filter(or_(
             Student.first_name.ilike(like),
             Student.last_name.ilike(like),
             (Student.first_name + ' ' + Student.last_name).ilike(like),
-        ),
-    ).order_by(Student.first_name, Student.last_name).limit(8).all()
-    families = Family.query.filter(Family.name.ilike(like)).order_by(Family.name).limit(8).all()
-    classes = DanceClass.query.filter(
-        DanceClass.is_active.is_(True), DanceClass.name.ilike(like)
-    ).order_by(DanceClass.name).limit(8).all()
+        )).order_by(Student.first_name, Student.last_name)
+        families = families.filter(Family.name.ilike(like)).order_by(Family.name)
+        classes = classes.filter(DanceClass.name.ilike(like)).order_by(DanceClass.name)
+    students = students.limit(8).all()
+    families = families.limit(8).all()
+    classes = classes.limit(8).all()
     return jsonify({
         'students': [{'id': s.id, 'name': s.full_name, 'url': f'/students/{s.id}/detail'}
                      for s in students],
@@ -831,15 +973,20 @@ def toggle_attendance():
 
     target_date = _parse_date(data.get('date')) or date.today()
 
-    existing = Attendance.query.filter(
-        Attendance.student_id == student_id,
-        Attendance.class_id == class_id,
-        func.date(Attendance.check_in_time) == target_date,
-    ).first()
+    # Today's answer comes from the in-memory set; the row is only fetched when
+    # there is one to delete.
+    existing = None
+    if todays_checkins.contains(student_id, class_id, target_date):
+        existing = Attendance.query.filter(
+            Attendance.student_id == student_id,
+            Attendance.class_id == class_id,
+            Attendance.attendance_date == target_date,
+        ).first()
 
     if existing:
         db.session.delete(existing)
         db.session.commit()
+        _rfid_attendance_removed(student_id, class_id, target_date)
         return jsonify({'present': False, 'message': 'Attendance removed'})
 
     att = Attendance(
@@ -853,11 +1000,22 @@ def toggle_attendance():
     try:
         db.session.commit()
     except IntegrityError:
-        # A concurrent double-tap raced us to the unique (student, class, day)
-        # index. The other request already marked them present — treat this as a
-        # no-op success rather than a 500 or a duplicate row.
+        # The unique (student, class, day) index says the row exists, though the
+        # check-in set missed it: a writer outside this process's ORM hooks (the
+        # RFID daemon, raw SQL, another worker) or a concurrent request. The
+        # student is present, so the toggle means "off": fetch and delete it.
         db.session.rollback()
-        return jsonify({'present': True, 'message': 'Already marked present'})
+        existing = Attendance.query.filter(
+            Attendance.student_id == student_id,
+            Attendance.class_id == class_id,
+            Attendance.attendance_date == target_date,
+        ).first()
+        if existing is None:
+            return jsonify({'error': 'Attendance changed concurrently — try again'}), 409
+        db.session.delete(existing)
+        db.session.commit()
+        _rfid_attendance_removed(student_id, class_id, target_date)
+        return jsonify({'present': False, 'message': 'Attendance removed'})
     return jsonify({'present': True, 'message': 'Marked present'}), 201
 
 
@@ -867,8 +1025,7 @@ def get_attendance():
     err = _staff_only()
     if err:
         return err
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 50, type=int), 100)
+    per_page = max(1, min(request.args.get('per_page', 50, type=int), 100))
     # _parse_date returns None on a garbage/absent value, so a bad ?date_from=abc
     # skips the filter instead of 500-ing on an uncaught strptime ValueError.
     date_from = _parse_date(request.args.get('date_from'))
@@ -876,28 +1033,24 @@ def get_attendance():
     class_id = request.args.get('class_id', type=int)
     student_id = request.args.get('student_id', type=int)
 
-    query = Attendance.query
+    query = Attendance.query.options(joinedload(Attendance.student),
+                                     joinedload(Attendance.dance_class))
     if date_from:
-        query = query.filter(func.date(Attendance.check_in_time) >= date_from)
+        query = query.filter(Attendance.attendance_date >= date_from)
     if date_to:
-        query = query.filter(func.date(Attendance.check_in_time) <= date_to)
+        query = query.filter(Attendance.attendance_date <= date_to)
     if class_id:
         query = query.filter_by(class_id=class_id)
     if student_id:
         query = query.filter_by(student_id=student_id)
-    query = query.order_by(desc(Attendance.check_in_time))
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    items, pagination, err = _list_page(
+        query, (Attendance.check_in_time, Attendance.id), per_page)
+    if err:
+        return err
 
     return jsonify({
-        'attendance': [attendance_to_dict(att) for att in pagination.items],
-        'pagination': {
-            'page': page,
-            'pages': pagination.pages,
-            'per_page': per_page,
-            'total': pagination.total,
-            'has_next': pagination.has_next,
-            'has_prev': pagination.has_prev,
-        },
+        'attendance': [attendance_to_dict(att) for att in items],
+        'pagination': pagination,
     })
 
 
@@ -909,7 +1062,9 @@ def get_todays_attendance():
         return err
     today = date.today()
     class_id = request.args.get('class_id', type=int)
-    query = Attendance.query.filter(func.date(Attendance.check_in_time) == today)
+    query = (Attendance.query.options(joinedload(Attendance.student),
+                                      joinedload(Attendance.dance_class))
+             .filter(Attendance.attendance_date == today))
     if class_id:
         query = query.filter_by(class_id=class_id)
     records = query.order_by(desc(Attendance.check_in_time)).all()
@@ -933,26 +1088,20 @@ def manual_checkin():
         return jsonify({'error': 'student_id and class_id are required'}), 400
 
     student = Student.query.get_or_404(student_id)
-    DanceClass.query.get_or_404(class_id)
+    dance_class = DanceClass.query.get_or_404(class_id)
 
-    today = date.today()
-    existing = Attendance.query.filter(
-        Attendance.student_id == student_id,
-        Attendance.class_id == class_id,
-        func.date(Attendance.check_in_time) == today,
-    ).first()
-    if existing:
+    if todays_checkins.contains(student.id, dance_class.id):
         return jsonify({'error': 'Student already checked in today'}), 400
 
     try:
         att = Attendance(
-            student_id=student_id,
-            class_id=class_id,
+            student_id=student.id,
+            class_id=dance_class.id,
             # Local time (the server runs in the studio's timezone). Must match the
-            # `date.today()` used above and everywhere else the app groups by day —
-            # `datetime.utcnow()` would date an evening check-in on the next UTC day,
-            # hiding it from today's roster and tripping the unique-day index. Same
-            # basis as toggle_attendance.
+            # `date.today()` the check-in set above is keyed on and everywhere else
+            # the app groups by day — `datetime.utcnow()` would date an evening
+            # check-in on the next UTC day, hiding it from today's roster and
+            # tripping the unique-day index. Same basis as toggle_attendance.
             check_in_time=datetime.now(),
             check_in_method='manual',
             notes=_clean_str(data.get('notes')) or None,
@@ -969,6 +1118,7 @@ def manual_checkin():
         # (student, class, day) index. They're already checked in — graceful
         # no-op, not a 500 (mirrors toggle_attendance).
         db.session.rollback()
+        todays_checkins.add(student.id, dance_class.id, date.today())
         return jsonify({'error': 'Student already checked in today'}), 400
     except Exception:
         db.session.rollback()
@@ -976,6 +1126,49 @@ def manual_checkin():
         return jsonify({'error': 'An internal error occurred'}), 500
 
 
+# ── Live staff events ───────────────────────────────────────────────
+
+@bp.route('/events/stream', methods=['GET'])
+@login_required
+def staff_event_stream():
+    """Server-Sent Events for staff pages: check-ins (RFID or manual), pending
+    payments, registrations and webhook-recorded payments, as they commit —
+    instead of polling the count endpoints. Teachers don't get the payment
+    events (billing is admin-only, like the badges).
+
+    Each open stream holds a gunicorn thread, so streams are capped
+    (EVENT_STREAM_MAX_CLIENTS) and end after EVENT_STREAM_MAX_SECONDS; the
+    browser's EventSource reconnects on its own. A comment line every
+    EVENT_STREAM_HEARTBEAT seconds keeps proxies from timing the stream out."""
+    from flask import Response
+    err = _staff_only()
+    if err:
+        return err
+    config = current_app.config
+    if config.get('RFID_SOCKET'):
+        # RFID check-ins commit in the daemon's process; relay them into ours.
+        ensure_event_bridge(config['RFID_SOCKET'], event_hub)
+    sub = event_hub.subscribe(admin=current_user.is_admin,
+                              limit=config.get('EVENT_STREAM_MAX_CLIENTS', 4))
+    if sub is None:
+        return jsonify({'error': 'Too many live connections; reload to refresh'}), 503
+    heartbeat = config.get('EVENT_STREAM_HEARTBEAT', 15)
+    lifetime = config.get('EVENT_STREAM_MAX_SECONDS', 300)
+
+    def generate():
+        deadline = time.monotonic() + lifetime
+        try:
+            yield 'retry: 3000\n\n'
+            while time.monotonic() < deadline:
+                evt = sub.get(timeout=min(heartbeat, max(deadline - time.monotonic(), 0)))
+                yield format_sse(evt) if evt else ': heartbeat\n\n'
+        finally:
+            event_hub.unsubscribe(sub)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 # ── RFID endpoints ──────────────────────────────────────────────────
 
 @bp.route('/rfid/status', methods=['GET'])
@@ -984,9 +1177,14 @@ def rfid_status():
     err = _staff_only()
     if err:
         return err
-    if not get_rfid_service:
+    service = _rfid_service()
+    if not service:
         return jsonify({'service_running': False, 'message': 'RFID not available'})
-    stats = get_rfid_service().get_stats()
+    try:
+        stats = service.get_stats()
+    except (RFIDUnavailable, RFIDCommandError) as e:
+        logger.warning("RFID status unavailable: %s", e)
+        return jsonify({'service_running': False, 'message': 'RFID service not reachable'})
     return jsonify({
         'service_running': stats['running'],
         'total_scans': stats['total_scans'],
@@ -994,9 +1192,38 @@ def rfid_status():
         'failed_scans': stats['failed_scans'],
         'last_scan_time': _utc_iso(stats['last_scan_time']),  # UTC -> 'Z' for correct local display
         'last_scan_uid': stats['last_scan_uid'],
+        'index_size': stats['index_size'],
+        'index_hits': stats['index_hits'],
+        'index_misses': stats['index_misses'],
+        'suppressed_scans': stats['suppressed_scans'],
+        'journal_pending': stats['journal_pending'],
+        'deferred_scans': stats['deferred_scans'],
+        'poll_interval': stats['poll_interval'],
+        'idle_wakeups_per_min': stats['idle_wakeups_per_min'],
+        'detect_latency': stats['detect_latency'],
+        'timings': stats['timings'],  # per-stage ms histograms: p50/p95/p99
+        'readers': [dict(r, last_scan_time=_utc_iso(r['last_scan_time']))
+                    for r in stats['readers']],
     })
 
 
+@bp.route('/rfid/status/reset', methods=['POST'])
+@login_required
+def reset_rfid_timings():
+    err = _admin_only()
+    if err:
+        return err
+    service = _rfid_service()
+    if not service:
+        return jsonify({'error': 'RFID not available'}), 400
+    try:
+        service.reset_timings()
+    except (RFIDUnavailable, RFIDCommandError) as e:
+        logger.warning("RFID timing reset failed: %s", e)
+        return jsonify({'error': 'RFID service not reachable'}), 503
+    return jsonify({'success': True})
+
+
 @bp.route('/rfid/simulate', methods=['POST'])
 @login_required
 def simulate_rfid_scan():
@@ -1006,9 +1233,20 @@ def simulate_rfid_scan():
     uid = data.get('uid') if data else None
     if not uid:
         return jsonify({'error': 'UID is required'}), 400
-    if not get_rfid_service:
+    service = _rfid_service()
+    if not service:
         return jsonify({'error': 'RFID not available'}), 400
-    success = get_rfid_service().simulate_scan(uid)
+    # Optional: simulate the tap on a reader bound to this location.
+    location_id = None
+    if data.get('location_id'):
+        location_id, lerr = _valid_id(data.get('location_id'))
+        if lerr:
+            return lerr
+    try:
+        success = service.simulate_scan(uid, location_id=location_id)
+    except (RFIDUnavailable, RFIDCommandError) as e:
+        logger.warning("RFID simulate failed: %s", e)
+        return jsonify({'error': 'RFID service not reachable'}), 503
     return jsonify({'success': success, 'message': f'Simulated scan for UID: {uid}'})
 
 
@@ -1020,10 +1258,11 @@ def get_rfid_logs():
         return err
     from app.models import RFIDLog
 
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 50, type=int), 100)
-    query = RFIDLog.query.order_by(desc(RFIDLog.scan_time))
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    per_page = max(1, min(request.args.get('per_page', 50, type=int), 100))
+    query = RFIDLog.query.options(joinedload(RFIDLog.student))
+    items, pagination, err = _list_page(query, (RFIDLog.scan_time, RFIDLog.id), per_page)
+    if err:
+        return err
 
     logs = [{
         'id': log.id,
@@ -1034,19 +1273,9 @@ def get_rfid_logs():
         'action_taken': log.action_taken,
         'success': log.success,
         'error_message': log.error_message,
-    } for log in pagination.items]
+    } for log in items]
 
-    return jsonify({
-        'logs': logs,
-        'pagination': {
-            'page': page,
-            'pages': pagination.pages,
-            'per_page': per_page,
-            'total': pagination.total,
-            'has_next': pagination.has_next,
-            'has_prev': pagination.has_prev,
-        },
-    })
+    return jsonify({'logs': logs, 'pagination': pagination})
 
 
 # ── Dashboard stats ─────────────────────────────────────────────────
@@ -1057,22 +1286,22 @@ def dashboard_stats():
     err = _staff_only()
     if err:
         return err
-    from app.models import RFIDLog
+    from app.rfid_rollup import daily_counts
 
     today = date.today()
     total_students = Student.query.filter_by(is_active=True).count()
     total_classes = DanceClass.query.filter_by(is_active=True).count()
     todays_attendance = Attendance.query.filter(
-        func.date(Attendance.check_in_time) == today
+        Attendance.attendance_date == today
     ).count()
     week_start = today - timedelta(days=today.weekday())
     week_attendance = Attendance.query.filter(
-        func.date(Attendance.check_in_time) >= week_start
-    ).count()
-    recent_rfid_logs = RFIDLog.query.filter(
-        # Local: scan_time is stored studio-local, so the cutoff must be too.
-        RFIDLog.scan_time >= datetime.now() - timedelta(days=1)
+        Attendance.attendance_date >= week_start
     ).count()
+    # From the daily rollup (a few rows), not a scan of rfid_logs; raw rows
+    # past the retention window are gone anyway. Studio-local calendar day.
+    rfid_today = daily_counts(today)
+    recent_rfid_logs = sum(c['success'] + c['fail'] for c in rfid_today.values())
 
     return jsonify({
         'total_students': total_students,
@@ -1080,6 +1309,7 @@ def dashboard_stats():
         'todays_attendance': todays_attendance,
         'week_attendance': week_attendance,
         'recent_rfid_activity': recent_rfid_logs,
+        'rfid_today': rfid_today,
         'date': today.isoformat(),
     })
 
@@ -1096,27 +1326,24 @@ def get_transactions():
     err = _admin_only()
     if err:
         return err
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 50, type=int), 100)
+    per_page = max(1, min(request.args.get('per_page', 50, type=int), 100))
     student_id = request.args.get('student_id', type=int)
     category = request.args.get('category', '').strip()
 
-    query = Transaction.query
+    query = Transaction.query.options(joinedload(Transaction.student),
+                                      joinedload(Transaction.creator))
     if student_id:
         query = query.filter_by(student_id=student_id)
     if category:
         query = query.filter_by(category=category)
-    query = query.order_by(desc(Transaction.transaction_date), desc(Transaction.created_at))
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    items, pagination, err = _list_page(
+        query, (Transaction.transaction_date, Transaction.created_at, Transaction.id), per_page)
+    if err:
+        return err
 
     return jsonify({
-        'transactions': [transaction_to_dict(t) for t in pagination.items],
-        'pagination': {
-            'page': page,
-            'pages': pagination.pages,
-            'per_page': per_page,
-            'total': pagination.total,
-        },
+        'transactions': [transaction_to_dict(t) for t in items],
+        'pagination': pagination,
     })
 
 
@@ -1210,34 +1437,44 @@ def get_balances():
     return jsonify({'balances': balances})
 
 
-def _compute_aging():
+def _aging_snapshot(recompute=False):
+    """The aging numbers to report: the latest snapshot while it's still
+    current (today's, no ledger change since). Otherwise they are computed
+    live for this response only -- a GET never writes; the nightly job and
+    the recompute POST (`recompute=True`, which takes one now) store them.
+    Returns (aging by student, as-of date, freshness for the response)."""
+    from app.aging import is_stale, latest_snapshot, snapshot_rows, take_snapshot
+    if recompute:
+        snapshot = take_snapshot()
+    else:
+        snapshot = latest_snapshot()
+        if snapshot is None or is_stale(snapshot):
+            return aging_by_student(), date.today(), {
+                'computed_at': datetime.utcnow().isoformat(), 'recomputed': True, 'stored': False}
+    return snapshot_rows(snapshot.day), snapshot.day, {
+        'computed_at': snapshot.computed_at.isoformat(), 'recomputed': recompute, 'stored': True}
+
+
+def _compute_aging(aging=None, as_of=None):
     """Shared A/R aging computation for both the JSON report and the CSV export
     so the two can never drift. Returns (rows, totals, as_of): per-student unpaid
     balance bucketed by how overdue each charge is (0-30 / 31-60 / 61-90 / 90+),
-    owe-most first, amounts as 2dp strings."""
-    students = Student.query.filter_by(is_active=True).all()
-    # Include WITHDRAWN students who still owe: a deactivated student's unpaid
-    # balance must stay visible so the studio can collect it, not silently vanish
-    # from A/R. Only pull inactive students who actually have a balance (one bulk
-    # query) so long-settled withdrawals don't bloat the report.
-    inactive = Student.query.filter_by(is_active=False).all()
-    if inactive:
-        inactive_bals = calc_balance_bulk([s.id for s in inactive])
-        students += [s for s in inactive
-                     if inactive_bals.get(s.id, {}).get('balance', 0) > 0]
-    sid_ids = [s.id for s in students]
-    # One query for all transactions, grouped in memory (hundreds of rows).
-    txns_by_student: dict[int, list] = {sid: [] for sid in sid_ids}
-    if sid_ids:
-        for t in Transaction.query.filter(Transaction.student_id.in_(sid_ids)).all():
-            txns_by_student[t.student_id].append(t)
+    owe-most first, amounts as 2dp strings. `aging` (aging_by_student's shape,
+    e.g. from a snapshot) is computed live as of today if not given."""
+    # Only students who owe come back. That includes WITHDRAWN students: a
+    # deactivated student's unpaid balance must stay visible so the studio can
+    # collect it, not silently vanish from A/R.
+    if aging is None:
+        aging = aging_by_student()
+    students = (Student.query.filter(Student.id.in_(list(aging)))
+                .options(joinedload(Student.family)).all() if aging else [])
+    # Active students first, then withdrawn, so equal totals keep their order.
+    students.sort(key=lambda s: (not s.is_active, s.id))
 
     rows = []
     totals = {'current': 0.0, 'd31_60': 0.0, 'd61_90': 0.0, 'd90_plus': 0.0, 'total': 0.0}
     for s in students:
-        ag = build_aging(txns_by_student[s.id])
-        if ag['total'] <= 0:
-            continue  # only show entities that actually owe
+        ag = aging[s.id]
         for k in totals:
             totals[k] = round(totals[k] + ag[k], 2)
         rows.append({
@@ -1249,26 +1486,63 @@ def _compute_aging():
         })
     # Owe-most first.
     rows.sort(key=lambda r: float(r['total']), reverse=True)
-    return rows, totals, date.today().isoformat()
+    return rows, totals, (as_of or date.today()).isoformat()
 
 
-@bp.route('/reports/aging', methods=['GET'])
-@login_required
-def aging_report():
-    """Accounts-receivable aging (JSON). Admin-only — it exposes every family's
-    debt, and the nav gates it behind is_admin."""
-    err = _admin_only()
-    if err:
-        return err
-    rows, totals, as_of = _compute_aging()
+def _aging_response(recompute=False):
+    aging, as_of, freshness = _aging_snapshot(recompute)
+    rows, totals, as_of = _compute_aging(aging, as_of)
     return jsonify({
         'rows': rows,
         'totals': {k: f'{totals[k]:.2f}' for k in totals},
         'as_of': as_of,
         'count': len(rows),
+        # Freshness: when the numbers were computed, whether this request
+        # computed them, and whether they are a stored snapshot.
+        'snapshot': freshness,
     })
 
 
+@bp.route('/reports/aging', methods=['GET'])
+@login_required
+def aging_report():
+    """Accounts-receivable aging (JSON), from the latest nightly snapshot.
+    Admin-only — it exposes every family's debt, and the nav gates it behind
+    is_admin."""
+    err = _admin_only()
+    if err:
+        return err
+    return _aging_response()
+
+
+@bp.route('/reports/aging/recompute', methods=['POST'])
+@login_required
+def recompute_aging():
+    """Take a new aging snapshot now and return the report from it"""
+    err = _admin_only()
+    if err:
+        return err
+    return _aging_response(recompute=True)
+
+
+@bp.route('/reports/aging/trend', methods=['GET'])
+@login_required
+def aging_trend():
+    """Studio-wide aging bucket totals per snapshot day, oldest first, for the
+    trend chart. ?days= (default 180, max 1095) sets how far back."""
+    err = _admin_only()
+    if err:
+        return err
+    from app.aging import trend
+    days = min(max(request.args.get('days', 180, type=int), 1), 1095)
+    points = trend(date.today() - timedelta(days=days - 1))
+    return jsonify({'points': [{
+        'day': p.day.isoformat(),
+        **{k: f'{getattr(p, k):.2f}' for k in ('current', 'd31_60', 'd61_90', 'd90_plus', 'total')},
+        'students': p.student_count,
+    } for p in points]})
+
+
 def _csv_safe(value):
     """Neutralize CSV/formula injection. Excel/Sheets execute a cell that starts
     with = + @ (or a control char) as a formula — and some of this data (student
@@ -1367,7 +1641,8 @@ def export_aging_csv():
     err = _admin_only()
     if err:
         return err
-    rows, totals, as_of = _compute_aging()
+    aging, as_of, _ = _aging_snapshot()
+    rows, totals, as_of = _compute_aging(aging, as_of)
     header = ['Student', 'Family', 'Status', 'Current (0-30)', '31-60', '61-90', '90+', 'Total']
     body = [[
         r['student_name'], r['family_name'] or '',
@@ -1458,51 +1733,69 @@ def _month_buckets(n):
 @bp.route('/reports/revenue', methods=['GET'])
 @login_required
 def revenue_report():
-    """Money report for the owner: charged vs collected by month, collected by
-    category this year, and headline totals. Admin-only — aggregate studio
-    financials; the nav gates it behind is_admin."""
+    """Money report for the owner: charged vs collected by month (?months=,
+    default 12, up to 120) and by year, collected by category this year, and
+    headline totals. Admin-only — aggregate studio financials; the nav gates
+    it behind is_admin.
+
+    Two reads whatever the window: the revenue_monthly rollup (a few dozen
+    rows a year, kept by triggers; see app/revenue.py) and active students'
+    materialized balances."""
+    from app.revenue import monthly_totals
     err = _admin_only()
     if err:
         return err
+    months = min(max(request.args.get('months', 12, type=int), 1), 120)
 
-    def _sum(type_, start=None, end=None):
-        q = db.session.query(func.coalesce(func.sum(Transaction.amount), 0)).filter(
-            Transaction.type == type_)
-        if start is not None:
-            q = q.filter(Transaction.transaction_date >= start)
-        if end is not None:
-            q = q.filter(Transaction.transaction_date < end)
-        return float(q.scalar() or 0)
-
-    monthly = [{
-        'month': label,
-        'charged': round(_sum('charge', ms, me), 2),
-        'collected': round(_sum('payment', ms, me), 2),
-    } for label, ms, me in _month_buckets(12)]
-
-    year_start = date.today().replace(month=1, day=1)
-    cat_rows = (db.session.query(Transaction.category, func.sum(Transaction.amount))
-                .filter(Transaction.type == 'payment', Transaction.transaction_date >= year_start)
-                .group_by(Transaction.category).all())
+    today = date.today()
+    this_month, this_year = today.strftime('%Y-%m'), today.strftime('%Y')
+    by_month, by_year, categories = {}, {}, {}
+    collected = {'this_month': 0.0, 'this_year': 0.0, 'all_time': 0.0}
+    for month, type_, category, amount in monthly_totals():
+        key = 'charged' if type_ == 'charge' else 'collected' if type_ == 'payment' else None
+        if key is None:
+            continue
+        for bucket in (by_month.setdefault(month, {}), by_year.setdefault(month[:4], {})):
+            bucket[key] = bucket.get(key, 0.0) + amount
+        if key == 'collected':
+            collected['all_time'] += amount
+            # ">=" as before: post-dated payments count toward the current period.
+            if month[:4] >= this_year:
+                collected['this_year'] += amount
+                categories[category] = categories.get(category, 0.0) + amount
+            if month >= this_month:
+                collected['this_month'] += amount
+
+    monthly = []
+    for label, ms, _ in _month_buckets(months):
+        sums = by_month.get(ms.strftime('%Y-%m'), {})
+        monthly.append({'month': label, 'charged': round(sums.get('charged', 0.0), 2),
+                        'collected': round(sums.get('collected', 0.0), 2)})
+    yearly = [{'year': int(year), 'charged': round(sums.get('charged', 0.0), 2),
+               'collected': round(sums.get('collected', 0.0), 2)}
+              for year, sums in sorted(by_year.items())]
     by_category = sorted(
-        [{'category': c or 'uncategorized', 'amount': round(float(a or 0), 2)} for c, a in cat_rows],
+        [{'category': c or 'uncategorized', 'amount': round(a, 2)} for c, a in categories.items()],
         key=lambda x: x['amount'], reverse=True)
 
-    students = Student.query.filter_by(is_active=True).all()
-    bals = calc_balance_bulk([s.id for s in students])
-    outstanding = round(sum(b['balance'] for b in bals.values() if b['balance'] > 0), 2)
-    month_start = date.today().replace(day=1)
+    active_students, outstanding = (
+        db.session.query(func.count(Student.id),
+                         func.sum(case((StudentBalance.balance > 0, StudentBalance.balance),
+                                       else_=0)))
+        .outerjoin(StudentBalance, StudentBalance.student_id == Student.id)
+        .filter(Student.is_active.is_(True)).one())
 
     return jsonify({
         'monthly': monthly,
+        'yearly': yearly,
         'by_category': by_category,
         'totals': {
-            'collected_this_month': round(_sum('payment', month_start), 2),
-            'collected_this_year': round(_sum('payment', year_start), 2),
-            'collected_all_time': round(_sum('payment'), 2),
-            'outstanding': outstanding,
+            'collected_this_month': round(collected['this_month'], 2),
+            'collected_this_year': round(collected['this_year'], 2),
+            'collected_all_time': round(collected['all_time'], 2),
+            'outstanding': round(float(outstanding or 0), 2),
         },
-        'active_students': len(students),
+        'active_students': active_students,
     })
 
 
@@ -2188,13 +2481,16 @@ def get_families():
         return err
     families = Family.query.filter_by(is_active=True).order_by(Family.name).all()
 
-    # Collect all student IDs across all families
-    family_students: dict[int, list] = {}
+    # Every family's active students in one query (Family.students is dynamic,
+    # so it can't be eager-loaded).
+    family_students: dict[int, list] = {f.id: [] for f in families}
     all_student_ids: list[int] = []
-    for f in families:
-        students = f.students.filter_by(is_active=True).all()
-        family_students[f.id] = students
-        all_student_ids.extend(s.id for s in students)
+    if families:
+        for s in (Student.query.filter(Student.family_id.in_(list(family_students)),
+                                       Student.is_active.is_(True))
+                  .order_by(Student.id).all()):
+            family_students[s.family_id].append(s)
+            all_student_ids.append(s.id)
 
     # Single bulk balance query
     balances_map = calc_balance_bulk(all_student_ids)
@@ -2756,19 +3052,30 @@ def get_payment_options():
 @bp.route('/audit-log', methods=['GET'])
 @login_required
 def get_audit_log():
-    """Recent audit entries (admin only)."""
+    """Recent audit entries (admin only). `?limit=` returns the newest N;
+    `?cursor=` pages further back (see _list_page)."""
     err = _admin_only()
     if err:
         return err
-    limit = min(request.args.get('limit', 50, type=int), 200)
-    rows = AuditLog.query.order_by(desc(AuditLog.created_at)).limit(limit).all()
-    return jsonify({'entries': [{
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    query = AuditLog.query.options(joinedload(AuditLog.user))
+    if 'cursor' in request.args:
+        rows, pagination, err = _list_page(query, (AuditLog.created_at, AuditLog.id), limit)
+        if err:
+            return err
+    else:
+        rows = query.order_by(desc(AuditLog.created_at), desc(AuditLog.id)).limit(limit).all()
+        pagination = None
+    out = {'entries': [{
         'id': r.id,
         'action': r.action,
         'detail': r.detail,
         'user': r.user.full_name if r.user else 'System',
         'created_at': _utc_iso(r.created_at),
-    } for r in rows]})
+    } for r in rows]}
+    if pagination:
+        out['pagination'] = pagination
+    return jsonify(out)
 
 
 # ── Pending payment (reconciliation) endpoints ──────────────────────
@@ -2996,6 +3303,8 @@ def confirm_pending_payment(pid):
     if not claimed:
         db.session.rollback()
         return jsonify({'error': 'Already processed'}), 400
+    queue_event(db.session, PENDING_PAYMENT, {'id': p.id, 'status': 'confirmed',
+                                              'amount': float(p.amount)}, admin_only=True)
 
     AuditLog.record(current_user.id, 'payment.confirm',
                     f'Confirmed ${amount:.2f} {method_label} for {who}')
@@ -3202,8 +3511,7 @@ def square_webhook():
     # otherwise forge a "PAID" event and credit an account. Return 200 so Square
     # doesn't retry; the studio must set the signature key to enable auto-reconcile
     # (until then, Square payments are reconciled manually via /pending-payments).
-    from app.crypto import decrypt
-    sig_key = decrypt(Setting.get('payments_square_webhook_signature_key', ''))
+    sig_key = Setting.get_secret('payments_square_webhook_signature_key')
     if not sig_key:
         logger.warning("Square webhook received but no signature key configured — not auto-recording")
         return jsonify({'status': 'unverified_ignored'}), 200
@@ -4308,8 +4616,8 @@ def test_sms_connection():
 
 @bp.route('/cron/run', methods=['POST'])
 def cron_run():
-    """Token-protected endpoint for external schedulers to run recurring charges
-    and auto-reminders. Token from Setting 'cron_token' or env CRON_TOKEN."""
+    """Token-protected endpoint for external schedulers to run recurring charges,
+    auto-reminders, RFID log retention and the A/R aging snapshot. Token from Setting 'cron_token' or env CRON_TOKEN."""
     token = Setting.get('cron_token', '') or current_app.config.get('CRON_TOKEN') or os.environ.get('CRON_TOKEN', '')
     provided = request.args.get('token') or request.headers.get('X-Cron-Token', '')
     # Constant-time compare to avoid leaking the token via response timing; an
@@ -4317,9 +4625,13 @@ def cron_run():
     if not token or not secrets.compare_digest(str(provided), str(token)):
         return jsonify({'error': 'Invalid or missing cron token'}), 403
     from app import _process_auto_reminders, _process_recurring_charges
+    from app.aging import run_snapshot
+    from app.rfid_rollup import run_retention
     ran = []
     for name, fn in (('recurring_charges', _process_recurring_charges),
-                     ('auto_reminders', _process_auto_reminders)):
+                     ('auto_reminders', _process_auto_reminders),
+                     ('rfid_log_retention', run_retention),
+                     ('aging_snapshot', run_snapshot)):
         try:
             fn()
             ran.append(name)
@@ -4724,15 +5036,15 @@ def list_registrations():
         return err
     import json
     status = request.args.get('status', 'pending').strip()
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 50, type=int), 100)
+    per_page = max(1, min(request.args.get('per_page', 50, type=int), 100))
     q = Registration.query
     if status and status != 'all':
         q = q.filter_by(status=status)
-    pagination = (q.order_by(desc(Registration.created_at))
-                  .paginate(page=page, per_page=per_page, error_out=False))
+    items, pagination, err = _list_page(q, (Registration.created_at, Registration.id), per_page)
+    if err:
+        return err
     out = []
-    for r in pagination.items:
+    for r in items:
         try:
             students = json.loads(r.students_json or '[]')
         except ValueError:
@@ -4751,13 +5063,7 @@ def list_registrations():
             'returning': m_fam is not None or bool(m_students),
             'matched_family': m_fam.name if m_fam else None,
         })
-    return jsonify({
-        'registrations': out,
-        'pagination': {
-            'page': page, 'pages': pagination.pages,
-            'per_page': per_page, 'total': pagination.total,
-        },
-    })
+    return jsonify({'registrations': out, 'pagination': pagination})
 
 
 def _match_registration_family(parent_email):
@@ -4946,9 +5252,12 @@ def approve_registration(rid):
     if not claimed:
         db.session.rollback()
         return jsonify({'error': 'Already processed'}), 400
+    queue_event(db.session, REGISTRATION, {'id': rid, 'status': 'approved'})
     AuditLog.record(current_user.id, 'registration.approve',
                     f'Approved {reg.parent_name}: {", ".join(created)}')
     db.session.commit()
+    # Returning dancers may already carry a card; new ones can't yet.
+    _refresh_rfid_index([st.id for st in existing_by_name.values()])
     msg = f'Created {len(created)} dancer(s) under {fam.name}'
     if matched_existing:
         msg += ' (matched the existing family by parent email — no duplicate family created)'
@@ -5047,6 +5356,7 @@ def promote_waitlist(wid):
     AuditLog.record(current_user.id, 'waitlist.promote',
                     f'Enrolled {w.student.full_name} from waitlist into {w.dance_class.name}')
     db.session.commit()
+    _refresh_rfid_index([w.student_id])
     return jsonify({'message': f'{w.student.full_name} enrolled in {w.dance_class.name}'})
 
 
@@ -5505,8 +5815,8 @@ def analytics_retention():
         month = (month_start.month - 1 - i) % 12 + 1
         ms = date(year, month, 1)
         me = date(year + (month // 12), (month % 12) + 1, 1)
-        count = Attendance.query.filter(func.date(Attendance.check_in_time) >= ms,
-                                        func.date(Attendance.check_in_time) < me).count()
+        count = Attendance.query.filter(Attendance.attendance_date >= ms,
+                                        Attendance.attendance_date < me).count()
         att_by_month.append({'month': ms.strftime('%b %y'), 'count': count})
 
     # Students per class (top 10 active classes by enrollment)
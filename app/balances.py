@@ -0,0 +1,145 @@
+"""Materialized per-student balances (student_balances), kept by triggers.
+
+calc_balance_bulk used to GROUP BY the whole `transactions` table for every
+balances page, aging report, family list, reminder run and CSV export --
+often twice a request. student_balances holds each student's running
+charges / payments / balance instead. SQLite triggers on `transactions`
+update it inside the same DB transaction as the insert, update or delete,
+whether it came from the ORM, a bulk query or raw SQL, so a rolled-back
+payment never moves a balance.
+
+    python -m app.balances verify   # report students whose row has drifted
+    python -m app.balances rebuild  # recompute every row from transactions
+"""
+
+import argparse
+import logging
+
+import sqlalchemy
+
+from app import db
+
+# Anything that isn't a charge counts as a payment, as it always has.
+_CHARGE = "CASE WHEN {t}.type = 'charge' THEN {t}.amount ELSE 0 END"
+_PAYMENT = "CASE WHEN {t}.type = 'charge' THEN 0 ELSE {t}.amount END"
+_LAST_TXN = ('(SELECT MAX(created_at) FROM transactions'
+             ' WHERE transactions.student_id = {t}.student_id)')
+
+
+def _ensure_row(t: str) -> str:
+    return ('INSERT OR IGNORE INTO student_balances'
+            ' (student_id, total_charges, total_payments, balance)'
+            f' VALUES ({t}.student_id, 0, 0, 0);')
+
+
+def _apply(t: str, sign: str, last_txn: str) -> str:
+    """UPDATE adding (sign '+') or removing (sign '-') row `t`'s amount.
+    Rounded to cents each time so float sums never creep off the penny."""
+    charge, payment = _CHARGE.format(t=t), _PAYMENT.format(t=t)
+    return (
+        'UPDATE student_balances SET'
+        f' total_charges = ROUND(total_charges {sign} {charge}, 2),'
+        f' total_payments = ROUND(total_payments {sign} {payment}, 2),'
+        f' balance = ROUND(total_charges - total_payments {sign} ({charge} - {payment}), 2),'
+        f' last_txn_at = {last_txn}'
+        f' WHERE student_id = {t}.student_id;')
+
+
+TRIGGERS = {
+    'trg_student_balances_insert': (
+        'AFTER INSERT ON transactions BEGIN '
+        + _ensure_row('NEW')
+        # The new row is the newest unless a backdated created_at was written.
+        # A raw insert may leave created_at NULL: keep the last one then.
+        + _apply('NEW', '+', "MAX(COALESCE(last_txn_at, NEW.created_at),"
+                             " COALESCE(NEW.created_at, last_txn_at))")
+        + ' END'),
+    'trg_student_balances_delete': (
+        'AFTER DELETE ON transactions BEGIN '
+        + _apply('OLD', '-', _LAST_TXN.format(t='OLD'))
+        + ' END'),
+    'trg_student_balances_update': (
+        'AFTER UPDATE OF student_id, type, amount, created_at ON transactions BEGIN '
+        + _apply('OLD', '-', _LAST_TXN.format(t='OLD'))
+        + _ensure_row('NEW')
+        + _apply('NEW', '+', _LAST_TXN.format(t='NEW'))
+        + ' END'),
+}
+
+
+def install_triggers(conn, triggers=None) -> bool:
+    """Create any missing trigger on transactions (`triggers`, default this
+    module's), and replace any whose definition has since changed. Returns
+    True if one was missing or replaced, i.e. the table it maintains may have
+    missed (or mis-kept) writes and needs a rebuild."""
+    triggers = TRIGGERS if triggers is None else triggers
+    existing = dict(conn.execute(sqlalchemy.text(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'transactions'")).all())
+    changed = False
+    for name, ddl in triggers.items():
+        sql = f'CREATE TRIGGER {name} {ddl}'
+        if existing.get(name) == sql:
+            continue
+        if name in existing:
+            conn.execute(sqlalchemy.text(f'DROP TRIGGER {name}'))
+        conn.execute(sqlalchemy.text(sql))
+        changed = True
+    return changed
+
+
+def rebuild(conn):
+    """Recompute every student's row from transactions. `conn` is a
+    Connection or Session; the caller commits."""
+    conn.execute(sqlalchemy.text('DELETE FROM student_balances'))
+    conn.execute(sqlalchemy.text(
+        'INSERT INTO student_balances'
+        ' (student_id, total_charges, total_payments, balance, last_txn_at)'
+        ' SELECT student_id, ROUND(SUM(c), 2), ROUND(SUM(p), 2), ROUND(SUM(c) - SUM(p), 2),'
+        '  MAX(created_at)'
+        f' FROM (SELECT student_id, {_CHARGE.format(t="t")} AS c,'
+        f'  {_PAYMENT.format(t="t")} AS p, created_at FROM transactions t)'
+        ' GROUP BY student_id'))
+
+
+def verify() -> list[dict]:
+    """Students whose materialized totals differ from a fresh sum of their
+    transactions (by more than half a cent). Empty list = no drift."""
+    summed = {sid: (round(charges, 2), round(payments, 2), round(charges - payments, 2))
+              for sid, charges, payments in db.session.execute(sqlalchemy.text(
+                  'SELECT student_id,'
+                  f' SUM({_CHARGE.format(t="t")}), SUM({_PAYMENT.format(t="t")})'
+                  ' FROM transactions t GROUP BY student_id'))}
+    stored = {sid: (float(c), float(p), float(b))
+              for sid, c, p, b in db.session.execute(sqlalchemy.text(
+                  'SELECT student_id, total_charges, total_payments, balance'
+                  ' FROM student_balances'))}
+    drift = []
+    for sid in sorted(summed.keys() | stored.keys()):
+        expected = summed.get(sid, (0.0, 0.0, 0.0))
+        actual = stored.get(sid, (0.0, 0.0, 0.0))
+        if any(abs(e - a) >= 0.005 for e, a in zip(expected, actual)):
+            drift.append({'student_id': sid, 'expected': expected, 'actual': actual})
+    return drift
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Materialized student balances")
+    parser.add_argument('command', choices=('verify', 'rebuild'))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    from app import create_app
+    app = create_app(startup_jobs=False)
+    with app.app_context():
+        if args.command == 'rebuild':
+            rebuild(db.session)
+            db.session.commit()
+        drift = verify()
+        for d in drift:
+            print(f"student {d['student_id']}: expected (charges, payments, balance)="
+                  f"{d['expected']} materialized={d['actual']}")
+        print(f"{len(drift)} student(s) drifted")
+    return 1 if drift else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,141 @@
+"""Today's check-ins, kept in memory so duplicate checks don't hit SQLite."""
+
+import logging
+import threading
+from datetime import date
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class TodaysCheckins:
+    """Process-wide set of (student_id, class_id) pairs checked in today.
+
+    Every RFID tap and manual/toggle check-in asked SQLite "already checked in
+    today?" with an attendance_date query. This answers it from a set
+    seeded by ONE query per day (first use after startup, and again on the
+    first use after midnight) and kept current by the commit hooks below,
+    which see every ORM insert/delete of an Attendance row in this process.
+
+    Other writers are not seen by those hooks. With RFID_SOCKET set, the RFID
+    daemon commits taps in its own process; its check-in events reach the web
+    process through rfid.ipc.EventBridge, which adds them here (after the
+    commit, so the set can briefly lag). Web-side removals are sent the other
+    way. A second worker or raw SQL isn't covered at all. So the set is a fast
+    path, not the truth: the unique (student, class, day) index is the final
+    guard, and callers that hit an IntegrityError look up the row itself.
+
+    Raw-SQL deletes of attendance rows bypass the hooks; call `invalidate()`
+    after one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day = None
+        self._pairs = set()
+        self.hits = 0
+        self.misses = 0
+
+    def _ensure(self, today: date):
+        """(Re)seed for `today` if the set is for another day. Caller holds the lock."""
+        if self._day == today:
+            return
+        from app.models import Attendance
+        rows = db.session.query(Attendance.student_id, Attendance.class_id).filter(
+            Attendance.attendance_date == today).all()
+        self._pairs = {(sid, cid) for sid, cid in rows}
+        self._day = today
+        logger.debug("Seeded today's check-ins for %s: %d pair(s)", today, len(self._pairs))
+
+    def seed(self, today: date | None = None):
+        """Load today's pairs now (e.g. at service start) instead of on first use."""
+        with self._lock:
+            self._day = None
+            self._ensure(today or date.today())
+
+    def contains(self, student_id: int, class_id: int, day: date | None = None) -> bool:
+        """True if the student is checked in to the class on `day` (default today).
+
+        Only today is cached; any other day falls through to the database.
+        """
+        today = date.today()
+        day = day or today
+        if day != today:
+            return _query_checked_in(student_id, class_id, day)
+        with self._lock:
+            self._ensure(today)
+            found = (student_id, class_id) in self._pairs
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return found
+
+    def add(self, student_id: int, class_id: int, day: date):
+        with self._lock:
+            if day == self._day:
+                self._pairs.add((student_id, class_id))
+
+    def discard(self, student_id: int, class_id: int, day: date):
+        with self._lock:
+            if day == self._day:
+                self._pairs.discard((student_id, class_id))
+
+    def invalidate(self):
+        """Forget the set; the next check reseeds it from the database."""
+        with self._lock:
+            self._day = None
+            self._pairs = set()
+
+    def __len__(self):
+        return len(self._pairs)
+
+
+def _query_checked_in(student_id: int, class_id: int, day: date) -> bool:
+    from app.models import Attendance
+    return db.session.query(Attendance.id).filter(
+        Attendance.student_id == student_id,
+        Attendance.class_id == class_id,
+        Attendance.attendance_date == day,
+    ).first() is not None
+
+
+todays_checkins = TodaysCheckins()
+
+
+# ── Commit hooks ────────────────────────────────────────────────────
+# Attendance inserts/deletes are collected per session at flush time and only
+# applied to the set once the transaction commits, so a rolled-back check-in
+# never shows up as "already checked in".
+
+@event.listens_for(Session, 'after_flush')
+def _collect_attendance_changes(session, flush_context):
+    from app.models import Attendance
+    changes = session.info.setdefault('attendance_changes', [])
+    for obj in session.new:
+        if isinstance(obj, Attendance) and obj.check_in_time is not None:
+            changes.append((True, obj.student_id, obj.class_id, obj.check_in_time.date()))
+    for obj in session.deleted:
+        if isinstance(obj, Attendance) and obj.check_in_time is not None:
+            changes.append((False, obj.student_id, obj.class_id, obj.check_in_time.date()))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_attendance_changes(session):
+    for added, student_id, class_id, day in session.info.pop('attendance_changes', ()):
+        if added:
+            todays_checkins.add(student_id, class_id, day)
+        else:
+            todays_checkins.discard(student_id, class_id, day)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _drop_attendance_changes(session, previous_transaction):
+    # A SAVEPOINT rollback (burst check-in conflict) leaves the outer
+    # transaction's changes to commit; only a full rollback drops them.
+    if not previous_transaction.nested:
+        session.info.pop('attendance_changes', None)
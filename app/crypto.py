@@ -10,6 +10,7 @@ can no longer be decrypted (they'll come back empty) — re-enter them in Settin
 """
 
 import base64
+import functools
 import hashlib
 import logging
 
@@ -23,13 +24,19 @@ PLAIN_PREFIX = "plain:"
 
 def _fernet():
     """Return a Fernet instance keyed off SECRET_KEY, or None if unavailable."""
+    secret = current_app.config.get("SECRET_KEY", "")
+    if not secret:
+        return None
+    return _fernet_for(secret)
+
+
+@functools.lru_cache(maxsize=4)
+def _fernet_for(secret: str):
+    """Fernet for one SECRET_KEY, built once (not per encrypt/decrypt)."""
     try:
         from cryptography.fernet import Fernet
     except ImportError:
         return None
-    secret = current_app.config.get("SECRET_KEY", "")
-    if not secret:
-        return None
     # Derive a 32-byte urlsafe-base64 key from the secret
     digest = hashlib.sha256(secret.encode("utf-8")).digest()
     key = base64.urlsafe_b64encode(digest)
@@ -0,0 +1,200 @@
+"""Staff live-update events: an in-process pub/sub hub fed by commit hooks."""
+
+import json
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Event types a staff page can listen for
+CHECKIN = 'checkin'                  # attendance row: RFID tap or manual/toggle
+PENDING_PAYMENT = 'pending_payment'  # parent-reported payment created or reviewed
+REGISTRATION = 'registration'        # online registration created or reviewed
+WEBHOOK_PAYMENT = 'webhook_payment'  # Square webhook auto-recorded a payment
+RESYNC = 'resync'                    # this client fell behind: reload from the API
+
+
+class Subscription:
+    """One connected client's mailbox.
+
+    Bounded: a client that stops reading (a backgrounded laptop tab, a slow
+    link) can't make the hub buffer without limit. When it falls `max_queue`
+    events behind, its backlog is dropped and it gets a single `resync`
+    instead — it reloads its counts from the API, which is always correct.
+    """
+
+    def __init__(self, admin: bool, max_queue: int):
+        self.admin = admin
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._events = deque()
+        self._lagged = False
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def push(self, evt: dict):
+        with self._cond:
+            if self._closed:
+                return
+            if self._lagged:
+                self.dropped += 1  # the pending resync covers it
+            elif len(self._events) >= self.max_queue:
+                self.dropped += len(self._events) + 1
+                self._events.clear()
+                self._lagged = True
+            else:
+                self._events.append(evt)
+            self._cond.notify()
+
+    def get(self, timeout: float):
+        """Next event, a `resync` if events were dropped, or None after
+        `timeout` seconds with nothing to send (time for a heartbeat)."""
+        with self._cond:
+            if not (self._events or self._lagged or self._closed):
+                self._cond.wait(timeout)
+            if self._lagged:
+                self._lagged = False
+                return {'id': None, 'type': RESYNC, 'data': {'dropped': self.dropped}}
+            if self._events:
+                return self._events.popleft()
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+
+class EventHub:
+    """Fan-out of committed events to every connected staff client.
+
+    Process-wide, like the check-in set (one gunicorn worker). Publishing
+    never blocks on a client: each subscriber has its own bounded queue.
+    """
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subs = set()
+        self._seq = 0
+        self.published = 0
+
+    def subscribe(self, admin: bool = False, limit: int | None = None):
+        """New subscription, or None if `limit` clients are already connected."""
+        with self._lock:
+            if limit is not None and len(self._subs) >= limit:
+                return None
+            sub = Subscription(admin, self.max_queue)
+            self._subs.add(sub)
+            return sub
+
+    def unsubscribe(self, sub: Subscription):
+        sub.close()
+        with self._lock:
+            self._subs.discard(sub)
+
+    def __len__(self):
+        return len(self._subs)
+
+    def publish(self, event_type: str, data: dict, admin_only: bool = False):
+        """Send an event to every subscriber allowed to see it"""
+        with self._lock:
+            self._seq += 1
+            self.published += 1
+            evt = {'id': self._seq, 'type': event_type, 'data': data, 'admin_only': admin_only,
+                   'at': datetime.utcnow().isoformat() + 'Z'}
+            subs = list(self._subs)
+        for sub in subs:
+            if admin_only and not sub.admin:
+                continue
+            sub.push(evt)
+        return evt
+
+
+def format_sse(evt: dict) -> str:
+    """One event in text/event-stream framing"""
+    lines = []
+    if evt.get('id') is not None:
+        lines.append(f"id: {evt['id']}")
+    lines.append(f"event: {evt['type']}")
+    lines.append('data: ' + json.dumps({'type': evt['type'], 'at': evt.get('at'),
+                                        **(evt.get('data') or {})}))
+    return '\n'.join(lines) + '\n\n'
+
+
+event_hub = EventHub()
+
+
+# ── Commit hooks ────────────────────────────────────────────────────
+# Events are collected at flush time and only published once the transaction
+# commits, so staff never see a check-in or payment that was rolled back.
+
+def queue_event(session, event_type: str, data: dict, admin_only: bool = False):
+    """Publish an event when `session` commits. For changes the flush hook
+    can't see: the conditional bulk UPDATEs that claim a pending payment or
+    registration."""
+    session.info.setdefault('staff_events', []).append((event_type, data, admin_only))
+
+
+def _status_changed(obj) -> bool:
+    return inspect(obj).attrs.status.history.has_changes()
+
+
+def _collect(obj, is_new: bool):
+    """(event_type, data, admin_only) for a flushed row, or None"""
+    from app.models import Attendance, PendingPayment, Registration, Transaction
+    if isinstance(obj, Attendance) and is_new:
+        return (CHECKIN, {'attendance_id': obj.id, 'student_id': obj.student_id,
+                          'class_id': obj.class_id, 'method': obj.check_in_method,
+                          # Studio-local, like every attendance time in the API
+                          'check_in_time': obj.check_in_time.isoformat()
+                          if obj.check_in_time else None}, False)
+    if isinstance(obj, PendingPayment) and (is_new or _status_changed(obj)):
+        return (PENDING_PAYMENT, {'id': obj.id, 'status': obj.status,
+                                  'amount': float(obj.amount or 0)}, True)
+    if isinstance(obj, Registration) and (is_new or _status_changed(obj)):
+        return (REGISTRATION, {'id': obj.id, 'status': obj.status}, False)
+    # The Square webhook is the only writer of an unattributed square payment.
+    if (isinstance(obj, Transaction) and is_new and obj.type == 'payment'
+            and obj.payment_method == 'square' and obj.created_by is None):
+        return (WEBHOOK_PAYMENT, {'transaction_id': obj.id, 'student_id': obj.student_id,
+                                  'amount': float(obj.amount or 0)}, True)
+    return None
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_staff_events(session, flush_context):
+    pending = session.info.setdefault('staff_events', [])
+    for obj in session.new:
+        found = _collect(obj, True)
+        if found:
+            pending.append(found)
+    for obj in session.dirty:
+        found = _collect(obj, False)
+        if found:
+            pending.append(found)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_staff_events(session):
+    for event_type, data, admin_only in session.info.pop('staff_events', ()):
+        try:
+            event_hub.publish(event_type, data, admin_only=admin_only)
+        except Exception:
+            # Live updates are a convenience; never fail the commit path.
+            logger.exception("Failed to publish %s event", event_type)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _drop_staff_events(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop('staff_events', None)
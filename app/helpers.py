@@ -2,9 +2,10 @@
 
 from datetime import date
 
-from sqlalchemy import func
+import sqlalchemy
+
 from app import db
-from app.models import Transaction
+from app.models import ClassEnrollment, StudentBalance
 
 
 def build_aging(txns: list, as_of: date | None = None) -> dict:
@@ -57,32 +58,69 @@ def build_aging(txns: list, as_of: date | None = None) -> dict:
     return buckets
 
 
+# FIFO aging in one pass. Paying charges oldest-first with the whole payment
+# pool leaves a charge unpaid by max(0, min(amount, charges-through-it - pool)),
+# so a running SUM over each student's charges (same order build_aging sorts
+# by) is all the allocation takes. Only students who owe (balance > 0, from
+# the materialized student_balances) are read, via ix_transactions_student_date.
+_AGING_SQL = sqlalchemy.text("""
+WITH owing AS (
+    SELECT student_id, total_payments AS paid FROM student_balances WHERE balance > 0
+), charges AS (
+    SELECT t.student_id, t.transaction_date, t.amount, o.paid,
+           SUM(t.amount) OVER (PARTITION BY t.student_id
+                               ORDER BY t.transaction_date, t.created_at, t.id
+                               ROWS UNBOUNDED PRECEDING) AS through_here
+    FROM owing o JOIN transactions t ON t.student_id = o.student_id
+    WHERE t.type = 'charge'
+), unpaid AS (
+    SELECT student_id,
+           ROUND(MAX(0, MIN(amount, through_here - paid)), 2) AS remaining,
+           CAST(julianday(:as_of) - julianday(transaction_date) AS INTEGER) AS age
+    FROM charges
+)
+SELECT student_id,
+       ROUND(SUM(CASE WHEN age <= 30 THEN remaining ELSE 0 END), 2),
+       ROUND(SUM(CASE WHEN age > 30 AND age <= 60 THEN remaining ELSE 0 END), 2),
+       ROUND(SUM(CASE WHEN age > 60 AND age <= 90 THEN remaining ELSE 0 END), 2),
+       ROUND(SUM(CASE WHEN age > 90 THEN remaining ELSE 0 END), 2)
+FROM unpaid
+GROUP BY student_id
+HAVING SUM(remaining) > 0
+""")
+
+
+def aging_by_student(as_of: date | None = None) -> dict[int, dict]:
+    """build_aging for every student who owes, in a single query.
+
+    Same FIFO allocation, buckets and rounding as build_aging over each
+    student's transactions (tests/test_billing.py checks them against each
+    other on random ledgers). Students owing nothing are left out.
+
+    Returns {student_id: {'current','d31_60','d61_90','d90_plus','total'}}.
+    """
+    as_of = as_of or date.today()
+    result = {}
+    for sid, *amounts in db.session.execute(_AGING_SQL, {'as_of': as_of.isoformat()}):
+        buckets = dict(zip(('current', 'd31_60', 'd61_90', 'd90_plus'),
+                           (round(float(a), 2) for a in amounts)))
+        buckets['total'] = round(sum(buckets.values()), 2)
+        if buckets['total'] > 0:
+            result[sid] = buckets
+    return result
+
+
 def calc_balance(student_id: int) -> dict:
-    """Calculate charges, payments, and balance for a student using SQL aggregation.
+    """Charges, payments, and balance for a student, from student_balances
+    (kept current by triggers on every transaction write; see app/balances.py).
 
     Returns dict with keys: total_charges, total_payments, balance (all float).
     """
-    rows = (
-        db.session.query(
-            Transaction.type,
-            func.sum(Transaction.amount),
-        )
-        .filter_by(student_id=student_id)
-        .group_by(Transaction.type)
-        .all()
-    )
-    totals = {r[0]: float(r[1]) for r in rows}
-    charges = totals.get('charge', 0.0)
-    payments = totals.get('payment', 0.0)
-    return {
-        'total_charges': charges,
-        'total_payments': payments,
-        'balance': charges - payments,
-    }
+    return calc_balance_bulk([student_id])[student_id]
 
 
 def calc_balance_bulk(student_ids: list[int]) -> dict[int, dict]:
-    """Calculate balances for multiple students in one query.
+    """Balances for multiple students in one primary-key lookup.
 
     Returns {student_id: {total_charges, total_payments, balance}}.
     """
@@ -90,24 +128,19 @@ def calc_balance_bulk(student_ids: list[int]) -> dict[int, dict]:
         return {}
     rows = (
         db.session.query(
-            Transaction.student_id,
-            Transaction.type,
-            func.sum(Transaction.amount),
+            StudentBalance.student_id,
+            StudentBalance.total_charges,
+            StudentBalance.total_payments,
+            StudentBalance.balance,
         )
-        .filter(Transaction.student_id.in_(student_ids))
-        .group_by(Transaction.student_id, Transaction.type)
+        .filter(StudentBalance.student_id.in_(student_ids))
         .all()
     )
-    result: dict[int, dict] = {}
-    for sid, txn_type, total in rows:
-        if sid not in result:
-            result[sid] = {'total_charges': 0.0, 'total_payments': 0.0, 'balance': 0.0}
-        if txn_type == 'charge':
-            result[sid]['total_charges'] = float(total)
-        else:
-            result[sid]['total_payments'] = float(total)
-    for sid in result:
-        result[sid]['balance'] = result[sid]['total_charges'] - result[sid]['total_payments']
+    result: dict[int, dict] = {
+        sid: {'total_charges': float(charges), 'total_payments': float(payments),
+              'balance': float(balance)}
+        for sid, charges, payments, balance in rows
+    }
     # Fill in students with no transactions
     for sid in student_ids:
         if sid not in result:
@@ -214,7 +247,26 @@ def allocate_family_payment(student_ids: list[int], amount: float) -> list[tuple
     return allocations
 
 
+def enrollment_counts(class_ids: list[int]) -> dict[int, int]:
+    """Active enrollments per class in one grouped query (what
+    DanceClass.enrolled_students_count counts one class at a time).
+
+    Returns {class_id: count}, 0 for classes with none.
+    """
+    if not class_ids:
+        return {}
+    rows = (db.session.query(ClassEnrollment.class_id, sqlalchemy.func.count())
+            .filter(ClassEnrollment.class_id.in_(class_ids), ClassEnrollment.is_active.is_(True))
+            .group_by(ClassEnrollment.class_id).all())
+    counts = dict.fromkeys(class_ids, 0)
+    counts.update(rows)
+    return counts
+
+
 # --- Serializers ---
+# List endpoints eager-load what these touch (family, location, instructor,
+# student, class, creator) and pass class_to_dict a grouped enrollment count,
+# so a page costs the same few queries at any size.
 
 def student_to_dict(student) -> dict:
     return {
@@ -265,7 +317,7 @@ def student_to_dict(student) -> dict:
     }
 
 
-def class_to_dict(dance_class) -> dict:
+def class_to_dict(dance_class, enrolled_count: int | None = None) -> dict:
     return {
         'id': dance_class.id,
         'name': dance_class.name,
@@ -279,7 +331,8 @@ def class_to_dict(dance_class) -> dict:
         'instructor_id': dance_class.instructor_id,
         'instructor_name': dance_class.instructor.full_name if dance_class.instructor else None,
         'max_students': dance_class.max_students,
-        'enrolled_count': dance_class.enrolled_students_count,
+        'enrolled_count': (dance_class.enrolled_students_count if enrolled_count is None
+                           else enrolled_count),
         'level': dance_class.level,
         'age_group': dance_class.age_group,
         'is_active': dance_class.is_active,
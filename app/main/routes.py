@@ -5,7 +5,7 @@ from functools import wraps
 
 from flask import redirect, render_template, request, url_for
 from flask_login import current_user, login_required
-from sqlalchemy import desc, func
+from sqlalchemy import desc
 
 from app import db
 from app.helpers import calc_balance
@@ -66,7 +66,7 @@ def dashboard():
     total_students = Student.query.filter_by(is_active=True).count()
     total_classes = DanceClass.query.filter_by(is_active=True).count()
     todays_attendance = Attendance.query.filter(
-        func.date(Attendance.check_in_time) == today
+        Attendance.attendance_date == today
     ).count()
     students_without_rfid = Student.query.filter_by(
         is_active=True, rfid_uid=None
@@ -285,8 +285,8 @@ def take_attendance_class(class_id):
     all_attendance = Attendance.query.filter(
         Attendance.student_id.in_(student_ids),
         Attendance.class_id == class_id,
-        func.date(Attendance.check_in_time) >= earliest,
-        func.date(Attendance.check_in_time) <= latest,
+        Attendance.attendance_date >= earliest,
+        Attendance.attendance_date <= latest,
     ).all()
 
     # Build lookup: (student_id, week_start_iso) -> bool
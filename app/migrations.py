@@ -1,5 +1,6 @@
 """Database schema migrations for AttenDANCE.
-Adds columns to existing tables on startup (SQLite ALTER TABLE).
+Adds columns to existing tables on startup (SQLite ALTER TABLE), then applies
+the numbered one-time migrations in VERSIONED_MIGRATIONS.
 """
 
 import sqlalchemy
@@ -38,6 +39,30 @@ PERFORMANCE_COLUMNS = [
     ('recital_id', 'INTEGER'),
 ]
 
+ATTENDANCE_COLUMNS = [
+    ('attendance_date', 'DATE'),
+]
+
+AGING_SNAPSHOT_TOTAL_COLUMNS = [
+    ('ledger_version', 'INTEGER'),
+]
+
+# Attendance.attendance_date is date(check_in_time). The model sets it; these
+# fill it for any other writer (raw SQL, a script), only when it's wrong, so
+# an ORM insert pays for no extra write.
+_ATTENDANCE_DATE_FIX = ('UPDATE attendance SET attendance_date = date(NEW.check_in_time)'
+                        ' WHERE id = NEW.id;')
+ATTENDANCE_DATE_TRIGGERS = {
+    'trg_attendance_date_insert': (
+        'AFTER INSERT ON attendance'
+        ' WHEN NEW.attendance_date IS NOT date(NEW.check_in_time)'
+        f' BEGIN {_ATTENDANCE_DATE_FIX} END'),
+    'trg_attendance_date_update': (
+        'AFTER UPDATE OF check_in_time, attendance_date ON attendance'
+        ' WHEN NEW.attendance_date IS NOT date(NEW.check_in_time)'
+        f' BEGIN {_ATTENDANCE_DATE_FIX} END'),
+}
+
 
 def _add_missing_columns(conn, inspector, table, columns):
     existing = [c['name'] for c in inspector.get_columns(table)]
@@ -62,8 +87,12 @@ def _enforce_attendance_uniqueness(conn):
     UniqueConstraint, so a concurrent double-tap could create duplicate 'present'
     rows (inflating counts + breaking the toggle). De-dupe any existing dupes
     (keep the earliest row) then add a functional unique index so the DB rejects
-    duplicates. Idempotent: the DELETE is a no-op on clean data and the index is
-    IF NOT EXISTS."""
+    duplicates. Once the index exists no duplicate can be written, so the
+    whole-table de-dupe only runs on a database that doesn't have it yet."""
+    if conn.execute(sqlalchemy.text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' "
+            "AND name = 'ix_attendance_unique_day'")).first():
+        return
     conn.execute(sqlalchemy.text(
         'DELETE FROM attendance WHERE id NOT IN ('
         ' SELECT MIN(id) FROM attendance'
@@ -73,6 +102,127 @@ def _enforce_attendance_uniqueness(conn):
         ' ON attendance(student_id, class_id, date(check_in_time))'))
 
 
+def _maintain_attendance_date(conn):
+    """Install the attendance_date triggers; if one was missing, rows may have
+    been written without the column, so backfill every row that's wrong (all
+    of them, the first time)."""
+    existing = {row[0] for row in conn.execute(sqlalchemy.text(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'attendance'"))}
+    missing = [name for name in ATTENDANCE_DATE_TRIGGERS if name not in existing]
+    for name in missing:
+        conn.execute(sqlalchemy.text(f'CREATE TRIGGER {name} {ATTENDANCE_DATE_TRIGGERS[name]}'))
+    if missing:
+        conn.execute(sqlalchemy.text(
+            'UPDATE attendance SET attendance_date = date(check_in_time)'
+            ' WHERE attendance_date IS NOT date(check_in_time)'))
+
+
+def _backfill_rfid_rollup(conn):
+    """rfid_log_daily is new: count the existing rfid_logs into it once, so the
+    dashboard doesn't read zero for history the retention job will later
+    prune. Only runs while the rollup is empty."""
+    if conn.execute(sqlalchemy.text('SELECT 1 FROM rfid_log_daily LIMIT 1')).first():
+        return
+    if not conn.execute(sqlalchemy.text('SELECT 1 FROM rfid_logs LIMIT 1')).first():
+        return
+    from app.rfid_rollup import rebuild
+    rebuild(conn)
+
+
+def _materialize_student_balances(conn):
+    """student_balances is maintained by triggers on transactions (see
+    app/balances.py). Install them, and recompute the table whenever a trigger
+    had to be (re)created -- writes made without it were not counted."""
+    from app.balances import install_triggers, rebuild
+    if install_triggers(conn):
+        rebuild(conn)
+
+
+def _materialize_revenue_monthly(conn):
+    """revenue_monthly is maintained by triggers on transactions (see
+    app/revenue.py); same install-then-rebuild rule as student_balances."""
+    from app.revenue import install_triggers, rebuild
+    if install_triggers(conn):
+        rebuild(conn)
+
+
+def _maintain_ledger_version(conn):
+    """ledger_version is bumped by triggers on transactions (see app/aging.py)"""
+    from app.aging import install_triggers
+    install_triggers(conn)
+
+
+def _maintain_search_index(conn):
+    """search_index (FTS5) is maintained by triggers on students, families and
+    classes (see app/search.py); rebuilt when a trigger had to be (re)created."""
+    from app.search import install, rebuild
+    if install(conn):
+        rebuild(conn)
+
+
+_V1_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS ix_transactions_student_date'
+    ' ON transactions (student_id, transaction_date, created_at)',
+    'CREATE INDEX IF NOT EXISTS ix_transactions_date ON transactions (transaction_date, created_at)',
+    'CREATE INDEX IF NOT EXISTS ix_transactions_type_date ON transactions (type, transaction_date)',
+    'CREATE INDEX IF NOT EXISTS ix_transactions_recurring_date'
+    ' ON transactions (recurring_charge_id, transaction_date)',
+    'CREATE INDEX IF NOT EXISTS ix_class_enrollments_class_active'
+    ' ON class_enrollments (class_id, is_active)',
+    'CREATE INDEX IF NOT EXISTS ix_parent_students_student ON parent_students (student_id)',
+    'CREATE INDEX IF NOT EXISTS ix_waiver_signatures_student ON waiver_signatures (student_id)',
+    'CREATE INDEX IF NOT EXISTS ix_waiver_signatures_parent ON waiver_signatures (parent_id)',
+    'CREATE INDEX IF NOT EXISTS ix_attendance_check_in_time ON attendance (check_in_time)',
+    'CREATE INDEX IF NOT EXISTS ix_rfid_logs_scan_time ON rfid_logs (scan_time)',
+    'CREATE INDEX IF NOT EXISTS ix_rfid_logs_student_time ON rfid_logs (student_id, scan_time)',
+    # No longer on the model (v2 replaces it).
+    'CREATE INDEX IF NOT EXISTS ix_attendance_day_class ON attendance (date(check_in_time), class_id)',
+]
+
+
+def _v1_hot_table_indexes(conn):
+    """Indexes for the filters every money, roster and log query uses
+    (transactions had none). idx_attendance_date_student indexed
+    date('check_in_time') -- of the string literal, a constant -- so it never
+    helped; ix_attendance_day_class replaces it."""
+    conn.execute(sqlalchemy.text('DROP INDEX IF EXISTS idx_attendance_date_student'))
+    # Spelled out, not built from the models: an applied migration must keep
+    # doing exactly what it did, whatever later happens to the declarations.
+    for ddl in _V1_INDEXES:
+        conn.execute(sqlalchemy.text(ddl))
+
+
+def _v2_attendance_date_indexes(conn):
+    """Day and date-range filters use the stored attendance_date column
+    (backfilled by _maintain_attendance_date) instead of date(check_in_time),
+    which only the one expression index could serve."""
+    conn.execute(sqlalchemy.text('DROP INDEX IF EXISTS ix_attendance_day_class'))
+    # Spelled out for the same reason as v1's.
+    conn.execute(sqlalchemy.text('CREATE INDEX IF NOT EXISTS ix_attendance_date_class'
+                                 ' ON attendance (attendance_date, class_id)'))
+    conn.execute(sqlalchemy.text('CREATE INDEX IF NOT EXISTS ix_attendance_student_date'
+                                 ' ON attendance (student_id, attendance_date)'))
+
+
+# One-time migrations, applied in order on top of the idempotent steps above.
+# PRAGMA user_version holds the last one applied; append new ones with the
+# next number and never renumber or edit an applied one.
+VERSIONED_MIGRATIONS = [
+    (1, _v1_hot_table_indexes),
+    (2, _v2_attendance_date_indexes),
+]
+
+
+def _run_versioned_migrations(conn):
+    current = conn.execute(sqlalchemy.text('PRAGMA user_version')).scalar() or 0
+    for version, migrate in VERSIONED_MIGRATIONS:
+        if version <= current:
+            continue
+        migrate(conn)
+        # PRAGMA takes no bound parameters; version is our own int.
+        conn.execute(sqlalchemy.text(f'PRAGMA user_version = {int(version)}'))
+
+
 def run_migrations(db):
     with db.engine.connect() as conn:
         inspector = sqlalchemy.inspect(db.engine)
@@ -82,10 +232,23 @@ def run_migrations(db):
             _reconcile_admin_role(conn)
         if 'transactions' in inspector.get_table_names():
             _add_missing_columns(conn, inspector, 'transactions', TRANSACTION_COLUMNS)
+            _materialize_student_balances(conn)
+            _materialize_revenue_monthly(conn)
+            _maintain_ledger_version(conn)
+        if 'aging_snapshot_totals' in inspector.get_table_names():
+            _add_missing_columns(conn, inspector, 'aging_snapshot_totals',
+                                 AGING_SNAPSHOT_TOTAL_COLUMNS)
         if 'classes' in inspector.get_table_names():
             _add_missing_columns(conn, inspector, 'classes', CLASS_COLUMNS)
         if 'performances' in inspector.get_table_names():
             _add_missing_columns(conn, inspector, 'performances', PERFORMANCE_COLUMNS)
         if 'attendance' in inspector.get_table_names():
+            _add_missing_columns(conn, inspector, 'attendance', ATTENDANCE_COLUMNS)
+            _maintain_attendance_date(conn)
             _enforce_attendance_uniqueness(conn)
+        if 'rfid_logs' in inspector.get_table_names():
+            _backfill_rfid_rollup(conn)
+        if {'students', 'families', 'classes'} <= set(inspector.get_table_names()):
+            _maintain_search_index(conn)
+        _run_versioned_migrations(conn)
         conn.commit()
@@ -5,6 +5,7 @@ Database models for AttenDANCE system
 from datetime import datetime, date
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm import validates
 from app import db
 
 class User(UserMixin, db.Model):
@@ -80,8 +81,11 @@ class ParentStudent(db.Model):
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
+    # The unique constraint indexes parent_id -> children; this is the other
+    # direction (a student's parents, for reminders and the family view)
     __table_args__ = (
         db.UniqueConstraint('parent_id', 'student_id', name='unique_parent_student'),
+        db.Index('ix_parent_students_student', 'student_id'),
     )
 
     parent = db.relationship('User', backref='parent_links')
@@ -282,7 +286,7 @@ class DanceClass(db.Model):
         """Get today's attendance for this class"""
         today = date.today()
         return self.attendances.filter(
-            db.func.date(Attendance.check_in_time) == today
+            Attendance.attendance_date == today
         ).all()
     
     def __repr__(self):
@@ -307,9 +311,11 @@ class ClassEnrollment(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # Unique constraint
+    # Unique constraint (also the index for per-student lookups); rosters
+    # look up a class's active enrollments
     __table_args__ = (
         db.UniqueConstraint('student_id', 'class_id', name='unique_student_class'),
+        db.Index('ix_class_enrollments_class_active', 'class_id', 'is_active'),
     )
     
     def __repr__(self):
@@ -329,6 +335,11 @@ class Attendance(db.Model):
     # set it explicitly; this default is the safety net for any future one.
     check_in_time = db.Column(db.DateTime, default=datetime.now, nullable=False)
     check_out_time = db.Column(db.DateTime)
+    # date(check_in_time), stored so day filters can use an index. Set with
+    # check_in_time (below); SQLite triggers fill it for any other writer
+    # (app/migrations.py).
+    attendance_date = db.Column(db.Date, default=lambda ctx: ctx.get_current_parameters()[
+        'check_in_time'].date())
     
     # How they checked in
     check_in_method = db.Column(db.String(20), default='rfid')  # rfid, manual, mobile
@@ -339,19 +350,20 @@ class Attendance(db.Model):
     # Status
     is_present = db.Column(db.Boolean, default=True, nullable=False)
     
-    # Lookup index for the per-(student, class, day) dedup query. NOTE: this is a
-    # plain index, NOT a uniqueness guarantee — duplicate check-ins are prevented
-    # at the APPLICATION level (manual_checkin returns 400 if already present;
-    # toggle_attendance deletes-or-creates). Keep those checks; the DB won't.
+    # Per-(student, class, day) uniqueness is the unique ix_attendance_unique_day
+    # (app/migrations.py). These serve "everyone on a day / date range"
+    # (dashboard, class roster, reports), a student's history, and the
+    # newest-first attendance list.
     __table_args__ = (
-        db.Index('idx_attendance_date_student', 'student_id',
-                db.func.date('check_in_time'), 'class_id'),
+        db.Index('ix_attendance_date_class', 'attendance_date', 'class_id'),
+        db.Index('ix_attendance_student_date', 'student_id', 'attendance_date'),
+        db.Index('ix_attendance_check_in_time', 'check_in_time'),
     )
     
-    @property
-    def attendance_date(self):
-        """Get attendance date"""
-        return self.check_in_time.date()
+    @validates('check_in_time')
+    def _set_attendance_date(self, key, value):
+        self.attendance_date = value.date() if value is not None else None
+        return value
     
     @property
     def duration(self):
@@ -383,9 +395,40 @@ class RFIDLog(db.Model):
     # Relationships
     student = db.relationship('Student', backref='rfid_logs')
     
+    # Newest-first log view, time-window counts and the retention sweep;
+    # a student's own scan history
+    __table_args__ = (
+        db.Index('ix_rfid_logs_scan_time', 'scan_time'),
+        db.Index('ix_rfid_logs_student_time', 'student_id', 'scan_time'),
+    )
+    
     def __repr__(self):
         return f'<RFIDLog {self.rfid_uid} at {self.scan_time}>'
 
+class RFIDLogDaily(db.Model):
+    """Per-day rollup of RFID scan logs. Written by the RFID log writer in the
+    same transaction as the raw rows, so the counts outlive the retention job
+    that prunes rfid_logs (see app/rfid_rollup.py)."""
+    __tablename__ = 'rfid_log_daily'
+    
+    day = db.Column(db.Date, primary_key=True)  # studio-local date(scan_time)
+    action_taken = db.Column(db.String(50), primary_key=True)  # '' if the log had none
+    success_count = db.Column(db.Integer, default=0, nullable=False)
+    fail_count = db.Column(db.Integer, default=0, nullable=False)
+    distinct_cards = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<RFIDLogDaily {self.day} {self.action_taken}>'
+
+class RFIDLogDailyCard(db.Model):
+    """Cards seen per (day, action), backing RFIDLogDaily.distinct_cards.
+    Only needed while a day can still get rows; pruned with the raw logs."""
+    __tablename__ = 'rfid_log_daily_cards'
+    
+    day = db.Column(db.Date, primary_key=True)
+    action_taken = db.Column(db.String(50), primary_key=True)
+    rfid_uid = db.Column(db.String(50), primary_key=True)
+
 class Transaction(db.Model):
     """Payment / transaction record"""
     __tablename__ = 'transactions'
@@ -408,9 +451,96 @@ class Transaction(db.Model):
 
     recurring_charge = db.relationship('RecurringCharge', backref='transactions')
 
+    # A student's ledger (always ordered by date, then entry time), the
+    # studio-wide ledger and revenue by type, and the recurring-charge run's
+    # "already billed this month?" check
+    __table_args__ = (
+        db.Index('ix_transactions_student_date', 'student_id', 'transaction_date', 'created_at'),
+        db.Index('ix_transactions_date', 'transaction_date', 'created_at'),
+        db.Index('ix_transactions_type_date', 'type', 'transaction_date'),
+        db.Index('ix_transactions_recurring_date', 'recurring_charge_id', 'transaction_date'),
+    )
+
     def __repr__(self):
         return f'<Transaction ${self.amount} {self.category} for student {self.student_id}>'
 
+class StudentBalance(db.Model):
+    """Running totals of a student's transactions. Maintained by SQLite
+    triggers on `transactions` in the same DB transaction as every insert,
+    update and delete, so it can't disagree with the ledger it summarizes
+    (see app/balances.py; `python -m app.balances verify` checks for drift)."""
+    __tablename__ = 'student_balances'
+
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id', ondelete='CASCADE'),
+                           primary_key=True)
+    total_charges = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    total_payments = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    balance = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    last_txn_at = db.Column(db.DateTime)  # newest transactions.created_at (UTC)
+
+    def __repr__(self):
+        return f'<StudentBalance {self.student_id} ${self.balance}>'
+
+
+class LedgerVersion(db.Model):
+    """One-row counter bumped by SQLite triggers on every `transactions`
+    insert, update and delete (see app/aging.py), so a stored aging snapshot
+    can tell whether the ledger has changed since it was taken."""
+    __tablename__ = 'ledger_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class RevenueMonthly(db.Model):
+    """Transaction totals per (month, type, category), kept by SQLite triggers
+    on `transactions` like StudentBalance (see app/revenue.py). The revenue
+    report reads this instead of summing the ledger once per month."""
+    __tablename__ = 'revenue_monthly'
+
+    month = db.Column(db.String(7), primary_key=True)  # 'YYYY-MM' of transaction_date
+    type = db.Column(db.String(10), primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    amount = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    txn_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<RevenueMonthly {self.month} {self.type} {self.category} ${self.amount}>'
+
+class AgingSnapshot(db.Model):
+    """One owing student's A/R aging buckets as of a day. Written by the
+    nightly snapshot job (app/aging.py); the aging report serves the latest
+    day's rows instead of re-running the FIFO allocation per request."""
+    __tablename__ = 'aging_snapshots'
+
+    day = db.Column(db.Date, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id', ondelete='CASCADE'),
+                           primary_key=True)
+    current = db.Column(db.Numeric(12, 2), nullable=False, default=0)  # 0-30 days
+    d31_60 = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    d61_90 = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    d90_plus = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    total = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<AgingSnapshot {self.day} {self.student_id} ${self.total}>'
+
+class AgingSnapshotTotal(db.Model):
+    """Studio-wide aging bucket totals per snapshot day (the trend chart)"""
+    __tablename__ = 'aging_snapshot_totals'
+
+    day = db.Column(db.Date, primary_key=True)
+    current = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    d31_60 = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    d61_90 = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    d90_plus = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    total = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    student_count = db.Column(db.Integer, nullable=False, default=0)
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # UTC
+    ledger_version = db.Column(db.Integer)  # LedgerVersion.version it was computed at
+
+    def __repr__(self):
+        return f'<AgingSnapshotTotal {self.day} ${self.total}>'
+
 class RecurringCharge(db.Model):
     """Automatic monthly charge rule"""
     __tablename__ = 'recurring_charges'
@@ -499,27 +629,41 @@ class Setting(db.Model):
     value = db.Column(db.Text)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Reads come from the in-memory snapshot (app/settings_cache.py), not a
+    # SELECT per call.
+
     @staticmethod
     def get(key: str, default: str = '') -> str:
-        row = Setting.query.filter_by(key=key).first()
-        return row.value if row and row.value else default
+        from app.settings_cache import settings_cache
+        value = settings_cache.get(key)
+        return value if value else default
 
     @staticmethod
     def get_bool(key: str, default: bool = False) -> bool:
-        row = Setting.query.filter_by(key=key).first()
-        if not row or row.value is None or row.value == '':
+        from app.settings_cache import settings_cache
+        value = settings_cache.get(key)
+        if value is None or value == '':
             return default
-        return row.value == '1'
+        return value == '1'
+
+    @staticmethod
+    def get_secret(key: str) -> str:
+        """Decrypted value of an encrypted setting (see app/crypto.py), '' if
+        unset. Memoized until the setting changes."""
+        from app.settings_cache import settings_cache
+        return settings_cache.secret(key)
 
     @staticmethod
     def set(key: str, value: str):
         from app import db as _db
+        from app.settings_cache import settings_cache
         row = Setting.query.filter_by(key=key).first()
         if row:
             row.value = value
         else:
             _db.session.add(Setting(key=key, value=value))
         _db.session.commit()
+        settings_cache.bump()
 
     def __repr__(self):
         return f'<Setting {self.key}>'
@@ -760,8 +904,12 @@ class WaiverSignature(db.Model):
     student = db.relationship('Student', backref='waiver_signatures')
     parent = db.relationship('User', backref='waiver_signatures')
 
+    # The unique constraint indexes template_id; a student's and a parent's
+    # signatures are looked up on their own
     __table_args__ = (
         db.UniqueConstraint('template_id', 'student_id', name='unique_waiver_signature'),
+        db.Index('ix_waiver_signatures_student', 'student_id'),
+        db.Index('ix_waiver_signatures_parent', 'parent_id'),
     )
 
     def __repr__(self):
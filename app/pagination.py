@@ -0,0 +1,104 @@
+"""Keyset (cursor) pagination for the newest-first list endpoints.
+
+`?page=N` runs OFFSET (N-1)*per_page plus a COUNT(*) of the filtered table,
+so page 200 of five years of attendance reads every row before it. With
+`?cursor=` the endpoint instead filters on the sort key of the last row it
+returned -- `(check_in_time, id) < (?, ?)` -- which the index walks straight
+to: every page costs the same. The token is opaque to clients (base64 of the
+key values); the first cursor page is `?cursor=` (empty), and each response
+carries the next one.
+
+Cursor pages skip the COUNT(*). Ask for one with `?total=1` and it comes from
+a short per-process cache (TOTAL_TTL seconds, keyed by endpoint and filters),
+so a client paging through a big table pays for it about once.
+
+Page-number responses carry `next_cursor` too, so a client can switch over.
+"""
+
+import base64
+import json
+import threading
+import time
+
+from sqlalchemy import desc, tuple_
+
+TOTAL_TTL = 60  # seconds a cached total is served
+_TOTALS_MAX = 256
+
+_totals = {}  # key -> (expires at, count)
+_totals_lock = threading.Lock()
+
+
+class InvalidCursor(ValueError):
+    """A cursor token that doesn't decode to this endpoint's sort key"""
+
+
+def encode_cursor(values) -> str:
+    raw = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str, columns) -> list:
+    """Key values from `token`, parsed to the Python types of `columns`"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise InvalidCursor(token)
+        parsed = []
+        for col, value in zip(columns, values):
+            py_type = col.type.python_type
+            if hasattr(py_type, 'fromisoformat'):
+                parsed.append(py_type.fromisoformat(value))
+            elif isinstance(value, py_type) and not isinstance(value, bool):
+                parsed.append(value)
+            else:
+                raise InvalidCursor(token)
+        return parsed
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(token) from e
+
+
+def cursor_for(row, columns) -> str:
+    return encode_cursor([getattr(row, col.key) for col in columns])
+
+
+def keyset_page(query, columns, per_page: int, cursor: str | None):
+    """One newest-first page of `query`, ordered by `columns` descending
+    (the last one unique, e.g. the id).
+
+    `cursor` is the token from the previous page; None or '' starts at the
+    top. Returns (rows, next_cursor); next_cursor is None on the last page.
+    Raises InvalidCursor for a token that doesn't decode.
+    """
+    # 0 would leave no last row to make the cursor from, and a negative LIMIT
+    # means "no limit" to SQLite.
+    per_page = max(1, per_page)
+    if cursor:
+        query = query.filter(tuple_(*columns) < tuple(decode_cursor(cursor, columns)))
+    rows = query.order_by(*[desc(c) for c in columns]).limit(per_page + 1).all()
+    if len(rows) <= per_page:
+        return rows, None
+    rows = rows[:per_page]
+    return rows, cursor_for(rows[-1], columns)
+
+
+def cached_total(key, query) -> int:
+    """COUNT(*) of `query`, reused for TOTAL_TTL seconds per `key`"""
+    now = time.monotonic()
+    with _totals_lock:
+        hit = _totals.get(key)
+        if hit and hit[0] > now:
+            return hit[1]
+    count = query.order_by(None).count()
+    with _totals_lock:
+        if len(_totals) >= _TOTALS_MAX:
+            for stale in [k for k, (exp, _) in _totals.items() if exp <= now] or [next(iter(_totals))]:
+                del _totals[stale]
+        _totals[key] = (now + TOTAL_TTL, count)
+    return count
+
+
+def clear_totals():
+    with _totals_lock:
+        _totals.clear()
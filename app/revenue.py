@@ -0,0 +1,113 @@
+"""Monthly revenue rollup (revenue_monthly), kept by triggers.
+
+The revenue report summed `transactions` once per chart month and type (24
+queries for a year, more per extra month) plus three more for its totals.
+revenue_monthly holds the amount and count per (month, type, category)
+instead, maintained by SQLite triggers in the same DB transaction as every
+transaction insert, update and delete -- the same arrangement as
+student_balances (app/balances.py). A year of it is a few dozen rows, so the
+report reads all of it at once, whatever window it shows.
+
+    python -m app.revenue verify   # report months whose rollup has drifted
+    python -m app.revenue rebuild  # recompute every row from transactions
+"""
+
+import argparse
+import logging
+
+import sqlalchemy
+
+from app import db
+
+_MONTH = "strftime('%Y-%m', {t}.transaction_date)"
+_KEY = f"{_MONTH} AS month, {{t}}.type, COALESCE({{t}}.category, '')"
+_MATCH = (f"month = {_MONTH} AND type = {{t}}.type"
+          " AND category = COALESCE({t}.category, '')")
+
+
+def _add(t: str) -> str:
+    return ('INSERT INTO revenue_monthly (month, type, category, amount, txn_count)'
+            f" VALUES ({_MONTH.format(t=t)}, {t}.type, COALESCE({t}.category, ''),"
+            f' ROUND({t}.amount, 2), 1)'
+            ' ON CONFLICT (month, type, category) DO UPDATE SET'
+            ' amount = ROUND(amount + excluded.amount, 2), txn_count = txn_count + 1;')
+
+
+def _remove(t: str) -> str:
+    match = _MATCH.format(t=t)
+    return ('UPDATE revenue_monthly SET'
+            f' amount = ROUND(amount - {t}.amount, 2), txn_count = txn_count - 1'
+            f' WHERE {match};'
+            f' DELETE FROM revenue_monthly WHERE {match} AND txn_count <= 0;')
+
+
+TRIGGERS = {
+    'trg_revenue_monthly_insert': 'AFTER INSERT ON transactions BEGIN ' + _add('NEW') + ' END',
+    'trg_revenue_monthly_delete': 'AFTER DELETE ON transactions BEGIN ' + _remove('OLD') + ' END',
+    'trg_revenue_monthly_update': (
+        'AFTER UPDATE OF type, amount, category, transaction_date ON transactions BEGIN '
+        + _remove('OLD') + _add('NEW') + ' END'),
+}
+
+_SUMMED = ('SELECT ' + _KEY.format(t='t') + ', ROUND(SUM(t.amount), 2), COUNT(*)'
+           ' FROM transactions t GROUP BY 1, 2, 3')
+
+
+def install_triggers(conn) -> bool:
+    """Create any missing trigger; True if the rollup needs a rebuild"""
+    from app.balances import install_triggers as install
+    return install(conn, TRIGGERS)
+
+
+def rebuild(conn):
+    """Recompute the rollup from transactions (one GROUP BY over the ledger).
+    `conn` is a Connection or Session; the caller commits."""
+    conn.execute(sqlalchemy.text('DELETE FROM revenue_monthly'))
+    conn.execute(sqlalchemy.text(
+        'INSERT INTO revenue_monthly (month, type, category, amount, txn_count) ' + _SUMMED))
+
+
+def verify() -> list[dict]:
+    """(month, type, category) keys whose rollup differs from a fresh GROUP BY
+    of transactions. Empty list = no drift."""
+    summed = {(m, t, c): (round(float(a), 2), n)
+              for m, t, c, a, n in db.session.execute(sqlalchemy.text(_SUMMED))}
+    stored = {(m, t, c): (round(float(a), 2), n)
+              for m, t, c, a, n in db.session.execute(sqlalchemy.text(
+                  'SELECT month, type, category, amount, txn_count FROM revenue_monthly'))}
+    drift = []
+    for key in sorted(summed.keys() | stored.keys()):
+        expected = summed.get(key, (0.0, 0))
+        actual = stored.get(key, (0.0, 0))
+        if abs(expected[0] - actual[0]) >= 0.005 or expected[1] != actual[1]:
+            drift.append({'key': key, 'expected': expected, 'actual': actual})
+    return drift
+
+
+def monthly_totals() -> list[tuple[str, str, str, float]]:
+    """Every rollup row as (month, type, category, amount)"""
+    return [(m, t, c, float(a)) for m, t, c, a in db.session.execute(sqlalchemy.text(
+        'SELECT month, type, category, amount FROM revenue_monthly'))]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Monthly revenue rollup")
+    parser.add_argument('command', choices=('verify', 'rebuild'))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    from app import create_app
+    app = create_app(startup_jobs=False)
+    with app.app_context():
+        if args.command == 'rebuild':
+            rebuild(db.session)
+            db.session.commit()
+        drift = verify()
+        for d in drift:
+            print(f"{'/'.join(d['key'])}: expected (amount, count)={d['expected']}"
+                  f" rollup={d['actual']}")
+        print(f"{len(drift)} rollup row(s) drifted")
+    return 1 if drift else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,191 @@
+"""Daily RFID log rollups and the retention job that keeps rfid_logs small.
+
+Every tap writes at least two rfid_logs rows ("processing" + the outcome) and
+nothing ever deleted them, so the table only grew: dashboard counters scanned
+it and the log view paged through all of it. The rollup keeps per-day,
+per-action counts (success / fail / distinct cards) current as rows are
+written, and the retention job then prunes (optionally archiving) raw rows
+older than RFID_LOG_RETENTION_DAYS in small batches.
+
+    python -m app.rfid_rollup prune      # what the cron endpoint runs
+    python -m app.rfid_rollup rebuild    # recount days that still have raw rows
+"""
+
+import argparse
+import csv
+import gzip
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+
+import sqlalchemy
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import db
+from app.models import RFIDLog, RFIDLogDaily, RFIDLogDailyCard
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FIELDS = ('id', 'rfid_uid', 'student_id', 'scan_time', 'action_taken',
+                  'success', 'error_message')
+
+
+def record_batch(rows: list):
+    """Fold a batch of new rfid_logs rows into the rollup. Call inside the
+    transaction that inserts them, so the two never disagree.
+
+    `rows` are the dicts passed to insert(RFIDLog) (scan_time a datetime).
+    """
+    if not rows:
+        return
+    totals = {}  # (day, action) -> [success, fail]
+    cards = set()
+    for row in rows:
+        key = (row['scan_time'].date(), row.get('action_taken') or '')
+        counts = totals.setdefault(key, [0, 0])
+        counts[0 if row.get('success') else 1] += 1
+        cards.add(key + (row['rfid_uid'],))
+
+    stmt = sqlite_insert(RFIDLogDaily).values([
+        {'day': day, 'action_taken': action, 'success_count': ok, 'fail_count': failed,
+         'distinct_cards': 0}
+        for (day, action), (ok, failed) in totals.items()])
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['day', 'action_taken'],
+        set_={'success_count': RFIDLogDaily.success_count + stmt.excluded.success_count,
+              'fail_count': RFIDLogDaily.fail_count + stmt.excluded.fail_count}))
+    db.session.execute(sqlite_insert(RFIDLogDailyCard).values([
+        {'day': day, 'action_taken': action, 'rfid_uid': uid}
+        for day, action, uid in cards]).on_conflict_do_nothing())
+    # Recount only the days this batch touched (a handful of rows each).
+    db.session.execute(sqlalchemy.text(
+        'UPDATE rfid_log_daily SET distinct_cards = ('
+        ' SELECT COUNT(*) FROM rfid_log_daily_cards c'
+        ' WHERE c.day = rfid_log_daily.day AND c.action_taken = rfid_log_daily.action_taken)'
+        ' WHERE day IN :days').bindparams(sqlalchemy.bindparam('days', expanding=True)),
+        {'days': sorted({day.isoformat() for day, _ in totals})})
+
+
+def rebuild(conn):
+    """Recount the rollup for every day that still has raw rows. Days already
+    pruned keep their counts. `conn` is a Connection or Session."""
+    raw_days = 'SELECT DISTINCT date(scan_time) FROM rfid_logs'
+    conn.execute(sqlalchemy.text(f'DELETE FROM rfid_log_daily WHERE day IN ({raw_days})'))
+    conn.execute(sqlalchemy.text(f'DELETE FROM rfid_log_daily_cards WHERE day IN ({raw_days})'))
+    conn.execute(sqlalchemy.text(
+        'INSERT INTO rfid_log_daily_cards (day, action_taken, rfid_uid)'
+        " SELECT DISTINCT date(scan_time), COALESCE(action_taken, ''), rfid_uid FROM rfid_logs"))
+    conn.execute(sqlalchemy.text(
+        'INSERT INTO rfid_log_daily'
+        ' (day, action_taken, success_count, fail_count, distinct_cards)'
+        " SELECT date(scan_time), COALESCE(action_taken, ''),"
+        '  SUM(CASE WHEN success THEN 1 ELSE 0 END),'
+        '  SUM(CASE WHEN success THEN 0 ELSE 1 END),'
+        '  COUNT(DISTINCT rfid_uid)'
+        ' FROM rfid_logs GROUP BY 1, 2'))
+
+
+def daily_counts(day: date) -> dict:
+    """{action: {'success', 'fail', 'cards'}} for one day, from the rollup"""
+    rows = RFIDLogDaily.query.filter_by(day=day).all()
+    return {r.action_taken: {'success': r.success_count, 'fail': r.fail_count,
+                             'cards': r.distinct_cards} for r in rows}
+
+
+def prune(days: int, batch_size: int = 500, archive_dir: str | None = None,
+          today: date | None = None, pause: float = 0.05) -> dict:
+    """Delete rfid_logs rows from before `days` days ago, `batch_size` rows
+    per transaction so the RFID log writer (and check-ins) never wait long
+    on the write lock. Whole days only, so the rollup stays exact.
+
+    Args:
+        days: Days of raw rows to keep; 0 or less keeps everything
+        batch_size: Rows deleted per commit
+        archive_dir: If set, rows are appended to a gzipped CSV per scan day
+            (rfid_logs-YYYY-MM-DD.csv.gz) before they are deleted
+        today: Injectable for testing (defaults to the real date)
+        pause: Seconds to yield between batches
+
+    Returns:
+        {'deleted', 'archived', 'batches', 'cutoff'}
+    """
+    result = {'deleted': 0, 'archived': 0, 'batches': 0, 'cutoff': None}
+    if days <= 0:
+        return result
+    cutoff = datetime.combine((today or date.today()) - timedelta(days=days), datetime.min.time())
+    result['cutoff'] = cutoff.date().isoformat()
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+    while True:
+        # Oldest first along ix_rfid_logs_scan_time (scan_time, then rowid).
+        batch = (RFIDLog.query.filter(RFIDLog.scan_time < cutoff)
+                 .order_by(RFIDLog.scan_time, RFIDLog.id).limit(batch_size).all())
+        if not batch:
+            break
+        if archive_dir:
+            _archive(archive_dir, batch)
+            result['archived'] += len(batch)
+        RFIDLog.query.filter(RFIDLog.id.in_([r.id for r in batch])).delete(
+            synchronize_session=False)
+        db.session.commit()
+        result['deleted'] += len(batch)
+        result['batches'] += 1
+        if len(batch) < batch_size:
+            break
+        time.sleep(pause)
+    # Closed days' counts are final; their card lists are no longer needed.
+    RFIDLogDailyCard.query.filter(RFIDLogDailyCard.day < cutoff.date()).delete(
+        synchronize_session=False)
+    db.session.commit()
+    if result['deleted']:
+        logger.info("RFID log retention: deleted %d row(s) before %s in %d batch(es)",
+                    result['deleted'], result['cutoff'], result['batches'])
+    return result
+
+
+def _archive(archive_dir: str, batch: list):
+    by_day = {}
+    for row in batch:
+        by_day.setdefault(row.scan_time.date(), []).append(row)
+    for day, rows in by_day.items():
+        path = os.path.join(archive_dir, f'rfid_logs-{day.isoformat()}.csv.gz')
+        is_new = not os.path.exists(path)
+        # Appending makes a multi-member gzip, which gunzip/zcat read as one file.
+        with gzip.open(path, 'at', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            if is_new:
+                writer.writerow(ARCHIVE_FIELDS)
+            for r in rows:
+                writer.writerow([r.id, r.rfid_uid, r.student_id, r.scan_time.isoformat(),
+                                 r.action_taken, int(bool(r.success)), r.error_message])
+
+
+def run_retention():
+    """Retention with the app's settings (cron endpoint / CLI)"""
+    from flask import current_app
+    config = current_app.config
+    return prune(config.get('RFID_LOG_RETENTION_DAYS', 90),
+                 batch_size=config.get('RFID_LOG_PRUNE_BATCH', 500),
+                 archive_dir=config.get('RFID_LOG_ARCHIVE_DIR') or None)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="RFID log rollup / retention")
+    parser.add_argument('command', choices=('prune', 'rebuild'))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    from app import create_app
+    app = create_app(startup_jobs=False)
+    with app.app_context():
+        if args.command == 'prune':
+            print(run_retention())
+        else:
+            rebuild(db.session)
+            db.session.commit()
+            print(f"rebuilt {RFIDLogDaily.query.count()} rollup row(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,188 @@
+"""Full-text search index (SQLite FTS5) over students, families and classes.
+
+The topbar typeahead and the students page matched `LIKE '%q%'` on names and
+emails: a full table scan per keystroke, ranked alphabetically. search_index
+holds one row per student (name; own and parent emails and phones), family
+(name, email, phone) and class (name), kept in sync by triggers on the three
+tables, and is queried with prefix terms ranked by bm25 -- name hits first.
+
+FTS5 is an SQLite compile-time option. Without it the index and its triggers
+are not created (and stale triggers are dropped, since a write would fail on
+them), and search falls back to LIKE.
+
+    python -m app.search rebuild   # repopulate the index from the tables
+"""
+
+import argparse
+import logging
+import re
+
+import sqlalchemy
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# rowid = entity id * 3 + kind code, so a trigger finds its row by rowid.
+KINDS = {'student': 0, 'family': 1, 'class': 2}
+
+# bm25 weights per column (kind, name, contact): a name hit outranks an
+# email or phone hit.
+_RANK = 'bm25(search_index, 0.0, 10.0, 1.0)'
+
+
+def _digits(col: str) -> str:
+    """`col` without phone punctuation, so 5551234567 finds (555) 123-4567"""
+    expr = f"COALESCE({col}, '')"
+    for ch in ('-', ' ', '(', ')', '.', '+'):
+        expr = f"REPLACE({expr}, '{ch}', '')"
+    return expr
+
+
+def _joined(*exprs: str) -> str:
+    return " || ' ' || ".join(f"COALESCE({e}, '')" for e in exprs)
+
+
+# (table, kind, name expression, contact expression, columns they read), with
+# {t} for the row alias.
+_SOURCES = [
+    ('students', 'student', "{t}.first_name || ' ' || {t}.last_name",
+     _joined('{t}.email', '{t}.parent_email', '{t}.phone', '{t}.parent_phone',
+             _digits('{t}.phone'), _digits('{t}.parent_phone')),
+     'first_name, last_name, email, parent_email, phone, parent_phone'),
+    ('families', 'family', '{t}.name',
+     _joined('{t}.primary_email', '{t}.primary_phone', _digits('{t}.primary_phone')),
+     'name, primary_email, primary_phone'),
+    ('classes', 'class', '{t}.name', "''", 'name'),
+]
+
+
+def _insert(t: str, kind: str, name: str, contact: str) -> str:
+    return ('INSERT INTO search_index (rowid, kind, name, contact)'
+            f" VALUES ({t}.id * 3 + {KINDS[kind]}, '{kind}',"
+            f" {name.format(t=t)}, {contact.format(t=t)});")
+
+
+def _delete(t: str, kind: str) -> str:
+    return f'DELETE FROM search_index WHERE rowid = {t}.id * 3 + {KINDS[kind]};'
+
+
+TRIGGERS = {}
+for _table, _kind, _name, _contact, _columns in _SOURCES:
+    TRIGGERS[f'trg_search_{_table}_insert'] = (
+        f'AFTER INSERT ON {_table} BEGIN {_insert("NEW", _kind, _name, _contact)} END')
+    TRIGGERS[f'trg_search_{_table}_update'] = (
+        f'AFTER UPDATE OF {_columns} ON {_table} BEGIN '
+        f'{_delete("OLD", _kind)} {_insert("NEW", _kind, _name, _contact)} END')
+    TRIGGERS[f'trg_search_{_table}_delete'] = (
+        f'AFTER DELETE ON {_table} BEGIN {_delete("OLD", _kind)} END')
+
+_available = None
+
+
+def fts5_supported(conn) -> bool:
+    """Whether this SQLite build has FTS5 (tries a throwaway temp table)"""
+    try:
+        conn.execute(sqlalchemy.text('CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(x)'))
+        conn.execute(sqlalchemy.text('DROP TABLE temp.fts5_probe'))
+        return True
+    except sqlalchemy.exc.OperationalError:
+        return False
+
+
+def install(conn) -> bool:
+    """Create the index, any missing trigger, and replace any trigger whose
+    definition has since changed. True if the index may be missing rows (or
+    hold stale ones) and needs a rebuild. Without FTS5, drops our triggers
+    and returns False."""
+    global _available
+    _available = None
+    existing = dict(conn.execute(sqlalchemy.text(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger'"
+        " AND name LIKE 'trg_search_%'")).all())
+    if not fts5_supported(conn):
+        for name in existing.keys() & TRIGGERS.keys():
+            conn.execute(sqlalchemy.text(f'DROP TRIGGER {name}'))
+        logger.warning("SQLite has no FTS5; search falls back to LIKE")
+        return False
+    conn.execute(sqlalchemy.text(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5('
+        "kind UNINDEXED, name, contact, tokenize = 'unicode61 remove_diacritics 2',"
+        " prefix = '2 3')"))
+    changed = False
+    for name, ddl in TRIGGERS.items():
+        sql = f'CREATE TRIGGER {name} {ddl}'
+        if existing.get(name) == sql:
+            continue
+        if name in existing:
+            conn.execute(sqlalchemy.text(f'DROP TRIGGER {name}'))
+        conn.execute(sqlalchemy.text(sql))
+        changed = True
+    return changed
+
+
+def rebuild(conn):
+    """Repopulate the index from students, families and classes. `conn` is a
+    Connection or Session; the caller commits."""
+    conn.execute(sqlalchemy.text('DELETE FROM search_index'))
+    for table, kind, name, contact, _ in _SOURCES:
+        conn.execute(sqlalchemy.text(
+            'INSERT INTO search_index (rowid, kind, name, contact)'
+            f" SELECT t.id * 3 + {KINDS[kind]}, '{kind}', {name.format(t='t')},"
+            f" {contact.format(t='t')} FROM {table} t"))
+
+
+def available() -> bool:
+    """True if search_index exists and this SQLite can query it (cached)"""
+    global _available
+    if _available is None:
+        try:
+            db.session.execute(sqlalchemy.text('SELECT rowid FROM search_index LIMIT 0'))
+            _available = True
+        except sqlalchemy.exc.OperationalError:
+            db.session.rollback()
+            _available = False
+    return _available
+
+
+def match_expression(q: str) -> str | None:
+    """FTS5 query for `q`: every word as a prefix, all required
+    ('jo smi' -> '"jo"* "smi"*'). None if `q` has no words."""
+    words = re.findall(r'\w+', q or '')
+    return ' '.join(f'"{w}"*' for w in words[:8]) or None
+
+
+def ranked(kind: str, q: str):
+    """Subquery of (id, rank) for `kind` entities matching `q`, best first
+    when ordered by rank. None if search_index can't be used for `q` -- the
+    caller falls back to LIKE."""
+    expr = match_expression(q)
+    if expr is None or not available():
+        return None
+    return sqlalchemy.text(
+        f'SELECT rowid / 3 AS id, {_RANK} AS rank FROM search_index'
+        ' WHERE search_index MATCH :match AND kind = :kind'
+    ).bindparams(match=expr, kind=kind).columns(
+        id=sqlalchemy.Integer, rank=sqlalchemy.Float).subquery()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Search index")
+    parser.add_argument('command', choices=('rebuild',))
+    parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    from app import create_app
+    app = create_app(startup_jobs=False)
+    with app.app_context():
+        if not available():
+            print("search_index unavailable (no FTS5)")
+            return 1
+        rebuild(db.session)
+        db.session.commit()
+        count = db.session.execute(sqlalchemy.text('SELECT COUNT(*) FROM search_index')).scalar()
+        print(f"indexed {count} row(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,117 @@
+"""Studio settings, kept in memory so Setting.get doesn't hit SQLite."""
+
+import logging
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class SettingsCache:
+    """Process-wide snapshot of the settings table ({key: value}).
+
+    Setting.get / get_bool ran a SELECT per call: ~10 per parent payment-page
+    view, and three lookups plus three Fernet decrypts per SMS in the reminder
+    loop. This loads the whole table in ONE query and serves reads from it
+    until `version` moves on. Setting.set bumps the version, and so do the
+    commit hooks below on any ORM write to a Setting row. Decrypted secrets
+    (`secret()`) are memoized with the snapshot, so they go when it does.
+
+    A snapshot belongs to one engine (the test harnesses run apps on separate
+    databases in one process). Writes the hooks can't see -- raw SQL, another
+    process such as a CLI run -- show up within MAX_AGE seconds; call
+    `invalidate()` after one to see it at once.
+    """
+
+    MAX_AGE = 60.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0
+        self._loaded = None  # (engine, version, loaded at monotonic)
+        self._values = {}
+        self._secrets = {}
+        self.loads = 0
+
+    def _current(self) -> dict:
+        """The snapshot, reloaded if stale"""
+        engine = db.engine
+        with self._lock:
+            loaded = self._loaded
+            if (loaded is not None and loaded[0] is engine and loaded[1] == self.version
+                    and time.monotonic() - loaded[2] < self.MAX_AGE):
+                return self._values
+            version = self.version
+        from app.models import Setting
+        values = dict(db.session.query(Setting.key, Setting.value).all())
+        with self._lock:
+            # A bump while we were reading leaves the snapshot marked stale.
+            self._values = values
+            self._secrets = {}
+            self._loaded = (engine, version, time.monotonic())
+            self.loads += 1
+        logger.debug("Loaded %d setting(s) (version %d)", len(values), version)
+        return values
+
+    def get(self, key: str):
+        """The stored value, or None if the key isn't set"""
+        return self._current().get(key)
+
+    def secret(self, key: str) -> str:
+        """The decrypted value of an encrypted setting ('' if unset or
+        unreadable), decrypted once per snapshot"""
+        from flask import current_app
+
+        from app.crypto import decrypt
+        stored = self.get(key) or ''
+        memo_key = (key, stored, current_app.config.get('SECRET_KEY'))
+        with self._lock:
+            if memo_key in self._secrets:
+                return self._secrets[memo_key]
+        plain = decrypt(stored)
+        with self._lock:
+            self._secrets[memo_key] = plain
+        return plain
+
+    def bump(self):
+        """Mark the snapshot stale; the next read reloads it."""
+        with self._lock:
+            self.version += 1
+
+    def invalidate(self):
+        """After a settings write the hooks can't see (raw SQL)."""
+        self.bump()
+
+
+settings_cache = SettingsCache()
+
+
+# ── Commit hooks ────────────────────────────────────────────────────
+# Same arrangement as app/checkins.py: note a Setting write at flush time,
+# bump the version once it commits. A rollback bumps too: a read between the
+# flush and the rollback may have loaded the uncommitted value into the
+# snapshot.
+
+@event.listens_for(Session, 'after_flush')
+def _note_settings_changes(session, flush_context):
+    from app.models import Setting
+    if any(isinstance(obj, Setting)
+           for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info['settings_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_settings_changes(session):
+    if session.info.pop('settings_changed', False):
+        settings_cache.bump()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _drop_settings_changes(session, previous_transaction):
+    if not previous_transaction.nested and session.info.pop('settings_changed', False):
+        settings_cache.bump()
@@ -15,10 +15,9 @@ TWILIO_API = "https://api.twilio.com/2010-04-01/Accounts/{sid}/Messages.json"
 
 
 def _creds():
-    from app.crypto import decrypt
     from app.models import Setting
-    sid = decrypt(Setting.get('sms_twilio_sid', ''))
-    token = decrypt(Setting.get('sms_twilio_token', ''))
+    sid = Setting.get_secret('sms_twilio_sid')
+    token = Setting.get_secret('sms_twilio_token')
     from_number = Setting.get('sms_from_number', '')
     return sid, token, from_number
 
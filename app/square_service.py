@@ -15,11 +15,9 @@ from flask import current_app
 
 def get_access_token():
     """Square access token — from Settings (decrypted) first, env as fallback."""
-    from app.crypto import decrypt
     from app.models import Setting
-    stored = Setting.get('payments_square_access_token', '')
-    if stored:
-        return decrypt(stored)
+    if Setting.get('payments_square_access_token', ''):
+        return Setting.get_secret('payments_square_access_token')
     return current_app.config.get('SQUARE_ACCESS_TOKEN')
 
 
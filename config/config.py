@@ -45,6 +45,31 @@ class Config:
     RFID_SPI_DEV = int(os.environ.get('RFID_SPI_DEV', 0))
     RFID_SPI_SPEED = int(os.environ.get('RFID_SPI_SPEED', 1000000))
     RFID_RST_PIN = int(os.environ.get('RFID_RST_PIN', 25))
+    # One reader per door: "spi_dev:rst_pin[:location_id],..." (e.g. "0:25:1,1:24:2").
+    # Empty = a single reader on RFID_SPI_DEV / RFID_RST_PIN.
+    RFID_READERS = os.environ.get('RFID_READERS', '')
+    # Commit a burst of queued taps' attendance rows in one transaction
+    RFID_BURST_MODE = os.environ.get('RFID_BURST_MODE', 'false').lower() == 'true'
+    # "uid" reads just the card's UID per tap; "full" also reads the text
+    # blocks (SimpleMFRC522.read_no_block). See rfid/reader.py.
+    RFID_READ_MODE = os.environ.get('RFID_READ_MODE', 'uid').lower()
+    # "decimal" matches cards enrolled with SimpleMFRC522; "hex" is the printed UID.
+    RFID_UID_ENCODING = os.environ.get('RFID_UID_ENCODING', 'decimal').lower()
+    # Control socket of the standalone RFID daemon (python -m rfid.daemon).
+    # Set it for both processes; empty = the RFID service runs in-process.
+    RFID_SOCKET = os.environ.get('RFID_SOCKET', '')
+    # Raw rfid_logs rows older than this many days are pruned by the cron job
+    # (daily counts are kept in rfid_log_daily); 0 keeps them forever.
+    RFID_LOG_RETENTION_DAYS = int(os.environ.get('RFID_LOG_RETENTION_DAYS', 90))
+    RFID_LOG_PRUNE_BATCH = int(os.environ.get('RFID_LOG_PRUNE_BATCH', 500))
+    # If set, pruned rows are appended to gzipped CSVs here first.
+    RFID_LOG_ARCHIVE_DIR = os.environ.get('RFID_LOG_ARCHIVE_DIR', '')
+    
+    # Staff live-update stream (/api/events/stream). Each open stream holds a
+    # gunicorn thread, so cap them and recycle them periodically.
+    EVENT_STREAM_MAX_CLIENTS = int(os.environ.get('EVENT_STREAM_MAX_CLIENTS', 4))
+    EVENT_STREAM_MAX_SECONDS = int(os.environ.get('EVENT_STREAM_MAX_SECONDS', 300))
+    EVENT_STREAM_HEARTBEAT = int(os.environ.get('EVENT_STREAM_HEARTBEAT', 15))
     
     # Application settings
     APP_NAME = 'LSO Dance'
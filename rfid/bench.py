@@ -0,0 +1,527 @@
+"""
+Benchmarks for the RFID check-in path, driven by MockRFIDReader
+
+Run:  RFID_ENABLED=false python -m rfid.bench polling [--seconds 20]
+      RFID_ENABLED=false python -m rfid.bench read [--reads 500] [--command-ms 3]
+      RFID_ENABLED=false python -m rfid.bench load [--students 3000] [--mode both]
+
+Uses a throwaway SQLite DB unless DATABASE_URL is already set.
+"""
+
+import argparse
+import csv
+import logging
+import os
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+# Setup a throwaway DB before anything imports config.
+if 'DATABASE_URL' not in os.environ:
+    _tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    _tmp.close()
+    os.environ['DATABASE_URL'] = f"sqlite:///{_tmp.name}"
+os.environ.setdefault('RFID_ENABLED', 'false')
+
+from sqlalchemy import func, insert  # noqa: E402
+
+from app import db  # noqa: E402
+from app.checkins import todays_checkins  # noqa: E402
+from app.models import ClassEnrollment, DanceClass, RFIDLog, Student, User  # noqa: E402
+from rfid.debounce import RecentScans  # noqa: E402
+from rfid.metrics import Histogram  # noqa: E402
+from rfid.polling import AdaptivePoller  # noqa: E402
+from rfid.reader import MockRFIDReader, RFIDReader  # noqa: E402
+from rfid.service import RFIDService  # noqa: E402
+
+# Prefix for everything the load benchmark seeds, so its rows are easy to spot
+BENCH_PREFIX = 'LOADBENCH'
+
+
+def _burst_taps(seconds: float, burst_every: float = 8.0, burst_size: int = 5,
+                spacing: float = 0.7) -> list:
+    """Tap offsets (s): a few students in a row, then a quiet gap, repeated"""
+    taps = []
+    t = 1.0
+    while t < seconds - burst_size * spacing - 1:
+        taps.extend(t + i * spacing for i in range(burst_size))
+        t += burst_every
+    return taps
+
+
+def _old_loop_poller() -> AdaptivePoller:
+    """The old loop: read_card(timeout=0.1) then sleep(0.5) -> ~0.6s per poll"""
+    return AdaptivePoller(fast_interval=0.6, class_interval=0.6, idle_interval=0.6,
+                          max_interval=0.6)
+
+
+def run_polling_scenario(service: RFIDService, poller: AdaptivePoller,
+                         seconds: float, taps: list) -> dict:
+    """
+    Run the real listening loop against a MockRFIDReader and tap cards on it
+
+    Args:
+        service: Service whose loop is measured (its readers are replaced)
+        poller: Poll scheduler under test
+        seconds: How long to run
+        taps: Offsets in seconds at which a card is tapped
+
+    Returns:
+        Latency and wakeup numbers for the run
+    """
+    reader = MockRFIDReader()
+    service.readers = []
+    service.add_reader(reader, poller=poller)
+    loop = threading.Thread(target=service.start_listening, daemon=True, name="RFID-Bench")
+    loop.start()
+    started = time.monotonic()
+    for i, offset in enumerate(taps):
+        delay = started + offset - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        reader.present_card(f"BENCH{i:05d}")
+    remaining = started + seconds - time.monotonic()
+    if remaining > 0:
+        time.sleep(remaining)
+    elapsed = time.monotonic() - started
+    idle = poller.idle_wakeups_per_minute()
+    service.stop_listening()
+    loop.join(timeout=10)
+    latency = poller.latency_stats()
+    return {
+        'taps': len(taps),
+        'detected': latency['samples'],
+        'avg_ms': latency['avg_ms'],
+        'max_ms': latency['max_ms'],
+        'idle_wakeups_per_min': round(idle * 60 / min(elapsed, 60), 1),
+    }
+
+
+def bench_polling(seconds: float = 20.0) -> dict:
+    """Old fixed cadence vs the adaptive poller, in and out of class windows"""
+    service = RFIDService()
+    taps = _burst_taps(seconds)
+    scenarios = {
+        'fixed 0.6s (old loop)': _old_loop_poller(),
+        'adaptive, class window open': AdaptivePoller(in_class_window=lambda: True),
+        'adaptive, off hours': AdaptivePoller(in_class_window=lambda: False),
+    }
+    results = {name: run_polling_scenario(service, poller, seconds, taps)
+               for name, poller in scenarios.items()}
+    # Nobody tapping, no class on: where the overnight wakeups come from.
+    results['fixed 0.6s, empty studio'] = run_polling_scenario(
+        service, _old_loop_poller(), seconds, [])
+    results['adaptive, empty studio'] = run_polling_scenario(
+        service, AdaptivePoller(in_class_window=lambda: False), seconds, [])
+    return results
+
+
+class FakeMFRC522:
+    """Stand-in for mfrc522.MFRC522 (the chip driver): answers like one card
+    held on the antenna and charges `command_seconds` per command sent to the
+    card -- each is a burst of SPI register writes plus polling for the
+    answer, which is what a read actually costs on the Pi"""
+
+    MI_OK = 0
+    MI_NOTAGERR = 1
+    PICC_REQIDL = 0x26
+    PICC_AUTHENT1A = 0x60
+
+    def __init__(self, uid=(0x8A, 0x3C, 0x5E, 0x21), command_seconds: float = 0.003):
+        self.uid = list(uid) + [uid[0] ^ uid[1] ^ uid[2] ^ uid[3]]  # + check byte
+        self.command_seconds = command_seconds
+        self.commands = 0
+
+    def _command(self):
+        self.commands += 1
+        if self.command_seconds:
+            time.sleep(self.command_seconds)
+
+    def MFRC522_Request(self, req_mode):
+        self._command()
+        return self.MI_OK, 0x10
+
+    def MFRC522_Anticoll(self):
+        self._command()
+        return self.MI_OK, list(self.uid)
+
+    def MFRC522_SelectTag(self, ser_num):
+        self._command()
+        return 0x08
+
+    def MFRC522_Auth(self, auth_mode, block_addr, sector_key, ser_num):
+        self._command()
+        return self.MI_OK
+
+    def MFRC522_Read(self, block_addr):
+        self._command()
+        return [ord(c) for c in f"block {block_addr}".ljust(16)]
+
+    def MFRC522_StopCrypto1(self):
+        self._command()
+
+
+class FakeSimpleMFRC522:
+    """SimpleMFRC522 over a FakeMFRC522; read_no_block does what the
+    library's does (request, anticollision, select, auth, 3 block reads)"""
+
+    KEY = [0xFF] * 6
+    BLOCK_ADDRS = [8, 9, 10]
+
+    def __init__(self, chip: FakeMFRC522):
+        self.READER = chip
+
+    def read_no_block(self):
+        chip = self.READER
+        status, _ = chip.MFRC522_Request(chip.PICC_REQIDL)
+        if status != chip.MI_OK:
+            return None, None
+        status, uid = chip.MFRC522_Anticoll()
+        if status != chip.MI_OK:
+            return None, None
+        number = 0
+        for byte in uid[:5]:
+            number = number * 256 + byte
+        chip.MFRC522_SelectTag(uid)
+        data = []
+        if chip.MFRC522_Auth(chip.PICC_AUTHENT1A, 11, self.KEY, uid) == chip.MI_OK:
+            for block in self.BLOCK_ADDRS:
+                data += chip.MFRC522_Read(block) or []
+        chip.MFRC522_StopCrypto1()
+        return number, ''.join(chr(i) for i in data)
+
+
+def bench_read_modes(reads: int = 500, command_ms: float = 3.0) -> dict:
+    """
+    Per-read cost of RFIDReader.poll in each read mode, against a fake chip
+
+    Args:
+        reads: Polls per mode (a card is always present)
+        command_ms: Simulated cost of one command to the card
+
+    Returns:
+        {mode: {'uid', 'commands_per_read', 'mean_ms', 'reads_per_s'}}
+    """
+    results = {}
+    for mode in ('full', 'uid'):
+        chip = FakeMFRC522(command_seconds=command_ms / 1000)
+        reader = RFIDReader(read_mode=mode, device=FakeSimpleMFRC522(chip))
+        uid = None
+        started = time.perf_counter()
+        for _ in range(reads):
+            uid, _ = reader.poll()
+        elapsed = time.perf_counter() - started
+        results[mode] = {
+            'uid': uid,
+            'commands_per_read': chip.commands / reads,
+            'mean_ms': round(elapsed / reads * 1000, 3),
+            'reads_per_s': round(reads / elapsed, 1) if elapsed else None,
+        }
+    return results
+
+
+def seed_studio(app, students: int = 3000, classes: int = 60,
+                classes_per_student: int = 2, seed: int = 1) -> dict:
+    """
+    Seed a synthetic studio: students with cards, a weekly schedule spread
+    over every weekday (afternoons and evenings), and active enrollments.
+    Bulk inserts, so thousands of rows take a second or two.
+
+    Args:
+        app: Flask app whose database gets the rows
+        students: Students to create, each with an rfid_uid
+        classes: Weekly classes to create
+        classes_per_student: Active enrollments per student
+        seed: Random seed (same seed -> same studio)
+
+    Returns:
+        Row counts created
+    """
+    rng = random.Random(seed)
+    with app.app_context():
+        instructor_id = db.session.query(User.id).filter_by(is_admin=True).order_by(User.id).scalar()
+        first_class = (db.session.query(func.max(DanceClass.id)).scalar() or 0) + 1
+        class_rows = []
+        for i in range(classes):
+            start = dtime(15 + (i // 7) % 6, rng.choice((0, 15, 30, 45)))
+            end = (datetime.combine(date.today(), start) + timedelta(minutes=45)).time()
+            class_rows.append({'id': first_class + i, 'name': f"{BENCH_PREFIX} Class {i}",
+                               'day_of_week': i % 7, 'start_time': start, 'end_time': end,
+                               'instructor_id': instructor_id, 'max_students': students})
+        db.session.execute(insert(DanceClass), class_rows)
+
+        first_student = (db.session.query(func.max(Student.id)).scalar() or 0) + 1
+        student_rows = [{'id': first_student + i, 'first_name': 'Load', 'last_name': f"Bench{i}",
+                         'rfid_uid': f"{BENCH_PREFIX}{i:06d}"} for i in range(students)]
+        db.session.execute(insert(Student), student_rows)
+
+        class_ids = [row['id'] for row in class_rows]
+        enrollment_rows = [{'student_id': row['id'], 'class_id': cid}
+                           for row in student_rows
+                           for cid in rng.sample(class_ids, min(classes_per_student, len(class_ids)))]
+        db.session.execute(insert(ClassEnrollment), enrollment_rows)
+        db.session.commit()
+    return {'students': len(student_rows), 'classes': len(class_rows),
+            'enrollments': len(enrollment_rows)}
+
+
+def generate_trace(app, speed: float = 60.0, unknown_ratio: float = 0.01,
+                   double_tap_ratio: float = 0.05, seed: int = 1) -> list:
+    """
+    Build a tap trace from today's schedule: each class's enrolled students
+    tap in a burst around its start (mostly 0-20 minutes early, a few late),
+    plus some unknown cards and some nervous double taps.
+
+    Args:
+        app: Flask app to read the schedule from
+        speed: Time compression (60 = an hour of taps per minute; 0 = all at once)
+        unknown_ratio: Share of extra taps from cards nobody owns
+        double_tap_ratio: Share of taps repeated a second or two later
+        seed: Random seed
+
+    Returns:
+        [(offset_seconds, uid), ...] sorted by offset
+    """
+    rng = random.Random(seed)
+    with app.app_context():
+        rows = db.session.query(DanceClass.start_time, Student.rfid_uid).join(
+            ClassEnrollment, ClassEnrollment.class_id == DanceClass.id
+        ).join(Student, Student.id == ClassEnrollment.student_id).filter(
+            DanceClass.day_of_week == date.today().weekday(),
+            DanceClass.is_active.is_(True), ClassEnrollment.is_active.is_(True),
+            Student.is_active.is_(True), Student.rfid_uid.isnot(None),
+        ).all()
+    taps = []
+    for start, uid in rows:
+        start_s = start.hour * 3600 + start.minute * 60
+        at = start_s - min(30 * 60, max(-15 * 60, rng.gauss(8 * 60, 6 * 60)))
+        taps.append((at, uid))
+        if rng.random() < double_tap_ratio:
+            taps.append((at + rng.uniform(0.5, 2.0), uid))
+    for i in range(int(len(rows) * unknown_ratio)):
+        taps.append((rng.choice(taps)[0] + rng.uniform(0, 60), f"{BENCH_PREFIX}-UNKNOWN{i}"))
+    taps.sort()
+    if not taps:
+        return []
+    t0 = taps[0][0]
+    return [((at - t0) / speed if speed else 0.0, uid) for at, uid in taps]
+
+
+def save_trace(path: str, trace: list):
+    """Write a trace as offset_seconds,uid CSV"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('offset_seconds', 'uid'))
+        writer.writerows((f"{offset:.3f}", uid) for offset, uid in trace)
+
+
+def load_trace(path: str) -> list:
+    """Read an offset_seconds,uid CSV trace (recorded or saved by save_trace)"""
+    with open(path, newline='') as f:
+        trace = [(float(row['offset_seconds']), row['uid']) for row in csv.DictReader(f)]
+    return sorted(trace, key=lambda tap: tap[0])  # stable: simultaneous taps keep file order
+
+
+def _outcomes(app, since: datetime) -> dict:
+    """RFID log outcomes written since `since`, by action"""
+    with app.app_context():
+        rows = db.session.query(RFIDLog.action_taken, func.count(RFIDLog.id)).filter(
+            RFIDLog.scan_time >= since, RFIDLog.action_taken != 'processing'
+        ).group_by(RFIDLog.action_taken).all()
+    return dict(rows)
+
+
+def replay_simulated(service: RFIDService, trace: list, concurrency: int = 4) -> dict:
+    """
+    Replay a trace through simulate_scan from `concurrency` threads (think
+    API requests / doors arriving at once), each tap at its trace offset
+
+    Returns:
+        Throughput, latency (due -> done, includes queueing) and service
+        time percentiles, outcomes and lock errors
+    """
+    app = service._get_app()
+    since = datetime.now()
+    lock_errors = service.lock_errors
+    latency, service_time = Histogram(), Histogram()
+    lock = threading.Lock()
+    work = queue.Queue()
+    started = time.monotonic()
+    for offset, uid in trace:
+        work.put((started + offset, uid))
+
+    def worker():
+        while True:
+            try:
+                due, uid = work.get_nowait()
+            except queue.Empty:
+                return
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            called = time.monotonic()
+            service.simulate_scan(uid)
+            done = time.monotonic()
+            with lock:
+                latency.observe((done - due) * 1000)
+                service_time.observe((done - called) * 1000)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    return {
+        'taps': len(trace),
+        'elapsed_s': round(elapsed, 2),
+        'taps_per_s': round(len(trace) / elapsed, 1) if elapsed else None,
+        'latency': latency.summary(),
+        'service_time': service_time.summary(),
+        'outcomes': _outcomes(app, since),
+        'lock_errors': service.lock_errors - lock_errors,
+    }
+
+
+def replay_readers(service: RFIDService, trace: list, readers: int = 1,
+                   timeout: float = 600.0) -> dict:
+    """
+    Replay a trace as taps on MockRFIDReaders under the real listening loop
+    (pollers, debounce, journal, log writer), spreading taps across readers
+
+    Returns:
+        Throughput, per-stage and detect latency, outcomes and lock errors
+    """
+    app = service._get_app()
+    since = datetime.now()
+    service.reset_timings()
+    mocks = [MockRFIDReader() for _ in range(readers)]
+    service.readers = []
+    for i, mock in enumerate(mocks):
+        service.add_reader(mock, name=f"mock{i}")
+    scans_before = service.total_scans
+    lock_errors = service.lock_errors
+    loop = threading.Thread(target=service.start_listening, daemon=True, name="RFID-Bench")
+    loop.start()
+    started = time.monotonic()
+    for i, (offset, uid) in enumerate(trace):
+        delay = started + offset - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        mocks[i % readers].present_card(uid)
+    deadline = time.monotonic() + timeout
+    while service.total_scans - scans_before < len(trace) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    elapsed = time.monotonic() - started
+    stats = service.get_stats()
+    service.stop_listening()
+    loop.join(timeout=10)
+    seen = service.total_scans - scans_before
+    return {
+        'taps': len(trace),
+        'seen': seen,
+        'elapsed_s': round(elapsed, 2),
+        'taps_per_s': round(seen / elapsed, 1) if elapsed else None,
+        'latency': stats['timings']['total'],
+        'detect_latency': stats['detect_latency'],
+        'timings': stats['timings'],
+        'outcomes': _outcomes(app, since),
+        'lock_errors': service.lock_errors - lock_errors,
+    }
+
+
+def bench_load(students: int = 3000, classes: int = 60, mode: str = 'both',
+               speed: float = 60.0, concurrency: int = 4, readers: int = 2,
+               trace_path: str = None, save_trace_path: str = None, seed: int = 1) -> dict:
+    """Seed a studio, build (or load) a trace, replay it, report the numbers"""
+    service = RFIDService()
+    app = service._get_app()
+    seeded = seed_studio(app, students, classes, seed=seed)
+    trace = load_trace(trace_path) if trace_path else generate_trace(app, speed, seed=seed)
+    if save_trace_path:
+        save_trace(save_trace_path, trace)
+    service._load_indexes()
+    results = {'seeded': seeded, 'trace_taps': len(trace)}
+    if mode in ('simulate', 'both'):
+        results['simulate_scan'] = replay_simulated(service, trace, concurrency)
+    if mode in ('reader', 'both'):
+        if mode == 'both':
+            # Same trace again: start from an empty attendance day, not all re-taps.
+            with app.app_context():
+                db.session.execute(db.text(
+                    "DELETE FROM attendance WHERE student_id IN "
+                    "(SELECT id FROM students WHERE rfid_uid LIKE :p)"), {'p': BENCH_PREFIX + '%'})
+                db.session.commit()
+            todays_checkins.invalidate()  # raw DELETE bypasses its commit hooks
+            service.recent_scans = RecentScans(service.duplicate_scan_window)
+        results['mock_readers'] = replay_readers(service, trace, readers)
+    return results
+
+
+def _print_load(results: dict):
+    seeded = results['seeded']
+    print(f"seeded {seeded['students']} students, {seeded['classes']} classes, "
+          f"{seeded['enrollments']} enrollments; trace: {results['trace_taps']} taps")
+    print(f"{'path':16} {'taps/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8} {'lock err':>9}  outcomes")
+    for name in ('simulate_scan', 'mock_readers'):
+        r = results.get(name)
+        if not r:
+            continue
+        lat = r['latency']
+        print(f"{name:16} {str(r['taps_per_s']):>8} {str(lat['p50_ms']):>8} {str(lat['p95_ms']):>8} "
+              f"{str(lat['p99_ms']):>8} {str(lat['max_ms']):>8} {r['lock_errors']:>9}  "
+              f"{r['outcomes']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest='bench', required=True)
+    polling = sub.add_parser('polling', help='tap-to-detect latency and idle wakeups')
+    polling.add_argument('--seconds', type=float, default=20.0,
+                         help='run time per scenario (default: 20)')
+    read = sub.add_parser('read', help='per-read cost of the UID-only vs full read')
+    read.add_argument('--reads', type=int, default=500, help='polls per mode')
+    read.add_argument('--command-ms', type=float, default=3.0,
+                      help='simulated cost of one command to the card (default: 3)')
+    load = sub.add_parser('load', help='seed a studio and replay a tap trace')
+    load.add_argument('--students', type=int, default=3000)
+    load.add_argument('--classes', type=int, default=60)
+    load.add_argument('--mode', choices=('simulate', 'reader', 'both'), default='both',
+                      help='simulate_scan threads, MockRFIDReaders under the loop, or both')
+    load.add_argument('--speed', type=float, default=60.0,
+                      help='trace time compression; 0 = replay as fast as possible')
+    load.add_argument('--concurrency', type=int, default=4, help='simulate_scan threads')
+    load.add_argument('--readers', type=int, default=2, help='mock readers')
+    load.add_argument('--trace', help='replay this offset_seconds,uid CSV instead')
+    load.add_argument('--save-trace', help='write the generated trace to this CSV')
+    load.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    # Per-tap service logging would swamp the report.
+    logging.basicConfig(level=logging.ERROR)
+
+    if args.bench == 'polling':
+        results = bench_polling(args.seconds)
+        print(f"{'scenario':32} {'taps':>5} {'seen':>5} {'avg ms':>8} {'max ms':>8} {'idle/min':>9}")
+        for name, r in results.items():
+            print(f"{name:32} {r['taps']:>5} {r['detected']:>5} {str(r['avg_ms']):>8} "
+                  f"{str(r['max_ms']):>8} {r['idle_wakeups_per_min']:>9}")
+    elif args.bench == 'read':
+        results = bench_read_modes(args.reads, args.command_ms)
+        print(f"{'mode':6} {'commands':>9} {'mean ms':>8} {'reads/s':>8}  uid")
+        for mode, r in results.items():
+            print(f"{mode:6} {r['commands_per_read']:>9} {r['mean_ms']:>8} "
+                  f"{str(r['reads_per_s']):>8}  {r['uid']}")
+    elif args.bench == 'load':
+        _print_load(bench_load(args.students, args.classes, args.mode, args.speed,
+                               args.concurrency, args.readers, args.trace, args.save_trace,
+                               args.seed))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Standalone RFID daemon: owns the readers, runs the check-in loop in its own
+process and answers the web app over a Unix control socket.
+
+    RFID_SOCKET=/home/pi/attenddance-rfid-system/data/rfid.sock python -m rfid.daemon
+
+Run it next to gunicorn with the same RFID_SOCKET (and DATABASE_URL). Under
+gunicorn the web process never polls a reader itself; /api/rfid/status,
+/api/rfid/simulate and the card/schedule index refreshes go over the socket.
+"""
+
+import argparse
+import logging
+import os
+import signal
+import sys
+import threading
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="AttenDANCE RFID daemon")
+    parser.add_argument('--socket', default=None,
+                        help="control socket path (default: RFID_SOCKET, else data/rfid.sock)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+    from app import create_app
+    from app.events import event_hub
+    from config.config import BASE_DIR
+    from rfid.ipc import RFIDControlServer
+    from rfid.service import get_rfid_service
+
+    # Its own app (and so its own DB engine/sessions); the web process runs
+    # the startup billing/reminder jobs, not us.
+    app = create_app(startup_jobs=False)
+    if not app.config.get('RFID_ENABLED', True):
+        logger.error("RFID_ENABLED is false; not starting the RFID daemon")
+        return 1
+    service = get_rfid_service()
+    service._app = app
+
+    path = (args.socket or app.config.get('RFID_SOCKET')
+            or os.path.join(BASE_DIR, 'data', 'rfid.sock'))
+    try:
+        server = RFIDControlServer(service, path, hub=event_hub)
+    except RuntimeError as e:
+        logger.error(str(e))
+        return 1
+    server.start()
+
+    def _stop(signum, frame):
+        logger.info(f"Received signal {signum}, shutting down")
+        # Not inline: the handler runs on the main thread, which may be inside
+        # the scan queue's lock that stop_listening needs.
+        threading.Thread(target=service.stop_listening, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    try:
+        # Blocks until stop_listening(); the readers' threads live in here.
+        service.start_listening()
+    finally:
+        server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Per-card debounce table for the RFID reader loop
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class RecentScans:
+    """Bounded LRU of recently processed UIDs, each expiring after `ttl` seconds.
+
+    Replaces the single last_scan_uid check, which only caught the *same*
+    card twice in a row -- siblings taking turns on the reader each got the
+    full lookup / already-checked-in query / log write on every tap. Oldest
+    entries fall out past `max_size`, so a burst of distinct cards can't
+    grow this without bound.
+    """
+
+    def __init__(self, ttl: float = 5.0, max_size: int = 1024):
+        """
+        Initialize the table
+
+        Args:
+            ttl: Seconds a processed UID suppresses repeat taps
+            max_size: Most UIDs remembered at once
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._seen = OrderedDict()  # uid -> monotonic time it was processed
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def __len__(self):
+        return len(self._seen)
+
+    def check(self, uid: str, now: float = None) -> bool:
+        """
+        Mark a tap, telling whether it repeats one still inside the window
+
+        A repeat doesn't extend the window: it runs from the tap that was
+        actually processed, like the old last-scan check.
+
+        Args:
+            uid: Card UID
+            now: Monotonic time of the tap (default: now)
+
+        Returns:
+            True if the tap should be suppressed, False if it should be processed
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            seen_at = self._seen.get(uid)
+            if seen_at is not None and now - seen_at < self.ttl:
+                self.suppressed += 1
+                return True
+            self._seen[uid] = now
+            self._seen.move_to_end(uid)
+            # Drop expired entries from the old end, then enforce the size cap.
+            while self._seen:
+                oldest_at = next(iter(self._seen.values()))
+                if now - oldest_at < self.ttl and len(self._seen) <= self.max_size:
+                    break
+                self._seen.popitem(last=False)
+            return False
+
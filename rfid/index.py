@@ -0,0 +1,191 @@
+"""
+In-memory lookup indexes for the RFID check-in hot path
+"""
+
+import bisect
+import logging
+import threading
+from typing import Iterable, NamedTuple, Optional
+
+from app import db
+from app.models import ClassEnrollment, DanceClass, Student
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+
+class CardEntry(NamedTuple):
+    """What a tap needs to know about a card: whose it is and what they take"""
+    student_id: int
+    class_ids: frozenset
+
+
+class CardIndex:
+    """Process-local rfid_uid -> CardEntry map covering active students.
+
+    Built once when the service starts and patched per student after the API
+    commits anything that changes what a card resolves to (assign/remove card,
+    student edits and withdrawals, enrollment changes). A miss is not trusted
+    as "unknown card": `resolve` falls back to one SQL read and back-fills, so
+    a card written outside the API (seed scripts, the shell) still checks in.
+    """
+
+    def __init__(self):
+        self._by_uid = {}
+        self._uid_by_student = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._by_uid)
+
+    def load(self):
+        """(Re)build the whole index. Needs an app context."""
+        by_uid = self._query()
+        with self._lock:
+            self._by_uid = by_uid
+            self._uid_by_student = {e.student_id: uid for uid, e in by_uid.items()}
+            self.loaded = True
+        logger.info(f"RFID card index loaded: {len(by_uid)} cards")
+
+    def resolve(self, uid: str) -> Optional[CardEntry]:
+        """Look a card up, falling back to SQL on a miss. Needs an app context."""
+        if not self.loaded:
+            self.load()
+        entry = self._by_uid.get(uid)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        student_id = db.session.query(Student.id).filter_by(
+            rfid_uid=uid, is_active=True).scalar()
+        if student_id is None:
+            return None
+        self.refresh_students([student_id])
+        return self._by_uid.get(uid)
+
+    def refresh_students(self, student_ids: Iterable[int]):
+        """Re-read the given students' cards + active enrollments after a commit.
+
+        Drops whatever those students had before, so a removed/reassigned card
+        or a withdrawn student stops resolving. No-op until the index is loaded
+        (the first `resolve` builds it from scratch anyway).
+        """
+        ids = {int(sid) for sid in student_ids if sid}
+        if not ids or not self.loaded:
+            return
+        fresh = self._query(ids)
+        with self._lock:
+            for sid in ids:
+                old_uid = self._uid_by_student.pop(sid, None)
+                if old_uid is not None and self._by_uid.get(old_uid, (None,))[0] == sid:
+                    del self._by_uid[old_uid]
+            for uid, entry in fresh.items():
+                self._by_uid[uid] = entry
+                self._uid_by_student[entry.student_id] = uid
+
+    @staticmethod
+    def _query(student_ids=None) -> dict:
+        """Cards + active enrollment class ids, optionally for some students only"""
+        cards = db.session.query(Student.id, Student.rfid_uid).filter(
+            Student.is_active.is_(True), Student.rfid_uid.isnot(None))
+        if student_ids is not None:
+            cards = cards.filter(Student.id.in_(student_ids))
+        uid_by_student = dict(cards.all())
+        classes = {sid: set() for sid in uid_by_student}
+        if uid_by_student:
+            enrollments = db.session.query(
+                ClassEnrollment.student_id, ClassEnrollment.class_id
+            ).filter(ClassEnrollment.is_active.is_(True))
+            if student_ids is not None:
+                enrollments = enrollments.filter(
+                    ClassEnrollment.student_id.in_(list(uid_by_student)))
+            for sid, cid in enrollments.all():
+                if sid in classes:
+                    classes[sid].add(cid)
+        return {uid: CardEntry(sid, frozenset(classes[sid]))
+                for sid, uid in uid_by_student.items()}
+
+
+class ClassSlot(NamedTuple):
+    """One active class's check-in window on its weekday, in seconds after
+    midnight with the early/late buffers applied (end is inclusive)"""
+    id: int
+    name: str
+    start: int
+    end: int
+    location_id: Optional[int] = None
+
+
+class ScheduleIndex:
+    """Per-weekday interval index of active class check-in windows.
+
+    Each weekday's windows are cut into elementary segments at every window
+    edge; a segment stores the classes open for its whole span, so "which
+    classes can a tap at (weekday, time) belong to" is one bisect instead of a
+    walk over every class. Rebuilt whole whenever the API creates, edits or
+    cancels a class -- the schedule is tiny and changes rarely.
+    """
+
+    EARLY_MINUTES = 30  # check-in opens this long before class starts
+    LATE_MINUTES = 15  # ...and stays open this long after it ends
+
+    def __init__(self):
+        self._days = {}  # weekday -> (edges, segments, all slots by start)
+        self.loaded = False
+
+    def __len__(self):
+        return sum(len(day[2]) for day in self._days.values())
+
+    def load(self):
+        """(Re)build from the active classes. Needs an app context."""
+        rows = db.session.query(
+            DanceClass.id, DanceClass.name, DanceClass.day_of_week,
+            DanceClass.start_time, DanceClass.end_time, DanceClass.location_id,
+        ).filter(DanceClass.is_active.is_(True)).all()
+        by_day = {}
+        for cid, name, weekday, start_time, end_time, location_id in rows:
+            start = max(0, _seconds(start_time) - self.EARLY_MINUTES * 60)
+            end = min(86399, _seconds(end_time) + self.LATE_MINUTES * 60)
+            by_day.setdefault(weekday, []).append(
+                ClassSlot(cid, name, start, end, location_id))
+        # Swap in one assignment so a concurrent tap sees the old or new schedule.
+        self._days = {weekday: self._build_day(slots) for weekday, slots in by_day.items()}
+        self.loaded = True
+        logger.info(f"RFID schedule index loaded: {len(rows)} classes")
+
+    def reload(self):
+        """Rebuild after a schedule change, if anything has been built yet"""
+        if self.loaded:
+            self.load()
+
+    def candidates(self, weekday: int, seconds: int) -> tuple:
+        """Classes whose check-in window covers this moment, earliest start first"""
+        day = self._days.get(weekday)
+        if not day:
+            return ()
+        edges, segments, _ = day
+        i = bisect.bisect_right(edges, seconds) - 1
+        if i < 0 or i >= len(segments):
+            return ()
+        return segments[i]
+
+    def day(self, weekday: int) -> tuple:
+        """All of a weekday's classes, earliest start first"""
+        day = self._days.get(weekday)
+        return day[2] if day else ()
+
+    @staticmethod
+    def _build_day(slots):
+        slots = tuple(sorted(slots, key=lambda s: (s.start, s.id)))
+        # Half-open segments [edges[i], edges[i+1]); +1 keeps `end` inclusive.
+        edges = sorted({s.start for s in slots} | {s.end + 1 for s in slots})
+        segments = [tuple(s for s in slots if s.start <= lo and hi <= s.end + 1)
+                    for lo, hi in zip(edges, edges[1:])]
+        return edges, segments, slots
+
+
+def _seconds(t) -> int:
+    return t.hour * 3600 + t.minute * 60 + t.second
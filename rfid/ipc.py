@@ -0,0 +1,303 @@
+"""
+Unix-socket control channel between the web app and the standalone RFID daemon
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# One request line, one response line; nothing we send comes close.
+MAX_MESSAGE_BYTES = 1 << 20
+
+
+class RFIDUnavailable(ConnectionError):
+    """The RFID daemon isn't running or didn't answer"""
+
+
+class RFIDCommandError(RuntimeError):
+    """The daemon answered, but the command failed"""
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    """Reads one JSON command, writes one JSON reply: {"ok": true, "result": ...}
+    or {"ok": false, "error": "..."}"""
+
+    def handle(self):
+        line = self.rfile.readline(MAX_MESSAGE_BYTES)
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            if request.get('command') == 'events':
+                self.server.stream_events(self.wfile)
+                return
+            reply = {'ok': True, 'result': self.server.dispatch(request.get('command'),
+                                                                request.get('args') or {})}
+        except Exception as e:
+            logger.warning(f"RFID control command failed: {e}")
+            reply = {'ok': False, 'error': str(e)}
+        self.wfile.write((json.dumps(reply, default=_json_default) + '\n').encode('utf-8'))
+
+
+class RFIDControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves stats / simulate / reload commands for a running RFIDService.
+
+    The daemon owns the readers and the only RFIDService that is actually
+    polling; the web process (any number of gunicorn threads) reaches it
+    through this socket instead of building its own idle instance.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, service, path: str, hub=None):
+        """
+        Bind the control socket
+
+        Args:
+            service: RFIDService to control
+            path: Unix socket path (a stale file from a dead daemon is replaced)
+            hub: EventHub whose events (the daemon's check-ins) are streamed to
+                the web process on an "events" connection
+        """
+        self.service = service
+        self.path = path
+        self.hub = hub
+        self._thread = None
+        _remove_stale_socket(path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        super().__init__(path, _ControlHandler)
+        # Web process and daemon run as the same user (or share a group).
+        os.chmod(path, 0o660)
+
+    def start(self):
+        """Serve on a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True,
+                                        name="RFID-Control")
+        self._thread.start()
+        logger.info(f"RFID control socket listening on {self.path}")
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def stream_events(self, wfile, heartbeat: float = 15.0):
+        """Hold the connection open, writing one JSON line per hub event (an
+        empty object as a heartbeat) until the reader goes away"""
+        if self.hub is None:
+            raise ValueError("This RFID daemon has no event hub")
+        sub = self.hub.subscribe(admin=True)
+        try:
+            while not sub.closed:
+                evt = sub.get(timeout=heartbeat)
+                wfile.write((json.dumps(evt or {}) + '\n').encode('utf-8'))
+                wfile.flush()
+        except OSError:
+            pass  # web process disconnected
+        finally:
+            self.hub.unsubscribe(sub)
+
+    def dispatch(self, command: str, args: dict):
+        """Run one command against the service and return its JSON-able result"""
+        service = self.service
+        if command == 'ping':
+            return {'pid': os.getpid(), 'running': service.running}
+        if command == 'stats':
+            return service.get_stats()
+        if command == 'simulate':
+            location_id = args.get('location_id')
+            return service.simulate_scan(str(args['uid']),
+                                         location_id=int(location_id) if location_id else None)
+        if command == 'reset_timings':
+            service.reset_timings()
+            return True
+        if command == 'reload':
+            # Index reloads query the DB, so they need the daemon's own app context.
+            with service._get_app().app_context():
+                if args.get('student_ids') is not None:
+                    service.refresh_students([int(i) for i in args['student_ids']])
+                else:
+                    service.reload_schedule()
+            return True
+        if command == 'attendance_removed':
+            service.attendance_removed(int(args['student_id']), int(args['class_id']),
+                                       date.fromisoformat(args['day']))
+            return True
+        raise ValueError(f"Unknown RFID command: {command!r}")
+
+
+class RFIDClient:
+    """What the web process holds instead of an RFIDService when the daemon
+    is configured: same method names, each one a round trip over the socket"""
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        """
+        Initialize the client
+
+        Args:
+            path: The daemon's control socket (RFID_SOCKET)
+            timeout: Seconds to wait for a reply before giving up
+        """
+        self.path = path
+        self.timeout = timeout
+
+    def call(self, command: str, timeout: Optional[float] = None, **args):
+        """
+        Send one command and return its result
+
+        Raises:
+            RFIDUnavailable: No daemon listening, or it didn't answer in time
+            RFIDCommandError: The daemon reported the command failed
+        """
+        request = json.dumps({'command': command, 'args': args}, default=_json_default)
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(timeout or self.timeout)
+                sock.connect(self.path)
+                sock.sendall(request.encode('utf-8') + b'\n')
+                with sock.makefile('rb') as replies:
+                    line = replies.readline(MAX_MESSAGE_BYTES)
+        except OSError as e:
+            raise RFIDUnavailable(f"RFID daemon not reachable at {self.path}: {e}") from e
+        if not line:
+            raise RFIDUnavailable(f"RFID daemon at {self.path} closed the connection")
+        reply = json.loads(line)
+        if not reply.get('ok'):
+            raise RFIDCommandError(reply.get('error') or 'RFID command failed')
+        return reply.get('result')
+
+    def ping(self) -> dict:
+        return self.call('ping')
+
+    def get_stats(self) -> dict:
+        stats = self.call('stats')
+        # Back to datetimes, as RFIDService.get_stats returns them.
+        stats['last_scan_time'] = _parse_datetime(stats.get('last_scan_time'))
+        for reader in stats.get('readers') or []:
+            reader['last_scan_time'] = _parse_datetime(reader.get('last_scan_time'))
+        return stats
+
+    def simulate_scan(self, uid: str, location_id: Optional[int] = None) -> bool:
+        # A real check-in, so allow for the database's busy timeout.
+        return bool(self.call('simulate', timeout=max(self.timeout, 15.0), uid=uid,
+                              location_id=location_id))
+
+    def reset_timings(self):
+        self.call('reset_timings')
+
+    def refresh_students(self, student_ids: Iterable[int]):
+        self.call('reload', student_ids=list(student_ids))
+
+    def reload_schedule(self):
+        self.call('reload')
+
+    def attendance_removed(self, student_id: int, class_id: int, day: date):
+        self.call('attendance_removed', student_id=student_id, class_id=class_id, day=day)
+
+
+class EventBridge:
+    """Re-publishes the daemon's events (RFID check-ins are committed in its
+    process, so the web process's commit hooks never see them) into the web
+    process's hub. One background thread, reconnecting while the daemon is down."""
+
+    def __init__(self, path: str, hub, retry_seconds: float = 5.0):
+        self.path = path
+        self.hub = hub
+        self.retry_seconds = retry_seconds
+        self.forwarded = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="RFID-Events")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    # Heartbeats arrive every 15s; silence past this means a hung daemon.
+                    sock.settimeout(60)
+                    sock.connect(self.path)
+                    sock.sendall(b'{"command": "events"}\n')
+                    with sock.makefile('rb') as lines:
+                        for line in lines:
+                            if self._stop.is_set():
+                                return
+                            self._forward(json.loads(line))
+            except (OSError, ValueError) as e:
+                logger.debug(f"RFID event bridge disconnected: {e}")
+            self._stop.wait(self.retry_seconds)
+
+    def _forward(self, evt: dict):
+        if not evt.get('type'):
+            return  # heartbeat
+        if evt['type'] == 'checkin':
+            self._mark_checked_in(evt.get('data') or {})
+        self.hub.publish(evt['type'], evt.get('data') or {},
+                         admin_only=bool(evt.get('admin_only')))
+        self.forwarded += 1
+
+    @staticmethod
+    def _mark_checked_in(data: dict):
+        """A daemon check-in goes into this process's today's-check-ins set
+        too, or a toggle here would think the student isn't checked in."""
+        from app.checkins import todays_checkins
+        try:
+            day = _parse_datetime(data.get('check_in_time'))
+            todays_checkins.add(int(data['student_id']), int(data['class_id']), day.date())
+        except (KeyError, TypeError, ValueError, AttributeError):
+            logger.debug(f"RFID check-in event without a usable student/class/time: {data}")
+
+
+_bridge = None
+_bridge_lock = threading.Lock()
+
+
+def ensure_event_bridge(path: str, hub) -> EventBridge:
+    """Start the web process's bridge to the daemon at `path` (once)"""
+    global _bridge
+    with _bridge_lock:
+        if _bridge is None or _bridge.path != path:
+            if _bridge is not None:
+                _bridge.stop()
+            _bridge = EventBridge(path, hub)
+            _bridge.start()
+        return _bridge
+
+
+def _remove_stale_socket(path: str):
+    """Unlink a socket file left by a daemon that died, refusing to steal a live one"""
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            os.unlink(path)
+            return
+    raise RuntimeError(f"Another RFID daemon is already listening on {path}")
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _parse_datetime(value):
+    return datetime.fromisoformat(value) if value else None
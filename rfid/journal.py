@@ -0,0 +1,168 @@
+"""
+Durable append-only journal of RFID taps, replayed when the database is busy
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+
+class JournalEntry(NamedTuple):
+    """One tap as it came off a reader, before any database work"""
+    seq: int
+    uid: str
+    mono: float  # time.monotonic() at the tap (this boot only)
+    wall: datetime  # studio-local wall clock, like Attendance.check_in_time
+    reader: Optional[str] = None
+    location_id: Optional[int] = None
+
+
+class ScanJournal:
+    """Append-only JSON-lines file: one line per tap, one "ack" line once the
+    tap has been applied to the database.
+
+    Every accepted tap is appended before it is processed, so a tap that hits
+    a locked database (or a web process mid-migration) is not lost: it stays
+    un-acked and the service replays it later. Appends are flushed to the OS
+    right away but fsync'd by `sync()`, which the service calls once per batch
+    of queued taps rather than once per line. Acks are not fsync'd -- losing
+    one only means a replay, and replays are idempotent. Once nothing is
+    pending the file is rewritten empty (`compact`) so it can't grow forever.
+    """
+
+    def __init__(self, path: str, compact_after: int = 1000):
+        """
+        Initialize the journal
+
+        Args:
+            path: Journal file (created if missing)
+            compact_after: Lines written before a fully-acked journal is compacted
+        """
+        self.path = path
+        self.compact_after = compact_after
+        self._lock = threading.Lock()
+        self._file = None
+        self._dirty = False
+        self._pending = OrderedDict()  # seq -> JournalEntry not yet acked
+        self._seq = 0
+        self._lines = 0
+
+    def open(self):
+        """Load un-acked entries left by a previous run and open for appending"""
+        with self._lock:
+            if self._file is not None:
+                return
+            self._pending.clear()
+            self._lines = 0
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        self._load_line(line)
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        if self._pending:
+            logger.warning(f"RFID scan journal has {len(self._pending)} tap(s) to replay")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._fsync()
+                self._file.close()
+                self._file = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def pending(self) -> List[JournalEntry]:
+        """Taps journaled but not yet applied, oldest first"""
+        with self._lock:
+            return list(self._pending.values())
+
+    def append(self, uid: str, reader: Optional[str] = None,
+               location_id: Optional[int] = None) -> JournalEntry:
+        """Record a tap. Durable after the next `sync()`."""
+        with self._lock:
+            self._seq += 1
+            entry = JournalEntry(self._seq, uid, time.monotonic(), datetime.now(),
+                                 reader, location_id)
+            self._write(_entry_record(entry))
+            self._pending[entry.seq] = entry
+            return entry
+
+    def ack(self, seq: int):
+        """Mark a tap as applied; compacts once a busy journal is fully acked"""
+        with self._lock:
+            if self._pending.pop(seq, None) is None:
+                return
+            self._write({'ack': seq})
+            if not self._pending and self._lines >= self.compact_after:
+                self._compact()
+
+    def sync(self):
+        """fsync everything appended since the last sync (one fsync per batch)"""
+        with self._lock:
+            self._fsync()
+
+    def compact(self):
+        """Rewrite the file with only the un-acked entries"""
+        with self._lock:
+            self._compact()
+
+    def _load_line(self, line: str):
+        try:
+            record = json.loads(line)
+            if 'ack' in record:
+                self._pending.pop(int(record['ack']), None)
+            else:
+                entry = JournalEntry(int(record['seq']), record['uid'], float(record['mono']),
+                                     datetime.fromisoformat(record['wall']),
+                                     record.get('reader'), record.get('location_id'))
+                self._pending[entry.seq] = entry
+                self._seq = max(self._seq, entry.seq)
+            self._lines += 1
+        except (ValueError, KeyError, TypeError):
+            # A torn last line from a power cut: that tap never got past the reader.
+            logger.warning(f"Skipping unreadable RFID journal line: {line[:80]!r}")
+
+    def _write(self, record: dict):
+        if self._file is None:
+            raise RuntimeError("RFID scan journal is not open")
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        self._dirty = True
+        self._lines += 1
+
+    def _fsync(self):
+        if self._file is not None and self._dirty:
+            os.fsync(self._file.fileno())
+            self._dirty = False
+
+    def _compact(self):
+        if self._file is None:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as tmp:
+            for entry in self._pending.values():
+                tmp.write(json.dumps(_entry_record(entry)) + '\n')
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._dirty = False
+        self._lines = len(self._pending)
+
+
+def _entry_record(entry: JournalEntry) -> dict:
+    return {'seq': entry.seq, 'uid': entry.uid, 'mono': entry.mono,
+            'wall': entry.wall.isoformat(), 'reader': entry.reader,
+            'location_id': entry.location_id}
@@ -0,0 +1,173 @@
+"""
+Batched, asynchronous writer for RFID scan logs
+"""
+
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from app import db
+from app.models import RFIDLog
+from app.rfid_rollup import record_batch
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Control markers passed through the queue alongside log rows
+_FLUSH = object()
+_STOP = object()
+
+
+class RFIDLogWriter:
+    """Queue-backed RFIDLog writer that commits rows in batches.
+
+    Every scan used to commit its own log rows (a "processing" row, then the
+    outcome), each in a fresh app context -- on the Pi's SD card with
+    synchronous=FULL that is an fsync apiece, ahead of the one commit that
+    matters (the attendance row). `write` only enqueues; a background thread
+    inserts whatever has queued up in one transaction once `batch_size` rows
+    are waiting or `flush_interval` seconds after the first one arrived.
+    Scan logs are diagnostics: a batch that fails is retried on the next
+    flush, and the oldest rows are dropped past `max_backlog`.
+    """
+
+    def __init__(self, get_app, batch_size=50, flush_interval=0.25, max_backlog=5000):
+        """
+        Initialize the writer
+
+        Args:
+            get_app: Callable returning the Flask app to write through
+            batch_size: Rows per transaction before an early flush
+            flush_interval: Seconds a row may wait before it is written
+            max_backlog: Cap on rows kept for retry after a failed flush
+        """
+        self._get_app = get_app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._retry = []
+
+        # Statistics
+        self.rows_written = 0
+        self.batches_written = 0
+        self.rows_dropped = 0
+
+    @property
+    def pending(self) -> int:
+        """Rows queued or waiting for a retry"""
+        return self._queue.qsize() + len(self._retry)
+
+    def write(self, uid: str, action: str, success: bool = True,
+              error: str = None, student_id: int = None, scan_time: datetime = None):
+        """Queue one scan log row. Never blocks on the database."""
+        self._queue.put({
+            'rfid_uid': uid,
+            'student_id': student_id,
+            # Stamped now (or when a replayed tap happened), not at flush time.
+            # Studio-local, like the check-in it logs.
+            'scan_time': scan_time or datetime.now(),
+            'action_taken': action,
+            'success': success,
+            'error_message': error,
+        })
+        self._ensure_thread()
+
+    def flush(self):
+        """Block until every row queued so far has been written (or retried)"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_FLUSH)
+            self._queue.join()
+        else:
+            self._drain()
+
+    def stop(self, timeout: float = 5.0):
+        """Write out everything still queued and stop the writer thread"""
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+        self._drain()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, daemon=True, name="RFID-LogWriter")
+                self._thread.start()
+
+    def _run(self):
+        """Writer loop: collect a batch, write it in one transaction, repeat"""
+        while True:
+            batch = []
+            taken = 0
+            stop = False
+            deadline = None
+            while len(batch) < self.batch_size:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break  # flush_interval elapsed since the batch's first row
+                taken += 1
+                if item is _STOP:
+                    stop = True
+                    break
+                if item is _FLUSH:
+                    break
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            self._write_batch(batch)
+            for _ in range(taken):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _drain(self):
+        """Synchronously write whatever is queued (no writer thread running)"""
+        batch = []
+        taken = 0
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            taken += 1
+            if item is not _FLUSH and item is not _STOP:
+                batch.append(item)
+        self._write_batch(batch)
+        for _ in range(taken):
+            self._queue.task_done()
+
+    def _write_batch(self, batch):
+        with self._write_lock:
+            rows = self._retry + batch
+            self._retry = []
+            if not rows:
+                return
+            try:
+                with self._get_app().app_context():
+                    db.session.execute(insert(RFIDLog), rows)
+                    # Same transaction: the daily counts never drift from the rows.
+                    record_batch(rows)
+                    db.session.commit()
+                self.rows_written += len(rows)
+                self.batches_written += 1
+            except Exception as e:
+                # The app context's teardown already rolled the session back.
+                logger.error(f"Failed to write {len(rows)} RFID scan log(s): {e}")
+                overflow = len(rows) - self.max_backlog
+                if overflow > 0:
+                    self.rows_dropped += overflow
+                    rows = rows[overflow:]
+                self._retry = rows
@@ -0,0 +1,93 @@
+"""
+Per-stage timing histograms for the RFID check-in path
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Bucket upper bounds in milliseconds; anything slower lands in the overflow bucket.
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Stages of a tap, in the order they happen
+STAGES = ('read', 'debounce', 'journal', 'lookup', 'class_match', 'commit', 'log', 'total')
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (ms). O(1) memory however many taps
+    it sees; percentiles are interpolated within the bucket they fall in."""
+
+    def __init__(self, bounds=BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, p: float):
+        """Estimated p-th percentile (0-100) in ms, or None with no samples"""
+        if not self.count:
+            return None
+        rank = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = self.bounds[i - 1] if i > 0 else 0.0
+                hi = self.bounds[i] if i < len(self.bounds) else self.max_ms
+                # Never report past the slowest sample actually seen.
+                return round(min(lo + (hi - lo) * (rank - seen) / n, self.max_ms), 3)
+            seen += n
+        return round(self.max_ms, 3)
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else None,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': round(self.max_ms, 3) if self.count else None,
+        }
+
+
+class StageTimings:
+    """One Histogram per check-in stage, safe to read from the API thread
+    while the reader thread records"""
+
+    def __init__(self, stages=STAGES):
+        self._lock = threading.Lock()
+        self._hists = {stage: Histogram() for stage in stages}
+
+    @contextmanager
+    def time(self, stage: str):
+        """Time the enclosed block into `stage` (recorded even if it raises)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, (time.perf_counter() - started) * 1000)
+
+    def observe(self, stage: str, ms: float):
+        with self._lock:
+            self._hists[stage].observe(ms)
+
+    def snapshot(self) -> dict:
+        """{stage: {count, avg_ms, p50_ms, p95_ms, p99_ms, max_ms}}"""
+        with self._lock:
+            return {stage: h.summary() for stage, h in self._hists.items()}
+
+    def reset(self):
+        with self._lock:
+            for h in self._hists.values():
+                h.reset()
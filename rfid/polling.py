@@ -0,0 +1,122 @@
+"""
+Adaptive poll scheduling for the RFID reader loop
+"""
+
+import logging
+import time
+from collections import deque
+from typing import Callable, Optional
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+
+class AdaptivePoller:
+    """Decides how long the reader loop sleeps between polls.
+
+    The old loop slept a flat 0.5s after a 0.1s read window, so a tap could
+    wait the better part of a second to be seen while an empty studio still
+    woke the Pi twice a second all night. Now:
+
+    * right after a card is seen (`hot_seconds`), poll every `fast_interval`
+      -- the rest of the line is usually queued up behind the first tap;
+    * while any class's check-in window is open, poll every `class_interval`;
+    * otherwise back off by `backoff`x per empty poll, from `idle_interval`
+      up to `max_interval`.
+
+    Also keeps the numbers to tune this by: tap-to-detect latency and how
+    often the loop wakes up without finding a card.
+    """
+
+    def __init__(self, fast_interval: float = 0.05, class_interval: float = 0.15,
+                 idle_interval: float = 0.25, max_interval: float = 2.0,
+                 backoff: float = 1.5, hot_seconds: float = 10.0,
+                 in_class_window: Optional[Callable[[], bool]] = None):
+        """
+        Initialize the poller
+
+        Args:
+            fast_interval: Seconds between polls just after a tap
+            class_interval: Seconds between polls during a class window
+            idle_interval: First idle sleep once the loop starts backing off
+            max_interval: Longest idle sleep
+            backoff: Multiplier applied to the idle sleep per empty poll
+            hot_seconds: How long after a tap polling stays fast
+            in_class_window: Callable telling whether a class window is open
+        """
+        self.fast_interval = fast_interval
+        self.class_interval = class_interval
+        self.idle_interval = idle_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.hot_seconds = hot_seconds
+        self.in_class_window = in_class_window
+        self.interval = fast_interval
+        self.last_card_at = None
+
+        # Statistics
+        self._idle_wakeups = deque()  # monotonic times of polls that found nothing
+        self._latencies = deque(maxlen=500)  # recent tap-to-detect latencies (s)
+
+    def after_poll(self, found: bool, now: float = None) -> float:
+        """Record one poll and return how long to sleep before the next one"""
+        now = time.monotonic() if now is None else now
+        if found:
+            self.last_card_at = now
+            self.interval = self.fast_interval
+            return self.interval
+        self._idle_wakeups.append(now)
+        self._drop_old_wakeups(now)
+        if self.last_card_at is not None and now - self.last_card_at < self.hot_seconds:
+            self.interval = self.fast_interval
+        elif self._class_window_open():
+            self.interval = self.class_interval
+        else:
+            # Start backing off from wherever we were, but never faster than idle.
+            self.interval = min(self.max_interval,
+                                max(self.idle_interval, self.interval * self.backoff))
+        return self.interval
+
+    def record_latency(self, seconds: float):
+        """Record how long a tap waited before the loop saw it"""
+        self._latencies.append(max(0.0, seconds))
+
+    def idle_wakeups_per_minute(self, now: float = None) -> int:
+        """Empty polls in the last 60 seconds"""
+        self._drop_old_wakeups(time.monotonic() if now is None else now)
+        return len(self._idle_wakeups)
+
+    def _drop_old_wakeups(self, now: float):
+        # Pruned on every empty poll too, so the deque holds at most a minute
+        # of wakeups even if nobody ever reads the stats.
+        while self._idle_wakeups and now - self._idle_wakeups[0] > 60:
+            self._idle_wakeups.popleft()
+
+    def latency_samples(self) -> list:
+        """Recent tap-to-detect latencies, in seconds"""
+        return list(self._latencies)
+
+    def latency_stats(self) -> dict:
+        """Average / max tap-to-detect latency over recent taps, in ms"""
+        return latency_summary(self._latencies)
+
+    def _class_window_open(self) -> bool:
+        if self.in_class_window is None:
+            return False
+        try:
+            return bool(self.in_class_window())
+        except Exception as e:
+            logger.debug(f"Class window check failed: {e}")
+            return False
+
+
+def latency_summary(samples) -> dict:
+    """Average / max of latencies given in seconds, reported in ms"""
+    samples = list(samples)
+    if not samples:
+        return {'avg_ms': None, 'max_ms': None, 'samples': 0}
+    return {
+        'avg_ms': round(sum(samples) / len(samples) * 1000, 1),
+        'max_ms': round(max(samples) * 1000, 1),
+        'samples': len(samples),
+    }
@@ -4,26 +4,73 @@ RFID Reader implementation for MFRC522 module
 
 import time
 import logging
+from collections import deque
 from typing import Optional, Tuple
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
+# How poll() reads a tap:
+#   uid  - REQA, anticollision, select: the UID and nothing else (3 round trips)
+#   full - SimpleMFRC522.read_no_block: also authenticates and reads the text
+#          blocks 8-10 (8 round trips); check-in never uses the text
+READ_MODES = ('uid', 'full')
+
+# How a UID is turned into the string stored in Student.rfid_uid:
+#   decimal - SimpleMFRC522.uid_to_num: the 4 UID bytes plus the check byte as
+#             one big-endian integer. What every card enrolled so far uses.
+#   hex     - the 4 UID bytes as upper-case hex ("A1B2C3D4"), as printed on
+#             cards and shown by USB/phone readers
+UID_ENCODINGS = ('decimal', 'hex')
+
+
+def encode_uid(uid_bytes, encoding: str = 'decimal') -> str:
+    """
+    Encode the anticollision response (4 UID bytes + check byte)
+    
+    Args:
+        uid_bytes: The 5 bytes from MFRC522_Anticoll
+        encoding: One of UID_ENCODINGS
+        
+    Returns:
+        UID string as stored on the student
+    """
+    if encoding == 'hex':
+        return bytes(uid_bytes[:4]).hex().upper()
+    if encoding == 'decimal':
+        return str(int.from_bytes(bytes(uid_bytes[:5]), 'big'))
+    raise ValueError(f"Unknown UID encoding {encoding!r} (expected one of {UID_ENCODINGS})")
+
+
 class RFIDReader:
     """RFID Reader class for MFRC522 module"""
     
-    def __init__(self, spi_dev=0, rst_pin=25):
+    def __init__(self, spi_dev=0, rst_pin=25, read_mode='uid', uid_encoding='decimal',
+                 device=None):
         """
         Initialize RFID reader
         
         Args:
             spi_dev: SPI device number (default: 0)
             rst_pin: Reset pin number (default: 25)
+            read_mode: One of READ_MODES (default: UID only)
+            uid_encoding: One of UID_ENCODINGS
+            device: An already-open SimpleMFRC522 (or a stand-in for one);
+                None opens the hardware
         """
+        if read_mode not in READ_MODES:
+            raise ValueError(f"Unknown RFID read mode {read_mode!r} (expected one of {READ_MODES})")
+        if uid_encoding not in UID_ENCODINGS:
+            raise ValueError(f"Unknown UID encoding {uid_encoding!r} "
+                             f"(expected one of {UID_ENCODINGS})")
         self.spi_dev = spi_dev
         self.rst_pin = rst_pin
-        self.reader = None
-        self.is_initialized = False
+        self.read_mode = read_mode
+        self.uid_encoding = uid_encoding
+        self.reader = device
+        self.is_initialized = device is not None
+        if device is not None:
+            return
         
         try:
             self._initialize_reader()
@@ -78,7 +125,7 @@ class RFIDReader:
                         # Try to read card (non-blocking)
                         uid, text = self.reader.read_no_block()
                         if uid:
-                            uid_str = str(uid)
+                            uid_str = self._encode_number(uid)
                             text_str = text.strip() if text else ""
                             logger.info(f"RFID card read: UID={uid_str}")
                             return (uid_str, text_str)
@@ -91,7 +138,7 @@ class RFIDReader:
             else:
                 # Blocking read
                 uid, text = self.reader.read()
-                uid_str = str(uid)
+                uid_str = self._encode_number(uid)
                 text_str = text.strip() if text else ""
                 logger.info(f"RFID card read: UID={uid_str}")
                 return (uid_str, text_str)
@@ -100,6 +147,69 @@ class RFIDReader:
             logger.error(f"Error reading RFID card: {e}")
             return None
     
+    def poll(self) -> Optional[Tuple[str, str]]:
+        """
+        Check for a card exactly once, without waiting
+        
+        The service's poll loop decides how long to sleep between calls
+        (see rfid.polling), so this must not sleep itself.
+        
+        Returns:
+            Tuple of (uid, text) if a card is on the reader, None otherwise
+        """
+        if not self.is_initialized:
+            return None
+        
+        if self.read_mode == 'uid':
+            uid_str = self._read_uid_once()
+            if uid_str is None:
+                return None
+            logger.info(f"RFID card read: UID={uid_str}")
+            return (uid_str, "")
+        
+        try:
+            uid, text = self.reader.read_no_block()
+        except Exception:
+            return None
+        if not uid:
+            return None
+        uid_str = self._encode_number(uid)
+        logger.info(f"RFID card read: UID={uid_str}")
+        return (uid_str, text.strip() if text else "")
+    
+    def _read_uid_once(self) -> Optional[str]:
+        """
+        Request, anticollision and select -- no authentication, no block reads
+        
+        SimpleMFRC522.read_no_block does these three and then authenticates
+        sector 2 and reads three blocks for the text. Selecting still leaves
+        the card in the same (ACTIVE) state as the full read, so a card held
+        on the reader behaves the same in both modes.
+        
+        Returns:
+            Encoded UID if a card answered, None otherwise
+        """
+        chip = self.reader.READER
+        try:
+            status, _ = chip.MFRC522_Request(chip.PICC_REQIDL)
+            if status != chip.MI_OK:
+                return None
+            status, uid = chip.MFRC522_Anticoll()
+            if status != chip.MI_OK:
+                return None
+            # Returns the SAK size, 0 if the card didn't answer the select
+            if not chip.MFRC522_SelectTag(uid):
+                return None
+        except Exception:
+            return None
+        return encode_uid(uid, self.uid_encoding)
+    
+    def _encode_number(self, uid: int) -> str:
+        """Re-encode SimpleMFRC522's integer UID (5 bytes, big-endian)"""
+        if self.uid_encoding == 'decimal':
+            return str(uid)
+        return encode_uid(int(uid).to_bytes(5, 'big'), self.uid_encoding)
+    
     def write_card(self, text: str, uid: str = None) -> bool:
         """
         Write text to RFID card
@@ -127,18 +237,28 @@ class RFIDReader:
     
     def read_uid_only(self, timeout=None) -> Optional[str]:
         """
-        Read only the UID from RFID card
+        Read only the UID from RFID card (no authentication or block reads)
         
         Args:
-            timeout: Read timeout in seconds
+            timeout: Read timeout in seconds (None for blocking read)
             
         Returns:
             UID string if successful, None otherwise
         """
-        result = self.read_card(timeout)
-        if result:
-            return result[0]
-        return None
+        if not self.is_initialized:
+            logger.warning("RFID reader not initialized")
+            return None
+        
+        start_time = time.time()
+        while True:
+            uid_str = self._read_uid_once()
+            if uid_str is not None:
+                logger.info(f"RFID card read: UID={uid_str}")
+                return uid_str
+            if timeout is not None and time.time() - start_time >= timeout:
+                logger.debug("RFID read timeout")
+                return None
+            time.sleep(0.1)
     
     def is_card_present(self) -> bool:
         """
@@ -150,11 +270,7 @@ class RFIDReader:
         if not self.is_initialized:
             return False
         
-        try:
-            result = self.read_card(timeout=0.1)
-            return result is not None
-        except Exception:
-            return False
+        return self._read_uid_once() is not None
     
     def cleanup(self):
         """Cleanup GPIO resources"""
@@ -169,10 +285,13 @@ class RFIDReader:
 class MockRFIDReader(RFIDReader):
     """Mock RFID reader for testing and non-Raspberry Pi environments"""
     
-    def __init__(self, spi_dev=0, rst_pin=25):
+    def __init__(self, spi_dev=0, rst_pin=25, read_mode='uid', uid_encoding='decimal'):
         """Initialize mock reader"""
         self.spi_dev = spi_dev
         self.rst_pin = rst_pin
+        # Recorded only: tapped UIDs are returned exactly as presented.
+        self.read_mode = read_mode
+        self.uid_encoding = uid_encoding
         self.reader = None
         self.is_initialized = True
         self.mock_cards = {
@@ -180,14 +299,36 @@ class MockRFIDReader(RFIDReader):
             "987654321": "Teacher Test Card",
             "555666777": "Demo Card"
         }
+        self._presented = deque()  # (uid, monotonic time the card was tapped)
+        self.last_presented_at = None
         logger.info("Mock RFID reader initialized")
     
+    def present_card(self, uid: str):
+        """
+        Tap a card on the mock reader; the next poll picks it up
+        
+        Args:
+            uid: UID to tap
+        """
+        self._presented.append((uid, time.monotonic()))
+    
+    def poll(self) -> Optional[Tuple[str, str]]:
+        """Return the oldest tapped card not yet read, if any"""
+        try:
+            uid, presented_at = self._presented.popleft()
+        except IndexError:
+            return None
+        # Lets the service measure tap-to-detect latency exactly.
+        self.last_presented_at = presented_at
+        return (uid, self.mock_cards.get(uid, ""))
+    
     def read_card(self, timeout=None) -> Optional[Tuple[str, str]]:
         """Simulate reading an RFID card"""
-        # In a real mock, you might want to simulate user input
-        # For now, we'll just return None to indicate no card
-        logger.debug("Mock RFID reader - no card simulation")
-        return None
+        # Only cards tapped via present_card(); otherwise no card.
+        result = self.poll()
+        if result is None:
+            logger.debug("Mock RFID reader - no card simulation")
+        return result
     
     def simulate_card_scan(self, uid: str) -> Optional[Tuple[str, str]]:
         """
@@ -207,6 +348,15 @@ class MockRFIDReader(RFIDReader):
             logger.info(f"Mock RFID scan: Unknown card UID={uid}")
             return (uid, "")
     
+    def read_uid_only(self, timeout=None) -> Optional[str]:
+        """Simulate reading only the UID"""
+        result = self.poll()
+        return result[0] if result else None
+    
+    def is_card_present(self) -> bool:
+        """True if a tapped card is waiting"""
+        return bool(self._presented)
+    
     def write_card(self, text: str, uid: str = None) -> bool:
         """Simulate writing to RFID card"""
         logger.info(f"Mock RFID write: {text}")
@@ -216,7 +366,8 @@ class MockRFIDReader(RFIDReader):
         """Mock cleanup"""
         logger.info("Mock RFID reader cleanup completed")
 
-def create_rfid_reader(spi_dev=0, rst_pin=25, force_mock=False) -> RFIDReader:
+def create_rfid_reader(spi_dev=0, rst_pin=25, force_mock=False, read_mode='uid',
+                       uid_encoding='decimal') -> RFIDReader:
     """
     Factory function to create appropriate RFID reader
     
@@ -224,21 +375,21 @@ def create_rfid_reader(spi_dev=0, rst_pin=25, force_mock=False) -> RFIDReader:
         spi_dev: SPI device number
         rst_pin: Reset pin number
         force_mock: Force use of mock reader
+        read_mode: One of READ_MODES
+        uid_encoding: One of UID_ENCODINGS
         
     Returns:
         RFIDReader instance (real or mock)
+    
+    Raises:
+        ValueError: Unknown read mode or UID encoding (a config typo must not
+            silently fall back to the mock reader)
     """
     if force_mock:
-        return MockRFIDReader(spi_dev, rst_pin)
+        return MockRFIDReader(spi_dev, rst_pin, read_mode, uid_encoding)
     
-    try:
-        # Try to create real reader
-        reader = RFIDReader(spi_dev, rst_pin)
-        if reader.is_initialized:
-            return reader
-        else:
-            logger.info("Falling back to mock RFID reader")
-            return MockRFIDReader(spi_dev, rst_pin)
-    except Exception:
-        logger.info("Creating mock RFID reader")
-        return MockRFIDReader(spi_dev, rst_pin) 
\ No newline at end of file
+    reader = RFIDReader(spi_dev, rst_pin, read_mode, uid_encoding)
+    if reader.is_initialized:
+        return reader
+    logger.info("Falling back to mock RFID reader")
+    return MockRFIDReader(spi_dev, rst_pin, read_mode, uid_encoding) 
\ No newline at end of file
@@ -0,0 +1,94 @@
+"""
+Reader-to-location bindings for studios with more than one door
+"""
+
+import logging
+from typing import List, NamedTuple, Optional
+
+from rfid.polling import AdaptivePoller
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+
+class ReaderBinding(NamedTuple):
+    """Where one physical reader is wired and which Location it guards"""
+    name: str
+    spi_dev: int
+    rst_pin: int
+    location_id: Optional[int] = None
+
+
+def parse_reader_specs(spec: str) -> List[ReaderBinding]:
+    """
+    Parse RFID_READERS, e.g. "0:25:1,1:24:2" -> two readers on SPI 0/1
+    (reset pins 25/24) bound to locations 1 and 2. The location is optional.
+
+    Args:
+        spec: Comma-separated "spi_dev:rst_pin[:location_id]" entries
+
+    Returns:
+        One ReaderBinding per entry; malformed entries are logged and skipped
+    """
+    bindings = []
+    for entry in (spec or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            parts = [int(p) for p in entry.split(':')]
+            if len(parts) not in (2, 3):
+                raise ValueError("expected spi_dev:rst_pin[:location_id]")
+        except ValueError as e:
+            logger.error(f"Ignoring RFID reader spec {entry!r}: {e}")
+            continue
+        spi_dev, rst_pin = parts[0], parts[1]
+        location_id = parts[2] if len(parts) == 3 else None
+        bindings.append(ReaderBinding(f"spi{spi_dev}", spi_dev, rst_pin, location_id))
+    return bindings
+
+
+class ReaderHandle:
+    """One running reader: its hardware, its Location, its own poll schedule
+    and per-door counters"""
+
+    def __init__(self, name: str, reader, location_id: Optional[int] = None,
+                 poller: Optional[AdaptivePoller] = None):
+        """
+        Initialize the handle
+
+        Args:
+            name: Label shown in stats (e.g. "spi0", "front-door")
+            reader: RFIDReader (or MockRFIDReader) to poll
+            location_id: Location whose classes this reader checks in to
+            poller: Poll scheduler (default: a fresh AdaptivePoller)
+        """
+        self.name = name
+        self.reader = reader
+        self.location_id = location_id
+        self.poller = poller or AdaptivePoller()
+        self.last_poll_at = None
+
+        # Statistics
+        self.total_scans = 0
+        self.successful_checkins = 0
+        self.failed_scans = 0
+        self.suppressed_scans = 0
+        self.last_scan_uid = None
+        self.last_scan_time = None
+
+    def get_stats(self) -> dict:
+        """Per-reader counters and poll health"""
+        return {
+            'name': self.name,
+            'location_id': self.location_id,
+            'total_scans': self.total_scans,
+            'successful_checkins': self.successful_checkins,
+            'failed_scans': self.failed_scans,
+            'suppressed_scans': self.suppressed_scans,
+            'last_scan_uid': self.last_scan_uid,
+            'last_scan_time': self.last_scan_time,
+            'poll_interval': self.poller.interval,
+            'idle_wakeups_per_min': self.poller.idle_wakeups_per_minute(),
+            'detect_latency': self.poller.latency_stats(),
+        }
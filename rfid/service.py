@@ -3,52 +3,150 @@ RFID Background Service for automatic attendance processing
 """
 
 import logging
+import os
+import queue
+import threading
 import time
-from datetime import date, datetime, timedelta
-from typing import Optional
+from datetime import datetime
+from typing import List, Optional
 
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError, OperationalError
 
+from rfid.debounce import RecentScans
+from rfid.index import CardEntry, CardIndex, ClassSlot, ScheduleIndex
+from rfid.journal import JournalEntry, ScanJournal
+from rfid.log_writer import RFIDLogWriter
+from rfid.metrics import StageTimings
+from rfid.polling import AdaptivePoller, latency_summary
 from rfid.reader import create_rfid_reader
-from app.models import Student, Attendance, DanceClass, RFIDLog
+from rfid.readers import ReaderBinding, ReaderHandle, parse_reader_specs
+from app.checkins import todays_checkins
+from app.models import Attendance, RFIDLog
 from app import db
+from config.config import BASE_DIR
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
+# Seconds between attempts to replay journaled taps while the DB stays busy
+REPLAY_RETRY_SECONDS = 5
+
 class RFIDService:
     """Background service for processing RFID card scans"""
     
-    def __init__(self):
-        """Initialize RFID service"""
-        self.reader = None
+    def __init__(self, bindings: Optional[List[ReaderBinding]] = None,
+                 burst_mode: Optional[bool] = None):
+        """
+        Initialize RFID service
+        
+        Args:
+            bindings: Readers to open on start (default: RFID_READERS, else
+                one reader on RFID_SPI_DEV/RFID_RST_PIN)
+            burst_mode: Commit a burst of queued taps' attendance rows in one
+                transaction (default: RFID_BURST_MODE)
+        """
+        self.bindings = bindings
+        self.burst_mode = burst_mode
+        self.readers = []  # ReaderHandle per door, polled by its own thread
         self._app = None
         self.running = False
-        self.scan_interval = 0.5  # seconds between scans
+        self._wake = threading.Event()  # set to cut a poll sleep short on stop
+        self._scans = queue.Queue()  # (handle, uid, text) from every reader
         self.last_scan_uid = None
         self.last_scan_time = None
+        self.recent_scans = RecentScans()  # per-UID debounce, see duplicate_scan_window
         self.duplicate_scan_window = 5  # seconds to ignore duplicate scans
+        self.card_index = CardIndex()  # uid -> (student, enrollments), no SQL per tap
+        self.schedule_index = ScheduleIndex()  # (weekday, time) -> open classes
+        self.log_writer = RFIDLogWriter(self._get_app)  # batched scan-log commits
+        self.timings = StageTimings()  # per-stage latency histograms
+        self.journal = None  # ScanJournal, opened by start_listening
+        self._replay_at = 0.0  # monotonic time of the next journal replay attempt
         
         # Statistics
         self.total_scans = 0
         self.successful_checkins = 0
         self.failed_scans = 0
+        self.deferred_scans = 0
+        self.lock_errors = 0  # taps that hit a locked/unavailable database
+        self.replayed_scans = 0
         
         logger.info("RFID service initialized")
     
-    def start_listening(self):
-        """Start the RFID listening service"""
+    @property
+    def reader(self):
+        """The first reader (the only one in a single-door studio)"""
+        return self.readers[0].reader if self.readers else None
+    
+    def add_reader(self, reader, location_id: Optional[int] = None,
+                   name: Optional[str] = None,
+                   poller: Optional[AdaptivePoller] = None) -> ReaderHandle:
+        """
+        Register a reader to poll once the service starts
+        
+        Args:
+            reader: RFIDReader (or MockRFIDReader) instance
+            location_id: Location whose classes taps on this reader check in to
+                (None: any location)
+            name: Label for stats (default: "reader<N>")
+            poller: Poll scheduler (default: adaptive, tight during this
+                location's class windows)
+            
+        Returns:
+            The reader's handle (per-reader stats live there)
+        """
+        handle = ReaderHandle(name or f"reader{len(self.readers)}", reader, location_id, poller)
+        if handle.poller.in_class_window is None:
+            handle.poller.in_class_window = lambda: self._class_window_open(location_id)
+        self.readers.append(handle)
+        return handle
+    
+    def start_listening(self, reader=None):
+        """
+        Start the RFID listening service: one polling thread per reader, all
+        feeding this thread, which processes their taps one at a time
+        
+        Args:
+            reader: Single reader to poll, replacing any registered ones
+        """
+        pollers = []
         try:
-            # Initialize RFID reader
-            self.reader = create_rfid_reader()
-            logger.info("RFID service starting...")
+            if reader is not None:
+                self.readers = []
+                self.add_reader(reader)
+            if not self.readers:
+                self._open_readers()
+            logger.info(f"RFID service starting with {len(self.readers)} reader(s)...")
+            if self.burst_mode is None:
+                self.burst_mode = bool(self._get_app().config.get('RFID_BURST_MODE'))
+            self._load_indexes()
+            self._open_journal()
             
             self.running = True
+            self._wake.clear()
+            for handle in self.readers:
+                thread = threading.Thread(target=self._poll_reader, args=(handle,),
+                                          daemon=True, name=f"RFID-Poll-{handle.name}")
+                thread.start()
+                pollers.append(thread)
             
             while self.running:
                 try:
-                    self._scan_for_cards()
-                    time.sleep(self.scan_interval)
+                    self._maybe_replay()
+                    item = self._scans.get(timeout=1.0)
+                    # Take whatever else has queued up too: one journal fsync
+                    # then covers the whole burst.
+                    batch = [item]
+                    while len(batch) < 50:
+                        try:
+                            batch.append(self._scans.get_nowait())
+                        except queue.Empty:
+                            break
+                    # None is stop_listening's wakeup
+                    self._handle_scans([i for i in batch if i is not None])
+                except queue.Empty:
+                    continue
                 except KeyboardInterrupt:
                     logger.info("RFID service interrupted by user")
                     break
@@ -59,12 +157,77 @@ class RFIDService:
         except Exception as e:
             logger.error(f"Failed to start RFID service: {e}")
         finally:
+            self.running = False
+            self._wake.set()
+            for thread in pollers:
+                thread.join(timeout=5)
             self._cleanup()
     
     def stop_listening(self):
         """Stop the RFID listening service"""
         logger.info("Stopping RFID service...")
         self.running = False
+        self._wake.set()
+        self._scans.put(None)
+        self.log_writer.flush()
+    
+    def _open_readers(self):
+        """Create a reader per configured binding"""
+        config = self._get_app().config
+        bindings = self.bindings
+        if bindings is None:
+            bindings = parse_reader_specs(config.get('RFID_READERS', '')) or [
+                ReaderBinding("spi0", config.get('RFID_SPI_DEV', 0), config.get('RFID_RST_PIN', 25))]
+        read_mode = config.get('RFID_READ_MODE', 'uid')
+        uid_encoding = config.get('RFID_UID_ENCODING', 'decimal')
+        for binding in bindings:
+            self.add_reader(create_rfid_reader(binding.spi_dev, binding.rst_pin,
+                                               read_mode=read_mode, uid_encoding=uid_encoding),
+                            location_id=binding.location_id, name=binding.name)
+    
+    def _open_journal(self):
+        """Open the scan journal; taps left un-applied by the last run replay first"""
+        if self.journal is not None:
+            return
+        config = self._get_app().config
+        path = config.get('RFID_JOURNAL_PATH')
+        if not path:
+            # Next to the SQLite file it protects, so each DB gets its own.
+            database = make_url(config['SQLALCHEMY_DATABASE_URI']).database
+            if database and database != ':memory:':
+                path = database + '.scans'
+            else:
+                path = os.path.join(BASE_DIR, 'data', 'rfid_scans.journal')
+        try:
+            journal = ScanJournal(path)
+            journal.open()
+        except OSError as e:
+            # Not fatal: taps still check in, they just aren't protected.
+            logger.error(f"Failed to open RFID scan journal {path}: {e}")
+            return
+        self.journal = journal
+        self._replay_at = 0.0
+    
+    def _poll_reader(self, handle: ReaderHandle):
+        """Polling thread for one reader: hand taps to the processing queue"""
+        while self.running:
+            try:
+                result = self._read_card(handle)
+                if result:
+                    self._scans.put((handle,) + result)
+                self._wake.wait(handle.poller.after_poll(result is not None))
+            except Exception as e:
+                logger.error(f"Error polling RFID reader {handle.name}: {e}")
+                self._wake.wait(1)  # Wait before retrying
+
+    @property
+    def duplicate_scan_window(self) -> float:
+        """Seconds during which a repeat tap of any recent card is ignored"""
+        return self.recent_scans.ttl
+
+    @duplicate_scan_window.setter
+    def duplicate_scan_window(self, seconds: float):
+        self.recent_scans.ttl = seconds
 
     def _get_app(self):
         """Reuse ONE Flask app across scans. create_app() runs migrations, seeds
@@ -76,215 +239,544 @@ class RFIDService:
             from app import create_app
             self._app = create_app()
         return self._app
+
+    def _load_indexes(self):
+        """Build the in-memory lookup indexes once, before the first tap"""
+        try:
+            with self._get_app().app_context():
+                self.card_index.load()
+                self.schedule_index.load()
+                todays_checkins.seed()
+        except Exception as e:
+            # Not fatal: the first scan retries the load via CardIndex.resolve.
+            logger.error(f"Failed to load RFID indexes: {e}")
+
+    def refresh_students(self, student_ids):
+        """Re-sync the card index for students whose card, status or
+        enrollments just changed. Called by the API after it commits."""
+        self.card_index.refresh_students(student_ids)
+
+    def reload_schedule(self):
+        """Rebuild the schedule index after a class is created, edited or
+        cancelled. Called by the API after it commits."""
+        self.schedule_index.reload()
+    
+    def attendance_removed(self, student_id: int, class_id: int, day):
+        """A check-in was undone in the web process (toggled off): forget it
+        here too, so the student's next tap checks in again. In-process the
+        commit hook has already done this; it matters under the daemon."""
+        todays_checkins.discard(student_id, class_id, day)
     
-    def _scan_for_cards(self):
-        """Scan for RFID cards and process them"""
+    def _class_window_open(self, location_id: Optional[int] = None) -> bool:
+        """Whether a class's check-in window is open right now (at this location)"""
+        if not self.schedule_index.loaded:
+            return False
+        now = datetime.now()
+        seconds = now.hour * 3600 + now.minute * 60 + now.second
+        return any(_at_location(slot, location_id)
+                   for slot in self.schedule_index.candidates(now.weekday(), seconds))
+    
+    def _scan_for_cards(self, handle: Optional[ReaderHandle] = None) -> bool:
+        """
+        Poll a reader once and process a card if one is there, inline
+        
+        Args:
+            handle: Reader to poll (default: the first one)
+            
+        Returns:
+            True if a card was read, False otherwise
+        """
+        handle = handle or self.readers[0]
+        result = self._read_card(handle)
+        if result:
+            self._handle_scans([(handle,) + result])
+        return result is not None
+    
+    def _read_card(self, handle: ReaderHandle):
+        """
+        Poll one reader once, recording read time and tap-to-detect latency
+        
+        Returns:
+            (uid, text) if a card was read, None otherwise
+        """
         try:
-            # Try to read a card with short timeout
-            result = self.reader.read_card(timeout=0.1)
+            polled_at = time.monotonic()
+            read_started = time.perf_counter()
+            result = handle.reader.poll()
+            last_poll_at, handle.last_poll_at = handle.last_poll_at, polled_at
+            if not result:
+                return None
+            # Only reads that found a card: idle polls would drown them out.
+            self.timings.observe('read', (time.perf_counter() - read_started) * 1000)
+            # The mock knows when the card was tapped; real hardware
+            # doesn't, so count the gap since the previous poll (worst case).
+            presented_at = getattr(handle.reader, 'last_presented_at', None) or last_poll_at
+            if presented_at is not None:
+                handle.poller.record_latency(polled_at - presented_at)
+            return result
+        except Exception as e:
+            logger.error(f"Error scanning for cards on {handle.name}: {e}")
+            return None
+    
+    def _handle_scans(self, items):
+        """
+        Debounce a batch of taps, journal the rest (one fsync for the batch),
+        then apply them to the database in order
+        
+        Args:
+            items: (handle, uid, text) tuples as read from the readers
+        """
+        accepted = []
+        for handle, uid, text in items:
+            self.total_scans += 1
+            handle.total_scans += 1
             
-            if result:
-                uid, text = result
-                self.total_scans += 1
-                
-                # Check for duplicate scans
-                if self._is_duplicate_scan(uid):
-                    logger.debug(f"Ignoring duplicate scan: {uid}")
-                    return
-                
-                logger.info(f"Processing RFID scan: UID={uid}")
-                success = self._process_card_scan(uid, text)
-                
-                if success:
-                    self.successful_checkins += 1
-                else:
-                    self.failed_scans += 1
-                
-                # Update last scan info
-                self.last_scan_uid = uid
-                self.last_scan_time = datetime.utcnow()
+            # Check for duplicate scans -- before any DB work
+            with self.timings.time('debounce'):
+                duplicate = self._is_duplicate_scan(uid)
+            if duplicate:
+                handle.suppressed_scans += 1
+                logger.debug(f"Ignoring duplicate scan: {uid}")
+                continue
+            accepted.append((handle, uid, text))
+        if not accepted:
+            return
+        
+        # Journal first: from here on a busy database can't lose the tap.
+        with self.timings.time('journal'):
+            entries = [self._journal_tap(handle, uid) for handle, uid, _ in accepted]
+            if self.journal is not None:
+                self._sync_journal()
+        
+        if self.burst_mode and len(accepted) > 1:
+            self._apply_burst(accepted, entries)
+            return
+        
+        deferred = False
+        for (handle, uid, text), entry in zip(accepted, entries):
+            if deferred and entry is not None:
+                # DB still busy: leave the rest of the burst to the replayer
+                self.deferred_scans += 1
+                continue
+            deferred = not self._apply_scan(handle, uid, text, entry)
+    
+    def _journal_tap(self, handle: ReaderHandle, uid: str) -> Optional[JournalEntry]:
+        """Append a tap to the journal, if there is one"""
+        if self.journal is None:
+            return None
+        try:
+            return self.journal.append(uid, reader=handle.name, location_id=handle.location_id)
+        except (OSError, RuntimeError) as e:
+            logger.error(f"Failed to journal RFID scan {uid}: {e}")
+            return None
+    
+    def _sync_journal(self):
+        try:
+            self.journal.sync()
+        except OSError as e:
+            logger.error(f"Failed to sync RFID scan journal: {e}")
+    
+    def _apply_scan(self, handle: ReaderHandle, uid: str, text: str,
+                    entry: Optional[JournalEntry]) -> bool:
+        """
+        Process one journaled tap and ack it
+        
+        Returns:
+            False if the database was unavailable (the tap stays journaled)
+        """
+        logger.info(f"Processing RFID scan: UID={uid} on {handle.name}")
+        try:
+            success = self._process_card_scan(uid, text, location_id=handle.location_id,
+                                              scanned_at=entry.wall if entry else None)
+        except OperationalError as e:
+            self.deferred_scans += 1
+            self.lock_errors += 1
+            self._replay_at = time.monotonic() + REPLAY_RETRY_SECONDS
+            if entry is None:
+                self.failed_scans += 1
+                handle.failed_scans += 1
+                logger.error(f"Database unavailable, RFID scan {uid} lost (no journal): {e}")
+            else:
+                logger.warning(f"Database unavailable, RFID scan {uid} kept for replay: {e}")
+            return False
+        self._finish_scan(handle, uid, entry, success)
+        return True
+    
+    def _finish_scan(self, handle: ReaderHandle, uid: str,
+                     entry: Optional[JournalEntry], success: bool):
+        """Ack an applied tap and count its outcome"""
+        if entry is not None:
+            self.journal.ack(entry.seq)
+        
+        if success:
+            self.successful_checkins += 1
+            handle.successful_checkins += 1
+        else:
+            self.failed_scans += 1
+            handle.failed_scans += 1
+        
+        # Update last scan info
+        self.last_scan_uid = handle.last_scan_uid = uid
+        self.last_scan_time = handle.last_scan_time = datetime.utcnow()
+    
+    def _apply_burst(self, accepted, entries):
+        """
+        Burst mode: resolve every queued tap, then write all their attendance
+        rows in ONE transaction (one commit, one fsync) instead of one each.
+        A SAVEPOINT per row keeps a unique-day conflict to that row, so each
+        tap ends up with exactly the outcome and logs it would have had on
+        its own. Nothing is logged until the burst commits: if the DB is busy
+        the whole burst stays journaled for replay, and any other failure
+        falls back to applying the taps one at a time, each path logging the
+        taps itself.
+        
+        Args:
+            accepted: (handle, uid, text) per tap, in arrival order
+            entries: Matching journal entries (None without a journal)
+        """
+        started = time.perf_counter()
+        taps = [(handle, uid, entry, entry.wall if entry else datetime.now())
+                for (handle, uid, _), entry in zip(accepted, entries)]
+        # [handle, uid, entry, scanned_at, action, student_id, slot] per tap
+        outcomes = []
+        try:
+            with self._get_app().app_context():
+                planned = []
+                for handle, uid, entry, scanned_at in taps:
+                    logger.info(f"Processing RFID scan: UID={uid} on {handle.name} (burst)")
+                    with self.timings.time('lookup'):
+                        card = self.card_index.resolve(uid)
+                    if not card:
+                        outcomes.append([handle, uid, entry, scanned_at, 'unknown_card', None, None])
+                        continue
+                    with self.timings.time('class_match'):
+                        slot = self._find_current_class(card, handle.location_id, scanned_at)
+                    action = None if slot else 'no_class'
+                    outcome = [handle, uid, entry, scanned_at, action, card.student_id, slot]
+                    outcomes.append(outcome)
+                    if slot:
+                        planned.append(outcome)
                 
+                with self.timings.time('commit'):
+                    self._insert_burst(planned)
+        except OperationalError as e:
+            self.deferred_scans += len(taps)
+            self.lock_errors += 1
+            self._replay_at = time.monotonic() + REPLAY_RETRY_SECONDS
+            logger.warning(f"Database unavailable, {len(taps)} RFID scan(s) kept for replay: {e}")
+            return
         except Exception as e:
-            logger.error(f"Error scanning for cards: {e}")
+            logger.error(f"Burst check-in failed, applying taps one at a time: {e}")
+            for (handle, uid, text), entry in zip(accepted, entries):
+                self._apply_scan(handle, uid, text, entry)
+            return
+        
+        for handle, uid, entry, scanned_at, action, student_id, slot in outcomes:
+            self._log_rfid_scan(uid, "processing", scan_time=scanned_at)
+            if action == 'unknown_card':
+                logger.warning(f"Unknown RFID card: {uid}")
+                self._log_rfid_scan(uid, "unknown_card", success=False,
+                                    error="Student not found for RFID UID", scan_time=scanned_at)
+            elif action == 'no_class':
+                logger.warning(f"No current class found for student #{student_id}")
+                self._log_rfid_scan(uid, "no_class", success=False, error="No current class found",
+                                    student_id=student_id, scan_time=scanned_at)
+            elif action == 'already_checked_in':
+                logger.info(f"Student #{student_id} already checked in today")
+                self._log_rfid_scan(uid, "already_checked_in", success=True,
+                                    error="Already checked in today", student_id=student_id,
+                                    scan_time=scanned_at)
+            else:
+                logger.info(f"✅ Student #{student_id} checked in to {slot.name}")
+                self._log_rfid_scan(uid, "checkin", success=True, student_id=student_id,
+                                    scan_time=scanned_at)
+            self._finish_scan(handle, uid, entry, action not in ('unknown_card', 'no_class'))
+        # Each tap waited for the whole burst.
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for _ in taps:
+            self.timings.observe('total', elapsed_ms)
+    
+    def _insert_burst(self, planned):
+        """
+        Insert attendance rows for a burst in one transaction, setting each
+        planned outcome's action to 'checkin' or 'already_checked_in'
+        
+        Args:
+            planned: Mutable [handle, uid, entry, scanned_at, action, student_id, slot]
+                lists for taps that matched a class
+        """
+        if not planned:
+            return
+        existing = set()  # (student, class, day) inserted earlier in this burst
+        for outcome in planned:
+            scanned_at, student_id, slot = outcome[3], outcome[5], outcome[6]
+            key = (student_id, slot.id, scanned_at.date())
+            if key in existing or todays_checkins.contains(*key):
+                outcome[4] = 'already_checked_in'
+                continue
+            try:
+                with db.session.begin_nested():
+                    # Local time, same basis as _record_attendance.
+                    db.session.add(Attendance(student_id=student_id, class_id=slot.id,
+                                              check_in_time=scanned_at, check_in_method='rfid',
+                                              is_present=True))
+            except IntegrityError:
+                # Lost a race with another writer for this (student, class, day)
+                todays_checkins.add(*key)
+                outcome[4] = 'already_checked_in'
+                continue
+            existing.add(key)
+            outcome[4] = 'checkin'
+        db.session.commit()
+    
+    def _maybe_replay(self):
+        """Replay journaled taps once the retry delay after a busy DB is up"""
+        if self.journal is not None and len(self.journal) and time.monotonic() >= self._replay_at:
+            self.replay_journal()
+    
+    def replay_journal(self) -> int:
+        """
+        Apply taps the journal still holds (DB was busy, or the service died
+        mid-tap), oldest first, then compact the journal. Safe to repeat: the
+        attendance insert is guarded by the unique (student, class, day) index,
+        and a tap whose outcome was already logged is only acked.
+        
+        Returns:
+            Number of journaled taps applied
+        """
+        if self.journal is None:
+            return 0
+        applied = 0
+        pending = self.journal.pending()
+        for entry in pending:
+            try:
+                if not self._already_applied(entry):
+                    self._process_card_scan(entry.uid, location_id=entry.location_id,
+                                            scanned_at=entry.wall)
+            except OperationalError as e:
+                self.lock_errors += 1
+                self._replay_at = time.monotonic() + REPLAY_RETRY_SECONDS
+                logger.warning(f"Database still unavailable, {len(pending) - applied} "
+                               f"journaled RFID scan(s) waiting: {e}")
+                break
+            self.journal.ack(entry.seq)
+            applied += 1
+        else:
+            self.journal.compact()
+        self.replayed_scans += applied
+        if applied:
+            logger.info(f"Replayed {applied} journaled RFID scan(s)")
+        return applied
+    
+    def _already_applied(self, entry: JournalEntry) -> bool:
+        """Whether this tap's outcome is already in the RFID log (ack was lost)"""
+        with self._get_app().app_context():
+            return db.session.query(RFIDLog.id).filter(
+                RFIDLog.rfid_uid == entry.uid,
+                RFIDLog.scan_time == entry.wall,
+                RFIDLog.action_taken != 'processing',
+            ).first() is not None
     
     def _is_duplicate_scan(self, uid: str) -> bool:
-        """Check if this is a duplicate scan within the time window"""
-        if (self.last_scan_uid == uid and 
-            self.last_scan_time and 
-            (datetime.utcnow() - self.last_scan_time).total_seconds() < self.duplicate_scan_window):
-            return True
-        return False
+        """Check if this card was already processed within the time window.
+        Remembers every recent card, not just the last one, so taps that
+        alternate between cards are caught too."""
+        return self.recent_scans.check(uid)
     
-    def _process_card_scan(self, uid: str, text: str = "") -> bool:
+    def _process_card_scan(self, uid: str, text: str = "",
+                           location_id: Optional[int] = None,
+                           scanned_at: Optional[datetime] = None) -> bool:
         """
         Process an RFID card scan
         
         Args:
             uid: Card UID
             text: Card text content
+            location_id: Location of the reader it was tapped on (None: any)
+            scanned_at: When the card was tapped (default: now; set when
+                replaying a journaled tap)
             
         Returns:
             True if successful, False otherwise
+            
+        Raises:
+            OperationalError: The database is locked or unavailable -- the
+                tap was not applied and should be retried
         """
-        try:
-            # Reuse the cached app (see _get_app) instead of building one per scan.
-            app = self._get_app()
+        with self.timings.time('total'):
+            try:
+                # Reuse the cached app (see _get_app) instead of building one per scan.
+                app = self._get_app()
 
-            with app.app_context():
-                # Log the scan
-                self._log_rfid_scan(uid, "processing")
+                with app.app_context():
+                    # Log the scan
+                    self._log_rfid_scan(uid, "processing", scan_time=scanned_at)
                 
-                # Find student by RFID UID
-                student = Student.query.filter_by(rfid_uid=uid, is_active=True).first()
+                    # Find student by RFID UID (in-memory index, SQL only on a miss)
+                    with self.timings.time('lookup'):
+                        card = self.card_index.resolve(uid)
                 
-                if not student:
-                    logger.warning(f"Unknown RFID card: {uid}")
-                    self._log_rfid_scan(uid, "unknown_card", success=False, 
-                                      error="Student not found for RFID UID")
-                    return False
+                    if not card:
+                        logger.warning(f"Unknown RFID card: {uid}")
+                        self._log_rfid_scan(uid, "unknown_card", success=False, 
+                                          error="Student not found for RFID UID",
+                                          scan_time=scanned_at)
+                        return False
+                    student_id = card.student_id
                 
-                # Find current class for check-in
-                current_class = self._find_current_class(student)
+                    # Find current class for check-in
+                    with self.timings.time('class_match'):
+                        current_class = self._find_current_class(card, location_id, scanned_at)
                 
-                if not current_class:
-                    logger.warning(f"No current class found for student #{student.id}")
-                    self._log_rfid_scan(uid, "no_class", success=False, 
-                                      error="No current class found", student_id=student.id)
-                    return False
+                    if not current_class:
+                        logger.warning(f"No current class found for student #{student_id}")
+                        self._log_rfid_scan(uid, "no_class", success=False, 
+                                          error="No current class found", student_id=student_id,
+                                          scan_time=scanned_at)
+                        return False
                 
-                # Check if already checked in today
-                today = date.today()
-                existing_attendance = Attendance.query.filter(
-                    Attendance.student_id == student.id,
-                    Attendance.class_id == current_class.id,
-                    db.func.date(Attendance.check_in_time) == today
-                ).first()
+                    # Duplicate check + insert: the one commit on the tap's path
+                    with self.timings.time('commit'):
+                        checked_in = self._record_attendance(student_id, current_class.id,
+                                                             scanned_at)
                 
-                if existing_attendance:
-                    logger.info(f"Student #{student.id} already checked in today")
-                    self._log_rfid_scan(uid, "already_checked_in", success=True, 
-                                      error="Already checked in today", student_id=student.id)
-                    return True
-                
-                # Create attendance record. Local time (server runs in the studio
-                # timezone) so the date matches the `date.today()` used in the
-                # duplicate check above and the unique-day index — datetime.utcnow()
-                # would date an evening scan on the next UTC day, hiding it from
-                # today's roster. Same basis as the manual/toggle check-in paths.
-                attendance = Attendance(
-                    student_id=student.id,
-                    class_id=current_class.id,
-                    check_in_time=datetime.now(),
-                    check_in_method='rfid',
-                    is_present=True
-                )
-
-                db.session.add(attendance)
-                try:
-                    db.session.commit()
-                except IntegrityError:
-                    # A near-simultaneous scan (past the existing-check above) hit
-                    # the unique (student, class, day) index. The student is
-                    # already marked present — recover the session and treat it as
-                    # an already-checked-in success rather than wedging the reader.
-                    db.session.rollback()
-                    self._log_rfid_scan(uid, "already_checked_in", success=True,
-                                        error="Already checked in today", student_id=student.id)
-                    return True
+                    if not checked_in:
+                        logger.info(f"Student #{student_id} already checked in today")
+                        self._log_rfid_scan(uid, "already_checked_in", success=True, 
+                                          error="Already checked in today", student_id=student_id,
+                                          scan_time=scanned_at)
+                        return True
 
-                logger.info(f"✅ Student #{student.id} checked in to {current_class.name}")
-                self._log_rfid_scan(uid, "checkin", success=True, student_id=student.id)
+                    logger.info(f"✅ Student #{student_id} checked in to {current_class.name}")
+                    self._log_rfid_scan(uid, "checkin", success=True, student_id=student_id,
+                                        scan_time=scanned_at)
 
-                return True
+                    return True
                 
-        except Exception as e:
-            logger.error(f"Error processing card scan: {e}")
-            self._log_rfid_scan(uid, "error", success=False, error=str(e))
+            except OperationalError:
+                raise  # DB locked/busy: the caller keeps the tap for replay
+            except Exception as e:
+                logger.error(f"Error processing card scan: {e}")
+                self._log_rfid_scan(uid, "error", success=False, error=str(e),
+                                    scan_time=scanned_at)
+                return False
+    
+    def _record_attendance(self, student_id: int, class_id: int,
+                           when: Optional[datetime] = None) -> bool:
+        """
+        Insert today's attendance row unless the student already has one
+        
+        Args:
+            student_id: Student checking in
+            class_id: Class they are checking in to
+            when: Check-in time (default: now)
+            
+        Returns:
+            True if a new row was committed, False if already checked in that day
+        """
+        when = when or datetime.now()
+        # Check if already checked in that day (today: in-memory set, no query)
+        if todays_checkins.contains(student_id, class_id, when.date()):
+            return False
+        
+        # Create attendance record. Local time (server runs in the studio
+        # timezone) so the date matches the `date.today()` the check-in set
+        # is keyed on and the unique-day index — datetime.utcnow()
+        # would date an evening scan on the next UTC day, hiding it from
+        # today's roster. Same basis as the manual/toggle check-in paths.
+        attendance = Attendance(
+            student_id=student_id,
+            class_id=class_id,
+            check_in_time=when,
+            check_in_method='rfid',
+            is_present=True
+        )
+
+        db.session.add(attendance)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A near-simultaneous scan (past the existing-check above) hit
+            # the unique (student, class, day) index. The student is
+            # already marked present — recover the session and treat it as
+            # an already-checked-in success rather than wedging the reader.
+            db.session.rollback()
+            todays_checkins.add(student_id, class_id, when.date())
             return False
+        return True
     
-    def _find_current_class(self, student: Student) -> Optional[DanceClass]:
+    def _find_current_class(self, card: CardEntry, location_id: Optional[int] = None,
+                            at: Optional[datetime] = None) -> Optional[ClassSlot]:
         """
         Find the current class for a student based on schedule and enrollment
         
         Args:
-            student: Student object
+            card: Card index entry (student id + active enrollment class ids)
+            location_id: Only consider classes at this location (plus classes
+                with no location set); None considers every class
+            at: Time of the tap (default: now)
             
         Returns:
-            DanceClass if found, None otherwise
+            ClassSlot (id, name, check-in window) if found, None otherwise
         """
         try:
-            now = datetime.now()
-            current_time = now.time()
-            current_weekday = now.weekday()  # 0=Monday, 6=Sunday
-            
-            # Get student's enrolled classes
-            enrolled_classes = [enrollment.dance_class for enrollment in 
-                              student.class_enrollments.filter_by(is_active=True).all()]
-            
-            if not enrolled_classes:
+            if not card.class_ids:
                 return None
+            if not self.schedule_index.loaded:
+                self.schedule_index.load()
             
-            # Find class that matches current day and time
-            for dance_class in enrolled_classes:
-                if not dance_class.is_active:
-                    continue
-                
-                # Check if today is the class day
-                if dance_class.day_of_week != current_weekday:
-                    continue
-                
-                # Check if current time is within class time window (with some buffer)
-                class_start = dance_class.start_time
-                class_end = dance_class.end_time
-                
-                start_buffer = (datetime.combine(date.today(), class_start) -
-                                timedelta(minutes=30)).time()
-                end_buffer = (datetime.combine(date.today(), class_end) +
-                              timedelta(minutes=15)).time()
-                
-                if start_buffer <= current_time <= end_buffer:
-                    return dance_class
+            now = at or datetime.now()
+            current_weekday = now.weekday()  # 0=Monday, 6=Sunday
+            seconds = now.hour * 3600 + now.minute * 60 + now.second
+            
+            # Classes open for check-in right now (buffers already applied),
+            # intersected with what the student is enrolled in
+            for slot in self.schedule_index.candidates(current_weekday, seconds):
+                if slot.id in card.class_ids and _at_location(slot, location_id):
+                    return slot
             
             # If no exact match, return the first enrolled class for today
-            for dance_class in enrolled_classes:
-                if dance_class.is_active and dance_class.day_of_week == current_weekday:
-                    return dance_class
+            for slot in self.schedule_index.day(current_weekday):
+                if slot.id in card.class_ids and _at_location(slot, location_id):
+                    return slot
             
             # No class found for today
             return None
             
+        except OperationalError:
+            raise
         except Exception as e:
             logger.error(f"Error finding current class: {e}")
             return None
     
     def _log_rfid_scan(self, uid: str, action: str, success: bool = True, 
-                      error: str = None, student_id: int = None):
-        """Log RFID scan to database"""
+                      error: str = None, student_id: int = None,
+                      scan_time: Optional[datetime] = None):
+        """Queue an RFID scan log; the log writer commits them in batches so
+        only the attendance insert pays for a commit on the tap's path"""
         try:
-            app = self._get_app()
-
-            with app.app_context():
-                log_entry = RFIDLog(
-                    rfid_uid=uid,
-                    student_id=student_id,
-                    scan_time=datetime.now(),  # studio-local, like the check-in it logs
-                    action_taken=action,
-                    success=success,
-                    error_message=error
-                )
-                
-                db.session.add(log_entry)
-                db.session.commit()
-                
+            with self.timings.time('log'):
+                self.log_writer.write(uid, action, success=success, error=error,
+                                      student_id=student_id, scan_time=scan_time)
         except Exception as e:
             logger.error(f"Failed to log RFID scan: {e}")
     
     def _cleanup(self):
         """Cleanup resources"""
         self.running = False
-        if self.reader:
+        try:
+            self.log_writer.stop()
+        except Exception as e:
+            logger.error(f"Failed to flush RFID scan logs: {e}")
+        if self.journal is not None:
             try:
-                self.reader.cleanup()
+                self.journal.close()
+            except OSError as e:
+                logger.error(f"Failed to close RFID scan journal: {e}")
+            self.journal = None
+        for handle in self.readers:
+            try:
+                handle.reader.cleanup()
             except Exception:
                 pass
         
@@ -300,21 +792,55 @@ class RFIDService:
             'successful_checkins': self.successful_checkins,
             'failed_scans': self.failed_scans,
             'last_scan_time': self.last_scan_time,
-            'last_scan_uid': self.last_scan_uid
+            'last_scan_uid': self.last_scan_uid,
+            'index_size': len(self.card_index),
+            'index_hits': self.card_index.hits,
+            'index_misses': self.card_index.misses,
+            'suppressed_scans': self.recent_scans.suppressed,
+            'log_pending': self.log_writer.pending,
+            'log_batches': self.log_writer.batches_written,
+            'journal_pending': len(self.journal) if self.journal is not None else 0,
+            'deferred_scans': self.deferred_scans,
+            'lock_errors': self.lock_errors,
+            'replayed_scans': self.replayed_scans,
+            'timings': self.timings.snapshot(),
+            # Poll health across every reader; per-door detail under 'readers'
+            'poll_interval': min((h.poller.interval for h in self.readers), default=None),
+            'idle_wakeups_per_min': sum(h.poller.idle_wakeups_per_minute() for h in self.readers),
+            'detect_latency': latency_summary(
+                sample for h in self.readers for sample in h.poller.latency_samples()),
+            'readers': [h.get_stats() for h in self.readers],
         }
     
-    def simulate_scan(self, uid: str) -> bool:
+    def reset_timings(self):
+        """Clear the per-stage latency histograms"""
+        self.timings.reset()
+    
+    def simulate_scan(self, uid: str, location_id: Optional[int] = None) -> bool:
         """
         Simulate a card scan (for testing)
         
         Args:
             uid: UID to simulate
+            location_id: Simulate the tap on a reader at this location
             
         Returns:
             True if successful, False otherwise
         """
         logger.info(f"Simulating RFID scan: {uid}")
-        return self._process_card_scan(uid, "")
+        try:
+            success = self._process_card_scan(uid, "", location_id=location_id)
+        except OperationalError as e:
+            self.lock_errors += 1
+            logger.error(f"Database unavailable for simulated scan {uid}: {e}")
+            success = False
+        # Make the simulated tap's logs visible to whoever asked for it.
+        self.log_writer.flush()
+        return success
+
+def _at_location(slot: ClassSlot, location_id: Optional[int]) -> bool:
+    """A class with no location can be checked in to from any reader"""
+    return location_id is None or slot.location_id in (None, location_id)
 
 # Global service instance
 rfid_service_instance = None
@@ -22,10 +22,15 @@ app = create_app()
 
 def main():
     """Run the dev server with optional RFID service."""
-    if not app.config.get('TESTING', False):
+    if app.config.get('RFID_SOCKET'):
+        # The standalone daemon (python -m rfid.daemon) owns the readers.
+        logger.info("RFID handled by the daemon on %s", app.config['RFID_SOCKET'])
+    elif not app.config.get('TESTING', False):
         try:
-            from rfid.service import RFIDService
-            rfid_service = RFIDService()
+            # The shared instance, so the API's status/simulate endpoints and its
+            # card-index refreshes reach the service that is actually polling.
+            from rfid.service import get_rfid_service
+            rfid_service = get_rfid_service()
             rfid_thread = threading.Thread(
                 target=rfid_service.start_listening,
                 daemon=True,
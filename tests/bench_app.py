@@ -0,0 +1,264 @@
+"""Benchmarks for the web app's own queries and send paths, each against a
+throwaway SQLite DB (the RFID check-in path has rfid/bench.py).
+
+Run:  python tests/bench_app.py dates [--rows 1000000]
+      python tests/bench_app.py reminders [--families 500]
+
+Uses a throwaway SQLite DB unless DATABASE_URL is already set.
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Setup a throwaway DB before anything imports config.
+if 'DATABASE_URL' not in os.environ:
+    _tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    _tmp.close()
+    os.environ['DATABASE_URL'] = f"sqlite:///{_tmp.name}"
+os.environ.setdefault('RFID_ENABLED', 'false')
+
+from sqlalchemy import event as sa_event, func, insert  # noqa: E402
+
+from app import db  # noqa: E402
+from app.models import Student  # noqa: E402
+
+# Prefix for everything the benches seed, so their rows are easy to spot
+BENCH_PREFIX = 'APPBENCH'
+
+
+# Attendance day filters, written against {day}: date(check_in_time) before
+# the stored column, attendance_date after.
+ATTENDANCE_DATE_QUERIES = {
+    'day count (dashboard)': ('SELECT COUNT(*) FROM attendance WHERE {day} = :today', {}),
+    'day + class (roster)': ('SELECT id FROM attendance WHERE {day} = :today AND class_id = :cls', {}),
+    'week count': ('SELECT COUNT(*) FROM attendance WHERE {day} >= :week', {}),
+    'month count (analytics)': ('SELECT COUNT(*) FROM attendance'
+                                ' WHERE {day} >= :month AND {day} < :next_month', {}),
+    'date range list': ('SELECT id FROM attendance WHERE {day} >= :month AND {day} <= :today'
+                        ' ORDER BY check_in_time DESC LIMIT 50', {}),
+    'student history': ('SELECT id FROM attendance WHERE student_id = :student'
+                        ' AND {day} >= :year AND {day} <= :today', {}),
+    'duplicate check': ('SELECT id FROM attendance WHERE student_id = :student'
+                        ' AND class_id = :cls AND {day} = :today LIMIT 1', {}),
+}
+
+# Index sets compared: what existed before user indexes, the date(check_in_time)
+# expression index, and the stored column. The unique per-day index is in all.
+ATTENDANCE_DATE_LAYOUTS = {
+    'no day index': ('date(check_in_time)', [
+        'CREATE UNIQUE INDEX ix_attendance_unique_day'
+        ' ON attendance (student_id, class_id, date(check_in_time))']),
+    'expression index': ('date(check_in_time)', [
+        'CREATE UNIQUE INDEX ix_attendance_unique_day'
+        ' ON attendance (student_id, class_id, date(check_in_time))',
+        'CREATE INDEX ix_attendance_day_class ON attendance (date(check_in_time), class_id)',
+        'CREATE INDEX ix_attendance_check_in_time ON attendance (check_in_time)']),
+    'stored column': ('attendance_date', [
+        'CREATE UNIQUE INDEX ix_attendance_unique_day'
+        ' ON attendance (student_id, class_id, date(check_in_time))',
+        'CREATE INDEX ix_attendance_date_class ON attendance (attendance_date, class_id)',
+        'CREATE INDEX ix_attendance_student_date ON attendance (student_id, attendance_date)',
+        'CREATE INDEX ix_attendance_check_in_time ON attendance (check_in_time)']),
+}
+
+
+def _seed_attendance(conn, rows: int, students: int, classes: int, days: int, today: date):
+    """`rows` attendance rows spread evenly over the `days` days up to `today`,
+    each (student, class, day) at most once"""
+    conn.execute('CREATE TABLE attendance (id INTEGER PRIMARY KEY, student_id INTEGER NOT NULL,'
+                 ' class_id INTEGER NOT NULL, check_in_time DATETIME NOT NULL,'
+                 ' attendance_date DATE, is_present BOOLEAN NOT NULL DEFAULT 1)')
+    per_day = -(-rows // days)
+    start = today - timedelta(days=days - 1)
+
+    def generate():
+        for i in range(rows):
+            day, j = divmod(i, per_day)
+            when = datetime.combine(start + timedelta(days=day), dtime(15)) + timedelta(
+                seconds=j * 7 % 21600)
+            yield (j % students, (j // students + day) % classes,
+                   when.isoformat(' ', 'microseconds'), when.date().isoformat())
+    conn.executemany('INSERT INTO attendance (student_id, class_id, check_in_time, attendance_date)'
+                     ' VALUES (?, ?, ?, ?)', generate())
+    conn.commit()
+
+
+def bench_attendance_dates(rows: int = 1_000_000, repeats: int = 5, students: int = 3000,
+                           classes: int = 60, days: int = 1095) -> dict:
+    """
+    Attendance day/date-range queries on a `rows`-row table under each index
+    layout in ATTENDANCE_DATE_LAYOUTS (own throwaway SQLite file)
+
+    Args:
+        rows: Attendance rows to seed
+        repeats: Runs per query; the median is reported
+        students: Distinct students in the seeded rows
+        classes: Distinct classes in the seeded rows
+        days: Days of history the rows span, ending today
+
+    Returns:
+        {'seed_s', layout: {query: {'ms', 'plan'}}}
+    """
+    today = date.today()
+    month = today.replace(day=1)
+    params = {'today': today.isoformat(), 'cls': 7, 'student': 42,
+              'week': (today - timedelta(days=today.weekday())).isoformat(),
+              'month': month.isoformat(),
+              'next_month': (month + timedelta(days=32)).replace(day=1).isoformat(),
+              'year': (today - timedelta(days=365)).isoformat()}
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    results = {}
+    try:
+        conn = sqlite3.connect(path)
+        started = time.perf_counter()
+        _seed_attendance(conn, rows, students, classes, days, today)
+        results['seed_s'] = round(time.perf_counter() - started, 1)
+        for layout, (day_expr, indexes) in ATTENDANCE_DATE_LAYOUTS.items():
+            for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'"
+                                        " AND tbl_name = 'attendance'").fetchall():
+                conn.execute(f'DROP INDEX {name}')
+            for ddl in indexes:
+                conn.execute(ddl)
+            conn.commit()
+            results[layout] = {}
+            for label, (sql, _) in ATTENDANCE_DATE_QUERIES.items():
+                sql = sql.format(day=day_expr)
+                plan = '; '.join(r[-1] for r in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+                timings = []
+                for _ in range(repeats):
+                    t0 = time.perf_counter()
+                    conn.execute(sql, params).fetchall()
+                    timings.append((time.perf_counter() - t0) * 1000)
+                results[layout][label] = {'ms': round(statistics.median(timings), 2), 'plan': plan}
+        conn.close()
+    finally:
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            try:
+                os.unlink(path + suffix)
+            except OSError:
+                pass
+    return results
+
+
+def _print_dates(results: dict, rows: int):
+    layouts = [k for k in results if k != 'seed_s']
+    print(f"{rows} attendance rows (seeded in {results['seed_s']}s); median ms per query")
+    print(f"{'query':26}" + ''.join(f"{layout:>18}" for layout in layouts))
+    for label in ATTENDANCE_DATE_QUERIES:
+        print(f"{label:26}" + ''.join(f"{results[layout][label]['ms']:>18}" for layout in layouts))
+    print()
+    for layout in layouts:
+        print(f"{layout}:")
+        for label, r in results[layout].items():
+            print(f"  {label:26} {r['plan']}")
+
+
+
+class _FakeTwilioResponse:
+    status_code = 201
+    text = ''
+
+
+def bench_reminders(families: int = 500, repeats: int = 3) -> dict:
+    """
+    Per-send cost of the balance-reminder SMS path (_notify_student_balance
+    with SMS only), Twilio replaced by an instant 201 so only our side is
+    timed: settings reads, credential decrypts, message building.
+
+    'cold' drops the settings snapshot and the Fernet key before every send,
+    so each one reads the settings table and re-derives the key like the
+    per-call lookups did; 'warm' is the snapshot as the reminder loop sees it.
+
+    Args:
+        families: Owing students to remind per run
+        repeats: Runs per mode; the median is reported
+
+    Returns:
+        {mode: {'ms_per_send', 'queries_per_send', 'sends'}}
+    """
+    from unittest import mock
+
+    from app import create_app, crypto, sms
+    from app.api.routes import _notify_student_balance
+    from app.models import Setting
+    from app.settings_cache import settings_cache
+
+    app = create_app(startup_jobs=False)
+    with app.app_context():
+        first = (db.session.query(func.max(Student.id)).scalar() or 0) + 1
+        db.session.execute(insert(Student), [
+            {'id': first + i, 'first_name': 'Remind', 'last_name': f"{BENCH_PREFIX}{i}",
+             'parent_phone': f"555-01{i % 100:02d}-{i:04d}"} for i in range(families)])
+        db.session.commit()
+        Setting.set('sms_enabled', '1')
+        Setting.set('sms_twilio_sid', crypto.encrypt('AC' + '0' * 32))
+        Setting.set('sms_twilio_token', crypto.encrypt('bench-token'))
+        Setting.set('sms_from_number', '+15550100')
+        students = Student.query.filter(Student.id >= first).all()
+
+        queries = [0]
+
+        def count(*args):
+            queries[0] += 1
+
+        def send_all(cold: bool) -> int:
+            sent = 0
+            for s in students:
+                if cold:
+                    settings_cache.invalidate()
+                    crypto._fernet_for.cache_clear()
+                if _notify_student_balance(s, 42.5, False, True):
+                    sent += 1
+            return sent
+
+        results = {}
+        with mock.patch.object(sms.requests, 'post', return_value=_FakeTwilioResponse()):
+            for mode in ('cold', 'warm'):
+                timings, sent = [], 0
+                queries[0] = 0
+                sa_event.listen(db.engine, 'before_cursor_execute', count)
+                try:
+                    for _ in range(repeats):
+                        t0 = time.perf_counter()
+                        sent = send_all(mode == 'cold')
+                        timings.append((time.perf_counter() - t0) * 1000 / max(sent, 1))
+                finally:
+                    sa_event.remove(db.engine, 'before_cursor_execute', count)
+                results[mode] = {'ms_per_send': round(statistics.median(timings), 3),
+                                 'queries_per_send': round(queries[0] / (repeats * max(sent, 1)), 2),
+                                 'sends': sent}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest='bench', required=True)
+    dates = sub.add_parser('dates', help='attendance day filters: date() vs the stored column')
+    dates.add_argument('--rows', type=int, default=1_000_000)
+    dates.add_argument('--repeats', type=int, default=5, help='runs per query (median reported)')
+    reminders = sub.add_parser('reminders', help='per-send cost of the reminder SMS path')
+    reminders.add_argument('--families', type=int, default=500)
+    reminders.add_argument('--repeats', type=int, default=3, help='runs per mode (median reported)')
+    args = parser.parse_args(argv)
+
+    if args.bench == 'dates':
+        _print_dates(bench_attendance_dates(args.rows, args.repeats), args.rows)
+    elif args.bench == 'reminders':
+        results = bench_reminders(args.families, args.repeats)
+        print(f"{'mode':6} {'sends':>6} {'ms/send':>9} {'queries/send':>13}")
+        for mode, r in results.items():
+            print(f"{mode:6} {r['sends']:>6} {r['ms_per_send']:>9} {r['queries_per_send']:>13}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
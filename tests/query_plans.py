@@ -0,0 +1,163 @@
+"""Query-plan audit and query counter for the test harnesses.
+
+Captures every statement the app sends through an engine while a suite runs
+(not the suite's own assertion queries), then runs
+EXPLAIN QUERY PLAN on each distinct one (with the parameters it was first
+run with) and reports full-table SCANs of the tables that grow without bound.
+A query that filters one of those tables but has no index to do it with is a
+page that gets slower every week; this catches it while the tables are tiny.
+
+    audit = QueryPlanAudit(db.engine)
+    audit.start()
+    ... run the suite ...
+    audit.stop()
+    for finding in audit.check():
+        ...
+
+QueryCounter counts the statements a block runs, for asserting that a list
+endpoint costs the same number of queries at any page size:
+
+    with QueryCounter(db.engine) as counter:
+        client.get('/api/students?per_page=100')
+    counter.count
+"""
+import os
+import re
+import sys
+
+from sqlalchemy import event
+
+_TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+_ROOT = os.path.dirname(_TESTS_DIR)
+
+# Tables that grow with every tap, payment or enrollment. Small lookup tables
+# (classes, settings, users, locations...) are cheaper to scan than to index.
+LARGE_TABLES = {
+    'transactions', 'attendance', 'rfid_logs', 'class_enrollments',
+    'parent_students', 'waiver_signatures', 'audit_logs', 'student_balances',
+    'aging_snapshots',
+}
+
+# Statements allowed to scan a large table anyway, as (table, regex on the
+# whitespace-normalized SQL), each with its reason. What must never scan is a
+# lookup for one student/class/parent/day. Statements with no WHERE at all
+# (exports, whole-table totals) are skipped: they want every row.
+ALLOWED_SCANS = [
+    # Substring search ("%...%") can't use a b-tree index.
+    ('rfid_logs', r'rfid_logs\.rfid_uid LIKE \?'),
+    ('transactions', r'transactions\.description LIKE \?'),
+    # Every active enrollment: most rows match, an index would only add reads.
+    ('class_enrollments', r'WHERE class_enrollments\.is_active IS 1\)?( AS anon_1)?$'),
+    # The RFID service's once-a-day schedule/roster load.
+    ('class_enrollments', r'WHERE classes\.day_of_week = \? AND classes\.is_active IS 1 AND '
+                          r'class_enrollments\.is_active IS 1'),
+    # Students seen in the last 30 days: a DISTINCT over a large share of the
+    # table, answered by walking the unique-day index.
+    ('attendance', r'SELECT DISTINCT attendance\.student_id .* WHERE attendance\.check_in_time >= \?$'),
+    # Migration de-dupe, run once before the unique-day index exists.
+    ('attendance', r'^DELETE FROM attendance WHERE id NOT IN \( SELECT MIN\(id\) FROM attendance'),
+    # attendance_date backfill, run when its triggers are first installed.
+    ('attendance', r'^UPDATE attendance SET attendance_date = date\(check_in_time\) WHERE attendance_date IS NOT'),
+    # Rollup rebuild / balance verify sweeps, whole-table by design.
+    ('rfid_logs', r'^DELETE FROM rfid_log_daily(_cards)? WHERE day IN \(SELECT DISTINCT date\(scan_time\)'),
+    ('transactions', r'FROM transactions t GROUP BY student_id$'),
+    # Deleting a user: the ORM nulls out their created_by / audit rows.
+    ('transactions', r'WHERE \? = transactions\.created_by$'),
+    ('audit_logs', r'WHERE \? = audit_logs\.user_id$'),
+]
+
+# SQLite < 3.36 says "SCAN TABLE x", newer versions "SCAN x".
+_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(.*)$')
+_LIMIT = re.compile(r'\bLIMIT\b', re.I)
+
+
+def _from_test_code() -> bool:
+    """True if the nearest project frame issuing the query is a test script
+    (an assertion reading back state), not app code"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        path = frame.f_code.co_filename
+        if (path.startswith(_ROOT) and path != __file__
+                and os.sep + 'site-packages' + os.sep not in path):
+            return path.startswith(_TESTS_DIR)
+        frame = frame.f_back
+    return False
+
+
+class QueryPlanAudit:
+    """Collects statements run on `engine` and checks their query plans"""
+
+    def __init__(self, engine, tables=None, allowed=None):
+        self.engine = engine
+        self.tables = set(LARGE_TABLES if tables is None else tables)
+        self.allowed = [(t, re.compile(p, re.S)) for t, p in
+                        (ALLOWED_SCANS if allowed is None else allowed)]
+        self.statements = {}  # sql -> first parameters seen
+
+    def _capture(self, conn, cursor, statement, parameters, context, executemany):
+        if executemany:
+            return  # bulk INSERTs; no plan worth checking
+        if not statement.lstrip()[:6].upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+            return
+        if statement not in self.statements and not _from_test_code():
+            self.statements[statement] = parameters
+
+    def start(self):
+        event.listen(self.engine, 'before_cursor_execute', self._capture)
+
+    def stop(self):
+        event.remove(self.engine, 'before_cursor_execute', self._capture)
+
+    def _allowed(self, table: str, statement: str) -> bool:
+        sql = ' '.join(statement.split())
+        if ' WHERE ' not in sql:
+            return True
+        return any(t == table and p.search(sql) for t, p in self.allowed)
+
+    def check(self) -> list[dict]:
+        """Every captured statement whose plan SCANs a large table:
+        [{'table', 'detail', 'sql'}]. Statements that no longer compile
+        (e.g. against a table a later test dropped) are skipped."""
+        findings = []
+        raw = self.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            for statement, parameters in self.statements.items():
+                try:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters or ())
+                    plan = cursor.fetchall()
+                except Exception:
+                    continue
+                for row in plan:
+                    match = _SCAN.match(row[-1])
+                    if not match or match.group(1) not in self.tables:
+                        continue
+                    # Walking an index in order and stopping at a LIMIT (the
+                    # newest-first list pages) reads only the rows it returns.
+                    if 'USING' in match.group(2) and _LIMIT.search(statement):
+                        continue
+                    if self._allowed(match.group(1), statement):
+                        continue
+                    findings.append({'table': match.group(1), 'detail': row[-1],
+                                     'sql': ' '.join(statement.split())})
+        finally:
+            raw.close()
+        return findings
+
+
+class QueryCounter:
+    """Counts the statements run on `engine` inside a `with` block"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
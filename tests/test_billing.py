@@ -4,6 +4,12 @@
      caps each child at their balance, and credits overpayment.
   2. apply-late-fees is idempotent within a calendar month (no double-charge on
      a re-POST / double-click).
+  3. The materialized student_balances table tracks every transaction write,
+     and its triggers are upgraded in place on older databases.
+  4. The single-query SQL aging matches build_aging on random ledgers.
+  5. The revenue_monthly rollup tracks every transaction write, and the
+     revenue report built from it matches summing the ledger directly.
+  6. None of the queries above full-scans a large table.
 
 Run:  RFID_ENABLED=false python3 tests/test_billing.py
 Exit 0 = all green, 1 = failures.
@@ -260,7 +266,261 @@ def test_money_precision():
                round(b["balance"], 2) == exact, f"{b['balance']} != {exact}")
 
 
+def test_materialized_balances():
+    """student_balances follows every kind of transaction write in the same DB
+    transaction (ORM insert/update/delete, raw SQL, rollback), and verify /
+    rebuild catch and repair drift."""
+    from app.balances import rebuild, verify
+    from app.models import StudentBalance
+    with app.app_context():
+        x = Student(first_name="Mat", last_name="X")
+        y = Student(first_name="Mat", last_name="Y")
+        db.session.add_all([x, y])
+        db.session.flush()
+        charge = Transaction(student_id=x.id, type="charge", amount="120.10", category="tuition",
+                             payment_method="n/a", description="c")
+        pay = Transaction(student_id=x.id, type="payment", amount="20.05", category="tuition",
+                          payment_method="cash", description="p")
+        db.session.add_all([charge, pay])
+        db.session.commit()
+        inserted = calc_balance(x.id)
+        db.session.add(Transaction(student_id=x.id, type="charge", amount=999, category="other",
+                                   payment_method="n/a", description="rolled back"))
+        db.session.flush()
+        db.session.rollback()
+        after_rollback = calc_balance(x.id)
+        charge.amount = "100.00"
+        pay.student_id = y.id  # payment re-assigned to the sibling
+        db.session.commit()
+        moved = (calc_balance(x.id), calc_balance(y.id))
+        db.session.execute(db.text(
+            "INSERT INTO transactions (student_id, type, amount, category, transaction_date, "
+            "created_at) VALUES (:s, 'charge', 5.5, 'other', :d, '2030-01-01 00:00:00')"),
+            {"s": y.id, "d": date.today()})
+        db.session.delete(charge)
+        db.session.commit()
+        final = (calc_balance(x.id), calc_balance(y.id))
+        last_y = StudentBalance.query.get(y.id).last_txn_at
+        clean = verify()
+        db.session.execute(db.text("UPDATE student_balances SET balance = balance + 1 "
+                                   "WHERE student_id = :s"), {"s": y.id})
+        db.session.commit()
+        drifted = [d["student_id"] for d in verify()]
+        rebuild(db.session)
+        db.session.commit()
+        repaired = verify()
+        y_id = y.id
+    record("materialized balance follows ORM inserts",
+           inserted == {"total_charges": 120.10, "total_payments": 20.05, "balance": 100.05},
+           str(inserted))
+    record("materialized balance ignores a rolled-back insert", after_rollback == inserted,
+           str(after_rollback))
+    record("materialized balance follows amount edits and student moves",
+           moved[0]["balance"] == 100.0 and moved[1]["balance"] == -20.05, str(moved))
+    record("materialized balance follows raw SQL inserts and deletes",
+           final[0]["balance"] == 0.0 and final[1]["balance"] == -14.55
+           and str(last_y).startswith("2030-01-01"), f"{final} last={last_y}")
+    record("verify finds no drift, reports injected drift, rebuild repairs it",
+           clean == [] and drifted == [y_id] and repaired == [],
+           f"clean={clean} drifted={drifted} repaired={repaired}")
+
+
+def test_balance_triggers_upgrade():
+    """On a database from before created_at was NOT NULL, a raw insert that
+    leaves it NULL keeps last_txn_at, and install_triggers replaces a trigger
+    whose definition has changed (asking for a rebuild)."""
+    import sqlalchemy
+    from app.balances import TRIGGERS, install_triggers
+    engine = sqlalchemy.create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text(
+            "CREATE TABLE transactions (id INTEGER PRIMARY KEY, student_id INTEGER,"
+            " type TEXT, amount NUMERIC, created_at DATETIME)"))
+        conn.execute(sqlalchemy.text(
+            "CREATE TABLE student_balances (student_id INTEGER PRIMARY KEY,"
+            " total_charges NUMERIC, total_payments NUMERIC, balance NUMERIC,"
+            " last_txn_at DATETIME)"))
+        conn.execute(sqlalchemy.text(
+            "CREATE TRIGGER trg_student_balances_insert AFTER INSERT ON transactions"
+            " BEGIN SELECT 1; END"))
+        replaced = install_triggers(conn)
+        again = install_triggers(conn)
+        conn.execute(sqlalchemy.text(
+            "INSERT INTO transactions (student_id, type, amount, created_at)"
+            " VALUES (1, 'charge', 10, '2030-01-01 00:00:00')"))
+        conn.execute(sqlalchemy.text(
+            "INSERT INTO transactions (student_id, type, amount) VALUES (1, 'charge', 5)"))
+        row = conn.execute(sqlalchemy.text(
+            "SELECT balance, last_txn_at FROM student_balances WHERE student_id = 1")).one()
+        stored = conn.execute(sqlalchemy.text(
+            "SELECT sql FROM sqlite_master WHERE name = 'trg_student_balances_insert'")).scalar()
+    record("install_triggers replaces a changed trigger once and asks for a rebuild",
+           replaced and not again
+           and stored == f"CREATE TRIGGER trg_student_balances_insert {TRIGGERS['trg_student_balances_insert']}",
+           f"replaced={replaced} again={again}")
+    record("a raw insert with NULL created_at keeps last_txn_at",
+           float(row[0]) == 15.0 and str(row[1]).startswith("2030-01-01"), str(tuple(row)))
+
+
+def test_sql_aging_matches_build_aging():
+    """Property test: on random ledgers (cent amounts, same-day entries, ties,
+    future-dated charges, over- and under-payment) the single-query SQL aging
+    gives exactly build_aging's buckets for every student, and leaves out
+    exactly the students build_aging says owe nothing."""
+    import random
+    from datetime import datetime as _dt
+    from app.helpers import aging_by_student
+    rng = random.Random(20260718)
+    as_of = date.today()
+    mismatches = []
+    checked = 0
+    for _round in range(5):
+        with app.app_context():
+            ledgers = {}
+            for i in range(30):
+                s = Student(first_name="Age", last_name=f"Prop{_round}-{i}",
+                            is_active=rng.random() > 0.2)
+                db.session.add(s)
+                db.session.flush()
+                txns = []
+                for _ in range(rng.randint(0, 25)):
+                    kind = "charge" if rng.random() < 0.6 else "payment"
+                    amount = rng.choice([rng.randint(1, 30000) / 100, 10.0, 0.01, 33.33])
+                    day = as_of - timedelta(days=rng.choice([rng.randint(-5, 200), 30, 31, 60, 61, 90, 91]))
+                    created = _dt(2026, 1, 1) + timedelta(minutes=rng.choice([0, rng.randint(0, 10 ** 6)]))
+                    txns.append(Transaction(student_id=s.id, type=kind, amount=f"{amount:.2f}",
+                                            category="tuition", payment_method="n/a",
+                                            description="prop", transaction_date=day,
+                                            created_at=created))
+                db.session.add_all(txns)
+                ledgers[s.id] = txns
+            db.session.commit()
+            sql = aging_by_student(as_of)
+            for sid, txns in ledgers.items():
+                expected = build_aging(txns, as_of)
+                got = sql.get(sid)
+                checked += 1
+                if expected["total"] <= 0:
+                    if got is not None:
+                        mismatches.append((sid, expected, got))
+                elif got != expected:
+                    mismatches.append((sid, expected, got))
+    record(f"SQL aging == build_aging on {checked} random ledgers",
+           not mismatches, f"{len(mismatches)} mismatch(es), first: {mismatches[:1]}")
+
+
+def test_revenue_rollup():
+    """revenue_monthly follows random inserts, edits (amount, type, category,
+    date) and deletes, a raw SQL insert and a rollback; the report built from
+    it matches per-month sums of the ledger over a multi-year window, in two
+    queries that never touch transactions."""
+    import random
+    from sqlalchemy import event
+    from app.revenue import rebuild, verify
+    rng = random.Random(20261017)
+    today = date.today()
+    with app.app_context():
+        s = Student(first_name="Rev", last_name="Roll")
+        db.session.add(s)
+        db.session.flush()
+        txns = []
+        for _ in range(300):
+            txns.append(Transaction(
+                student_id=s.id, type=rng.choice(["charge", "payment"]),
+                amount=f"{rng.randint(1, 50000) / 100:.2f}",
+                category=rng.choice(["tuition", "costumes", "shoes", "other"]),
+                payment_method="n/a", description="rev",
+                transaction_date=today - timedelta(days=rng.randint(-20, 1100))))
+        db.session.add_all(txns)
+        db.session.commit()
+        for t in rng.sample(txns, 60):
+            field = rng.choice(["amount", "type", "category", "transaction_date"])
+            if field == "amount":
+                t.amount = f"{rng.randint(1, 50000) / 100:.2f}"
+            elif field == "type":
+                t.type = "payment" if t.type == "charge" else "charge"
+            elif field == "category":
+                t.category = rng.choice(["tuition", "recital"])
+            else:
+                t.transaction_date = today - timedelta(days=rng.randint(0, 1100))
+        for t in rng.sample(txns, 40):
+            db.session.delete(t)
+        db.session.commit()
+        db.session.execute(db.text(
+            "INSERT INTO transactions (student_id, type, amount, category, transaction_date, "
+            "created_at) VALUES (:s, 'payment', 12.34, 'other', :d, :d)"), {"s": s.id, "d": today})
+        db.session.add(Transaction(student_id=s.id, type="payment", amount=999, category="other",
+                                   payment_method="n/a", description="rolled back"))
+        db.session.flush()
+        db.session.rollback()
+        drift = verify()
+
+        def ledger_sum(type_, start=None, end=None):
+            q = db.session.query(db.func.coalesce(db.func.sum(Transaction.amount), 0)).filter(
+                Transaction.type == type_)
+            if start is not None:
+                q = q.filter(Transaction.transaction_date >= start)
+            if end is not None:
+                q = q.filter(Transaction.transaction_date < end)
+            return round(float(q.scalar()), 2)
+
+        from app.api.routes import _month_buckets
+        expected = [{"charged": ledger_sum("charge", ms, me), "collected": ledger_sum("payment", ms, me)}
+                    for _, ms, me in _month_buckets(36)]
+        expected_all = ledger_sum("payment")
+        expected_year = ledger_sum("payment", today.replace(month=1, day=1))
+
+    statements = []
+    with app.test_client() as c:
+        c.post("/auth/login", data={"username": "admin2", "password": "pw"}, follow_redirects=True)
+        with app.app_context():
+            engine = db.engine
+        capture = lambda conn, cur, sql, *a: statements.append(sql)  # noqa: E731
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            rep = c.get("/api/reports/revenue?months=36").get_json() or {}
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+    got = [{"charged": m["charged"], "collected": m["collected"]} for m in rep.get("monthly", [])]
+    report_reads = [q for q in statements if "revenue_monthly" in q or "student_balances" in q]
+    ledger_reads = [q for q in statements if "FROM transactions" in q]
+
+    with app.app_context():
+        db.session.execute(db.text("UPDATE revenue_monthly SET amount = amount + 1"))
+        db.session.commit()
+        drifted = len(verify())
+        rebuild(db.session)
+        db.session.commit()
+        repaired = verify()
+    record("revenue_monthly follows inserts, edits, deletes, raw SQL and rollback",
+           drift == [], f"{len(drift)} drifted, first: {drift[:1]}")
+    record("36-month revenue report matches per-month ledger sums",
+           len(got) == 36 and got == expected
+           and rep["totals"]["collected_all_time"] == expected_all
+           and rep["totals"]["collected_this_year"] == expected_year
+           and round(sum(y["collected"] for y in rep.get("yearly", [])), 2) == expected_all,
+           f"months={len(got)} first diff={next(((a, b) for a, b in zip(got, expected) if a != b), None)}"
+           f" totals={rep.get('totals')} all={expected_all} year={expected_year}")
+    record("revenue report: two reads, none of the ledger",
+           len(report_reads) == 2 and not ledger_reads,
+           f"rollup/balance reads={len(report_reads)} ledger reads={ledger_reads[:1]}")
+    record("revenue verify reports injected drift, rebuild repairs it",
+           drifted > 0 and repaired == [], f"drifted={drifted} repaired={repaired}")
+
+
+def test_query_plans(audit):
+    """No billing query full-scans a large table (see tests/query_plans.py)."""
+    audit.stop()
+    findings = audit.check()
+    record(f"query plans: no full scans of large tables ({len(audit.statements)} statements)",
+           not findings, "; ".join(f"{f['detail']} <- {f['sql'][:160]}" for f in findings[:8]))
+
+
 def main():
+    from query_plans import QueryPlanAudit
+    with app.app_context():
+        audit = QueryPlanAudit(db.engine)
+    audit.start()
     ids = seed()
     test_allocation(ids)
     test_late_fee_idempotent(ids)
@@ -269,6 +529,11 @@ def main():
     test_recurring_day_gating()
     test_recurring_short_month_clamp()
     test_money_precision()
+    test_materialized_balances()
+    test_balance_triggers_upgrade()
+    test_sql_aging_matches_build_aging()
+    test_revenue_rollup()
+    test_query_plans(audit)
     fails = [r for r in results if not r[1]]
     print("\n" + "=" * 56)
     print(f"SUMMARY: {len(results) - len(fails)}/{len(results)} passed, {len(fails)} failed.")